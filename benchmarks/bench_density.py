@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark scatter rendering against density-binned rendering as rows grow.
+
+Raw scatters get slower and larger with every point; the density path bins
+into a fixed grid (utils/density.py) and should stay flat. Also times the
+DuckDB binning used for per-case court delays.
+
+    python benchmarks/bench_density.py --sizes 1000 100000 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from utils.density import bin_relation, density_spec
+from utils.encoder import encode_figure
+from utils.render import drawn, plot_options
+
+
+def points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.integers(2000, 2024, n).astype(float)
+    y = 30 * (x - 2000) + rng.gamma(2.0, 120.0, n)
+    return x, y
+
+
+def render(spec):
+    """Draw and encode spec as given, without the automatic switch to density mode"""
+    options = plot_options(spec)
+    with drawn(options) as fig:
+        return encode_figure(fig, max_chars=options["max_chars"], formats=options["formats"], dpi=options["dpi"])
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--raw-limit", type=int, default=200000, help="skip raw scatters above this many points")
+    args = parser.parse_args()
+
+    conn = duckdb.connect()
+    print(f"{'points':>10} {'mode':>8} {'ms':>9} {'bytes':>8}  format")
+    for n in args.sizes:
+        x, y = points(n)
+        base = {"kind": "court_delay", "x": x, "y": y}
+        modes = [("raw", lambda: base)] if n <= args.raw_limit else []
+        modes.append(("density", lambda: density_spec(base)))
+        for mode, make_spec in modes:
+            seconds, (uri, report) = timed(lambda: render(make_spec()))
+            print(f"{n:>10} {mode:>8} {seconds * 1000:9.1f} {report['bytes']:>8}  {report['format']} @ {report['dpi']} dpi")
+
+        conn.register("cases", pd.DataFrame({"year": x, "delay": y}))
+        seconds, _ = timed(bin_relation, conn, "cases", "year", "delay", (160, 100), 1)
+        print(f"{n:>10} {'duckdb':>8} {seconds * 1000:9.1f} {'':>8}  bin_relation")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark cold start: import time of the server modules and time to first response.
+
+Each measurement runs in a fresh interpreter, the way a spun-down service
+starts. Time to first response starts uvicorn, waits for /health, then
+posts a question, either straight away (cold, WARMUP=0) or once the
+background warm-up reports done (warm, WARMUP=1).
+
+    python benchmarks/bench_startup.py --repeat 3 --top 8
+"""
+
+import argparse
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+QUESTION = "Analyse the sample data and plot it."
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_seconds(module):
+    """Seconds to import module in a fresh interpreter"""
+    code = f"import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def heaviest_imports(module, top):
+    """(cumulative ms, package) of the costliest packages imported directly under module"""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         cwd=ROOT, capture_output=True, text=True, check=True)
+    lines = [(int(m.group(2)), len(m.group(3)), m.group(4)) for m in IMPORT_LINE.finditer(out.stderr)]
+    end = max(i for i, (_, _, name) in enumerate(lines) if name == module)
+    depth = lines[end][1]
+    packages = {}
+    # Children are listed before their parent, one level (two spaces) deeper
+    for cumulative, level, name in reversed(lines[:end]):
+        if level <= depth:
+            break
+        if level == depth + 2:
+            root = name.split(".")[0]
+            packages[root] = packages.get(root, 0) + cumulative
+    return sorted(((us / 1000, name) for name, us in packages.items()), reverse=True)[:top]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def first_response(warm, question, timeout=180):
+    """(seconds to /health, seconds to first answer, first request latency) from process start"""
+    port = free_port()
+    env = {**os.environ, "WARMUP": "1" if warm else "0"}
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        with httpx.Client(timeout=timeout) as client:
+            while True:
+                try:
+                    health = client.get(f"{url}/health").json()
+                    break
+                except httpx.TransportError:
+                    if time.perf_counter() - started > timeout:
+                        raise TimeoutError("server did not start")
+                    time.sleep(0.02)
+            healthy = time.perf_counter() - started
+            while warm and not health["warmup"]["done"]:
+                time.sleep(0.1)
+                health = client.get(f"{url}/health").json()
+            sent = time.perf_counter()
+            response = client.post(f"{url}/api/", files={"file": ("question.txt", question.encode("utf-8"))})
+            response.raise_for_status()
+            answered = time.perf_counter()
+    finally:
+        server.terminate()
+        server.wait()
+    return healthy, answered - started, answered - sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8, help="heaviest packages to list per module")
+    parser.add_argument("--question", help="file with the question to post (default: a generic one)")
+    parser.add_argument("--skip-server", action="store_true", help="only measure imports")
+    args = parser.parse_args()
+
+    for module in ("main", "app"):
+        seconds = min(import_seconds(module) for _ in range(args.repeat))
+        print(f"import {module:>4}: {seconds * 1000:8.1f} ms")
+        for ms, name in heaviest_imports(module, args.top):
+            print(f"    {name:<20} {ms:8.1f} ms")
+
+    if args.skip_server:
+        return
+    question = QUESTION
+    if args.question:
+        with open(args.question, encoding="utf-8") as f:
+            question = f.read()
+    for warm in (False, True):
+        runs = [first_response(warm, question) for _ in range(args.repeat)]
+        healthy, total, latency = (min(values) for values in zip(*runs))
+        print(f"{'warm' if warm else 'cold':>5}: /health after {healthy:6.2f} s, "
+              f"first answer after {total:6.2f} s (request took {latency:6.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Offline per-stage benchmark suite, compared against a recorded JSON baseline.
+
+Runs without a server or network: the films page comes from
+fixtures/highest_grossing_films.html and the court data from a synthetic
+hive-partitioned tree (benchmarks/make_court_data.py), generated once per
+scale under --data-dir and reused. Each stage is timed on its own:
+
+    parse               extract the films table from the saved page
+    clean               DataAnalystAgent.clean_movies_data on that table
+    analyze             compile the film questions and answer them in DuckDB
+    court_list          glob the partition files
+    court_refresh_cold  aggregate every partition into an empty store
+    court_refresh_warm  refresh a store that is already up to date
+    court_questions     summary table, top court, delay by year and regression
+    court_density       per-case delays of one court, binned in DuckDB
+    plot_render         draw and rasterize the films scatterplot
+    plot_encode         encode that raster as a size-capped data URI
+
+Every run is compared with the baseline on each stage's fastest run, the
+least noisy figure on a shared machine: a stage regresses when it is more
+than --threshold slower and at least --min-delta-ms slower, and the run then
+exits 1. Court stages are only compared at the scale the
+baseline was recorded at.
+
+Timings only mean something on the machine the baseline was recorded on:
+when its operating system, architecture, CPU count or Python minor version
+differ from this host's (kernel and patch releases do not count), the run
+warns, marks each stage's status "(other machine)", names the stages that
+would have regressed and does not fail; --force gates it anyway. A baseline
+that does not record one of these is warned about rather than trusted. To
+re-record the baseline on this machine, run the suite at the default scale
+with --save on an otherwise idle host and commit
+benchmarks/baselines/bench_suite.json (per-stage thresholds are kept):
+
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --court-rows 10000000 --only court_refresh_cold court_questions
+    python benchmarks/bench_suite.py --save
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# The synthetic tree is already local; mirroring it would only time a copy
+os.environ.setdefault("COURT_MIRROR", "0")
+
+import duckdb
+import numpy as np
+
+from app import DataAnalystAgent
+from benchmarks.make_court_data import QUESTION_COURT, ensure_tree
+from utils.court import COURT_DATA_FILE, QUESTION_SCOPES, delay_by_year, delay_density, delay_regression, remote_relation, top_court
+from utils.court_store import CourtSummaryStore
+from utils.encoder import encode_image, rasterize
+from utils.planner import PLOT, PlanCache, needed_columns, run_plan, split_questions
+from utils.render import drawn, plot_options
+from utils.stats import register_frame
+from utils.table_extract import extract_table
+
+FIXTURE = os.path.join(ROOT, "fixtures", "highest_grossing_films.html")
+BASELINE = os.path.join(ROOT, "benchmarks", "baselines", "bench_suite.json")
+# Baselines recorded where any of these differ are not comparable; kernel and
+# patch releases are left out so routine updates do not switch the gate off
+MACHINE_KEYS = ("system", "arch", "cpus", "python")
+# The films prompt, shared with the load test and the unit tests
+with open(os.path.join(ROOT, "fixtures", "movie_task.txt"), encoding="utf-8") as _f:
+    MOVIE_TASK = _f.read()
+
+
+def measure(fn, repeat, warmup=1):
+    """Seconds per call of fn over repeat runs, after warmup untimed ones"""
+    for _ in range(warmup):
+        fn()
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - started)
+    return runs
+
+
+def summarize(runs):
+    ms = [seconds * 1000 for seconds in runs]
+    return {
+        "median_ms": round(statistics.median(ms), 3),
+        "min_ms": round(min(ms), 3),
+        "max_ms": round(max(ms), 3),
+        "runs": len(ms),
+    }
+
+
+def movie_stages(agent):
+    """{name: callable} for the film stages, sharing the parsed and cleaned table"""
+    with open(FIXTURE, encoding="utf-8") as f:
+        html = f.read()
+    table = extract_table(html, required_headers=("Rank", "Peak"))
+    # clean_movies_data parses into a new frame, so the raw table is reused as is
+    films = agent.clean_movies_data(table)
+    questions = split_questions(MOVIE_TASK)
+    plans = PlanCache().compile(questions)
+    conn = duckdb.connect()
+
+    def analyze():
+        compiled = PlanCache().compile(questions)
+        register_frame(conn, "movies", films[needed_columns(compiled)])
+        try:
+            return [run_plan(conn, plan, "movies") for _, plan in compiled if plan and plan.op != PLOT]
+        finally:
+            conn.unregister("movies")
+
+    plot = next(plan for _, plan in plans if plan and plan.op == PLOT)
+    spec = {
+        "kind": "scatter_fit",
+        "x": films[plot.params["x"]].to_numpy(dtype=float),
+        "y": films[plot.params["y"]].to_numpy(dtype=float),
+        "figsize": (8, 6),
+    }
+    options = plot_options(spec)
+
+    def render():
+        with drawn(options) as fig:
+            return rasterize(fig, options["dpi"])
+
+    raster = render()
+    return {
+        "parse": lambda: extract_table(html, required_headers=("Rank", "Peak")),
+        "clean": lambda: agent.clean_movies_data(table),
+        "analyze": analyze,
+        "plot_render": render,
+        "plot_encode": lambda: encode_image(raster, max_chars=options["max_chars"], formats=options["formats"],
+                                            dpi=options["dpi"]),
+    }
+
+
+def court_stages(root, data_dir):
+    """{name: callable} for the court stages over the synthetic tree"""
+    conn = duckdb.connect()
+    store_path = os.path.join(data_dir, "court-store.parquet")
+    source = f"{root}/year=*/court=*/bench=*/{COURT_DATA_FILE}"
+
+    def cold():
+        if os.path.exists(store_path):
+            os.remove(store_path)
+        return CourtSummaryStore(path=store_path, source_root=root).refresh(conn, scopes=None)
+
+    cold()
+    warm_store = CourtSummaryStore(path=store_path, source_root=root)
+
+    def questions():
+        warm_store.load_summary(conn, QUESTION_SCOPES)
+        return (
+            top_court(conn, 2019, 2022),
+            delay_by_year(conn, QUESTION_COURT),
+            delay_regression(conn, QUESTION_COURT),
+        )
+
+    def density():
+        scopes = ({"courts": (QUESTION_COURT,)},)
+        return delay_density(conn, QUESTION_COURT, relation=remote_relation(scopes, source=source))
+
+    return {
+        "court_list": lambda: CourtSummaryStore(path=store_path, source_root=root).list_partitions(conn),
+        "court_refresh_cold": cold,
+        "court_refresh_warm": lambda: warm_store.refresh(conn, scopes=None),
+        "court_questions": questions,
+        "court_density": density,
+    }
+
+
+def machine_info():
+    """This host as a run records it; only MACHINE_KEYS decide whether timings compare"""
+    return {
+        "system": platform.system(),
+        "arch": platform.machine(),
+        "cpus": os.cpu_count(),
+        "python": ".".join(platform.python_version_tuple()[:2]),
+        "platform": platform.platform(),
+        "duckdb": duckdb.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def machine_differences(results, baseline):
+    """{key: (recorded, current)} where the baseline's machine is not this one
+
+    Keys the baseline does not record are left out; see unrecorded_keys.
+    """
+    recorded, current = baseline.get("machine", {}), results["machine"]
+    return {key: (recorded[key], current.get(key))
+            for key in MACHINE_KEYS if key in recorded and recorded[key] != current.get(key)}
+
+
+def unrecorded_keys(baseline):
+    """MACHINE_KEYS an older baseline does not record, so cannot be checked"""
+    return [key for key in MACHINE_KEYS if key not in baseline.get("machine", {})]
+
+
+def compare(results, baseline, threshold, min_delta_ms, force=False):
+    """{name: (status, change)} for every stage the baseline has at the same scale
+
+    A baseline from another machine is compared but never gates unless
+    forced: its regressions are reported as "REGRESSED (other machine)".
+    """
+    verdicts = {}
+    other_machine = bool(baseline) and bool(machine_differences(results, baseline)) and not force
+    same_scale = baseline.get("config", {}).get("court_rows") == results["config"]["court_rows"]
+    for name, current in results["benchmarks"].items():
+        recorded = baseline.get("benchmarks", {}).get(name)
+        if recorded is None or (name.startswith("court_") and not same_scale):
+            verdicts[name] = ("new" if recorded is None else "other scale", None)
+            continue
+        limit = recorded.get("threshold", threshold)
+        before, after = recorded["min_ms"], current["min_ms"]
+        change = (after - before) / before if before else 0.0
+        if change > limit and after - before >= min_delta_ms:
+            status = "REGRESSED"
+        elif change < -limit and before - after >= min_delta_ms:
+            status = "improved"
+        else:
+            status = "ok"
+        verdicts[name] = (f"{status} (other machine)" if other_machine else status, change)
+    return verdicts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--court-rows", type=int, default=1_000_000, help="rows in the synthetic court tree")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "data-analyst-agent", "bench"))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="+", help="stages to run (default: all)")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative slowdown that counts as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="ignore changes smaller than this")
+    parser.add_argument("--output", help="also write this run's results to this JSON file")
+    parser.add_argument("--save", action="store_true", help="record this run as the baseline")
+    parser.add_argument("--force", action="store_true",
+                        help="fail on regressions even against a baseline from another machine")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    stages = movie_stages(DataAnalystAgent())
+    if not args.only or any(name.startswith("court_") for name in args.only):
+        stages.update(court_stages(ensure_tree(args.data_dir, args.court_rows), args.data_dir))
+    if args.only:
+        stages = {name: fn for name, fn in stages.items() if name in args.only}
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "machine": machine_info(),
+        "config": {"court_rows": args.court_rows, "repeat": args.repeat},
+        "benchmarks": {name: summarize(measure(fn, args.repeat)) for name, fn in stages.items()},
+    }
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    verdicts = compare(results, baseline, args.threshold, args.min_delta_ms, force=args.force)
+    differences = machine_differences(results, baseline) if baseline else {}
+    unchecked = unrecorded_keys(baseline) if baseline else []
+    if unchecked:
+        print(f"Warning: the baseline does not record this machine's {', '.join(unchecked)}, "
+              "so they are not checked. Re-record it here with --save")
+    if differences:
+        print("Warning: the baseline was recorded on another machine ("
+              + ", ".join(f"{key} {recorded} vs {current}" for key, (recorded, current) in differences.items())
+              + ("); gating anyway (--force)" if args.force else
+                 "); not gating. Re-record it here with --save, or pass --force"))
+
+    print(f"{'stage':<20} {'min ms':>10} {'median ms':>10} {'baseline':>10} {'change':>8}  status")
+    for name, current in results["benchmarks"].items():
+        status, change = verdicts[name]
+        recorded = baseline.get("benchmarks", {}).get(name, {}).get("min_ms")
+        print(f"{name:<20} {current['min_ms']:>10.2f} {current['median_ms']:>10.2f} "
+              f"{recorded if recorded is not None else '-':>10} "
+              f"{f'{change:+.0%}' if change is not None else '-':>8}  {status}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({**results, "verdicts": verdicts}, f, indent=2)
+    if args.save:
+        # Keep thresholds tuned per stage in the recorded baseline
+        for name, current in results["benchmarks"].items():
+            current["threshold"] = baseline.get("benchmarks", {}).get(name, {}).get("threshold", args.threshold)
+        if args.only and baseline.get("config", {}).get("court_rows") == args.court_rows:
+            # A partial run updates its stages and keeps the others
+            results["benchmarks"] = {**baseline.get("benchmarks", {}), **results["benchmarks"]}
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+    elsewhere = [name for name, (status, _) in verdicts.items() if status == "REGRESSED (other machine)"]
+    if elsewhere:
+        print(f"Warning: slower than the other machine's baseline, not gated: {', '.join(elsewhere)}")
+    regressed = [name for name, (status, _) in verdicts.items() if status == "REGRESSED"]
+    if regressed:
+        print(f"Regressed: {', '.join(regressed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark table extraction on large Wikipedia-style pages.
+
+Compares the targeted extractor in utils/table_extract.py with the two
+approaches it replaced: a full BeautifulSoup walk (the old
+DataAnalystAgent.scrape_wikipedia_movies) and BeautifulSoup + pd.read_html
+(the old utils/scraper.scrape_table).
+
+    python benchmarks/bench_table_extract.py --rows 5000 --filler 2000
+"""
+
+import argparse
+import io
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+from utils.table_extract import extract_table
+
+FIXTURE = os.path.join(ROOT, "fixtures", "highest_grossing_films.html")
+
+
+def build_page(rows, filler):
+    """Fixture page with the films table grown to `rows` rows and `filler` extra paragraphs"""
+    html = open(FIXTURE, encoding="utf-8").read()
+    body = re.findall(r"<tr>\n<td>\d+</td>.*?</tr>", html, re.DOTALL)
+    grown = "\n".join(body[i % len(body)] for i in range(rows))
+    start = html.index(body[0])
+    end = html.index(body[-1]) + len(body[-1])
+    html = html[:start] + grown + html[end:]
+    paragraph = "<p>" + "Lorem <a href='/wiki/x'>ipsum</a> dolor sit amet. " * 20 + "</p>\n"
+    marker = '<h2 id="Notes">'
+    return html.replace(marker, paragraph * filler + marker, 1)
+
+
+def bs4_walk(html):
+    soup = BeautifulSoup(html, "html.parser")
+    for table in soup.find_all("table", class_="wikitable"):
+        headers = [th.get_text(strip=True) for th in table.find_all("th")]
+        if "Rank" in headers and "Peak" in headers:
+            rows = []
+            for row in table.find_all("tr")[1:]:
+                cells = row.find_all(["td", "th"])
+                if len(cells) >= 4:
+                    rows.append([cell.get_text(strip=True) for cell in cells])
+            return pd.DataFrame(rows, columns=headers[:len(rows[0])])
+
+
+def bs4_read_html(html):
+    soup = BeautifulSoup(html, "html.parser")
+    table = soup.find("table", {"class": "wikitable"})
+    return pd.read_html(io.StringIO(str(table)))[0]
+
+
+def targeted(html):
+    return extract_table(html, required_headers=("Rank", "Peak"))
+
+
+def best_of(fn, html, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        df = fn(html)
+        timings.append(time.perf_counter() - started)
+    return min(timings), df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--filler", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    html = build_page(args.rows, args.filler)
+    print(f"Page: {len(html) / 1e6:.2f} MB, {args.rows} table rows")
+    results = {}
+    for name, fn in (("bs4 walk", bs4_walk), ("bs4 + read_html", bs4_read_html), ("targeted", targeted)):
+        try:
+            seconds, df = best_of(fn, html, args.repeat)
+        except Exception as e:
+            print(f"{name:>16}: failed ({e})")
+            continue
+        results[name] = seconds
+        print(f"{name:>16}: {seconds * 1000:9.1f} ms  shape={df.shape}")
+    if "targeted" in results:
+        for name, seconds in results.items():
+            if name != "targeted":
+                print(f"targeted is {seconds / results['targeted']:.1f}x faster than {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Load-test /api/ under concurrency and compare the Flask and FastAPI servers.
+
+Starts each server (app.py, main.py) against local stand-ins, so nothing
+leaves the machine: the films page is served from
+fixtures/highest_grossing_films.html by a small HTTP server that honours
+ETag revalidation (optionally with added latency), and the court bucket is
+a synthetic Parquet tree from benchmarks/make_court_data.py. Each server
+gets fresh caches. At every concurrency level a closed loop of clients
+posts the task mix (question.txt and the films prompt by default) for
+--duration seconds and the run records latency percentiles, throughput and
+the share of errors, 429 rejections and answers degraded to a fallback
+(the X-Degraded header).
+
+Every task gets a unique first line unless --repeat-tasks is given, so the
+result cache cannot answer it; with it, the run shows the cached path.
+Reports are written as JSON (one per run) and --compare prints the change
+against an earlier report.
+
+    python benchmarks/loadtest.py --levels 1 8 32 128 --duration 30
+    python benchmarks/loadtest.py --servers fastapi --url http://127.0.0.1:10000/api/
+    python benchmarks/loadtest.py --compare /tmp/data-analyst-agent/loadtest/<earlier>.json
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx
+
+from benchmarks.make_court_data import ensure_tree
+
+FIXTURE = os.path.join(ROOT, "fixtures", "highest_grossing_films.html")
+MOVIES_PATH = "/wiki/List_of_highest-grossing_films"
+# The films prompt, shared with the benchmark suite and the unit tests
+MOVIE_TASK_FILE = os.path.join(ROOT, "fixtures", "movie_task.txt")
+SERVERS = {
+    "flask": [sys.executable, "app.py"],
+    "fastapi": [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", "{port}"],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, q):
+    """q-th percentile (0-100) by linear interpolation, or None for no values"""
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def read_task(path):
+    """Task text of a file, whatever its encoding (question.txt is UTF-16)"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return data.decode("utf-16")
+    return data.decode("utf-8-sig")
+
+
+class FixtureServer:
+    """Serves the saved films page at Wikipedia's path, with ETag revalidation"""
+
+    def __init__(self, path=FIXTURE, delay=0.0):
+        with open(path, "rb") as f:
+            body = f.read()
+        etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        self.requests = 0
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fixture.requests += 1
+                time.sleep(delay)
+                if self.path.split("?")[0] != MOVIES_PATH:
+                    self.send_error(404)
+                    return
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=UTF-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}{MOVIES_PATH}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ServerProcess:
+    """One of the servers, started with its own caches against the stand-ins"""
+
+    def __init__(self, name, movies_url, court_root, workdir, log_dir, extra_env=None):
+        self.name = name
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        scratch = os.path.join(workdir, name)
+        env = {
+            **os.environ,
+            "PORT": str(self.port),
+            "MOVIES_URL": movies_url,
+            "COURT_DATA_ROOT": court_root,
+            # The tree is already local; mirroring it would only copy it again
+            "COURT_MIRROR": "0",
+            "HTTP_CACHE_DIR": os.path.join(scratch, "http"),
+            "SNAPSHOT_DIR": os.path.join(scratch, "snapshots"),
+            "COURT_STORE_PATH": os.path.join(scratch, "store", "court.parquet"),
+            "UPLOAD_SPOOL_DIR": os.path.join(scratch, "spool"),
+            **(extra_env or {}),
+        }
+        command = [part.format(port=self.port) for part in SERVERS[name]]
+        self.log_path = os.path.join(log_dir, f"{name}.log")
+        self._log = open(self.log_path, "w")
+        # A session of its own, so its render workers can be stopped with it
+        self.process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=self._log, stderr=subprocess.STDOUT,
+                                        start_new_session=True)
+
+    def wait_ready(self, timeout=120):
+        """Wait for /health and the background warm-up, so the first level is not a cold start"""
+        started = time.perf_counter()
+        with httpx.Client(timeout=10) as client:
+            while time.perf_counter() - started < timeout:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"{self.name} exited; see {self.log_path}")
+                try:
+                    health = client.get(f"{self.url}/health").json()
+                    if health.get("warmup", {}).get("done") or not health.get("warmup", {}).get("enabled", True):
+                        return
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.2)
+        raise TimeoutError(f"{self.name} not ready after {timeout}s; see {self.log_path}")
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        # The render pool's forkserver outlives a terminated server otherwise
+        try:
+            os.killpg(self.process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        self._log.close()
+
+
+async def run_level(url, tasks, concurrency, duration, timeout, unique, counter):
+    """Closed loop of concurrency clients for duration seconds; returns the level's report"""
+    results = []
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def client_loop(client, index):
+        sent = 0
+        while time.perf_counter() < deadline:
+            name, task = tasks[(index + sent) % len(tasks)]
+            sent += 1
+            counter[0] += 1
+            if unique:
+                task = f"Load test request {counter[0]}\n{task}"
+            started = time.perf_counter()
+            try:
+                response = await client.post(url, files={"file": ("question.txt", task.encode("utf-8"))})
+                status = response.status_code
+                degraded = bool(response.headers.get("X-Degraded"))
+            except httpx.HTTPError as e:
+                status, degraded = type(e).__name__, False
+            results.append((name, status, degraded, time.perf_counter() - started))
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        await asyncio.gather(*(client_loop(client, i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return summarize(results, concurrency, elapsed)
+
+
+def summarize(results, concurrency, elapsed):
+    def stats(rows):
+        ok = [seconds for _, status, _, seconds in rows if status == 200]
+        total = len(rows) or 1
+        return {
+            "requests": len(rows),
+            "ok": len(ok),
+            "p50_ms": _ms(percentile(ok, 50)),
+            "p95_ms": _ms(percentile(ok, 95)),
+            "p99_ms": _ms(percentile(ok, 99)),
+            "max_ms": _ms(max(ok) if ok else None),
+            "error_rate": round(sum(1 for _, s, _, _ in rows if s not in (200, 429)) / total, 4),
+            "rejected_rate": round(sum(1 for _, s, _, _ in rows if s == 429) / total, 4),
+            "fallback_rate": round(sum(1 for _, s, d, _ in rows if s == 200 and d) / total, 4),
+        }
+
+    report = {
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(sum(1 for _, s, _, _ in results if s == 200) / elapsed, 3) if elapsed else 0.0,
+        **stats(results),
+        "by_task": {name: stats([r for r in results if r[0] == name]) for name in sorted({r[0] for r in results})},
+    }
+    statuses = {}
+    for _, status, _, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    report["statuses"] = statuses
+    return report
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def print_levels(name, levels, previous=None):
+    print(f"\n{name}")
+    print(f"{'clients':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'errors':>7} {'429':>6} {'degraded':>8} {'requests':>8}")
+    before = {level["concurrency"]: level for level in (previous or [])}
+    for level in levels:
+        line = (f"{level['concurrency']:>7} {level['throughput_rps']:>8.2f} {_cell(level['p50_ms']):>9} "
+                f"{_cell(level['p95_ms']):>9} {_cell(level['p99_ms']):>9} {level['error_rate']:>7.1%} "
+                f"{level['rejected_rate']:>6.1%} {level['fallback_rate']:>8.1%} {level['requests']:>8}")
+        old = before.get(level["concurrency"])
+        if old and old.get("p95_ms") and level.get("p95_ms") and old.get("throughput_rps"):
+            line += (f"   vs before: p95 {level['p95_ms'] / old['p95_ms'] - 1:+.0%}, "
+                     f"req/s {level['throughput_rps'] / old['throughput_rps'] - 1:+.0%}")
+        print(line)
+
+
+def _cell(value):
+    return "-" if value is None else f"{value:.0f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--servers", nargs="+", choices=sorted(SERVERS), default=["flask", "fastapi"])
+    parser.add_argument("--url", help="load an already running server's /api/ instead (one --servers name)")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 8, 32, 128], help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per level")
+    parser.add_argument("--tasks", nargs="+", help="task files (default: question.txt and the films prompt)")
+    parser.add_argument("--repeat-tasks", action="store_true", help="send tasks verbatim, so repeats hit the result cache")
+    parser.add_argument("--timeout", type=float, default=240, help="client timeout per request")
+    parser.add_argument("--court-rows", type=int, default=1_000_000)
+    parser.add_argument("--fixture-delay-ms", type=float, default=0, help="latency added by the stand-in page server")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "data-analyst-agent", "bench"))
+    parser.add_argument("--report-dir", default=os.path.join(tempfile.gettempdir(), "data-analyst-agent", "loadtest"))
+    parser.add_argument("--compare", help="earlier report to print changes against")
+    parser.add_argument("--env", nargs="*", default=[], metavar="NAME=VALUE", help="extra server environment")
+    args = parser.parse_args()
+    if args.url and len(args.servers) != 1:
+        parser.error("--url loads one server; name it with --servers")
+
+    if args.tasks:
+        tasks = [(os.path.basename(path), read_task(path)) for path in args.tasks]
+    else:
+        tasks = [("question.txt", read_task(os.path.join(ROOT, "question.txt"))), ("movies", read_task(MOVIE_TASK_FILE))]
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+
+    os.makedirs(args.report_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "levels": args.levels,
+            "duration": args.duration,
+            "tasks": [name for name, _ in tasks],
+            "unique_tasks": not args.repeat_tasks,
+            "court_rows": args.court_rows,
+            "fixture_delay_ms": args.fixture_delay_ms,
+            "env": extra_env,
+            "cpus": os.cpu_count(),
+        },
+        "servers": {},
+    }
+    counter = [0]
+
+    fixture = court_root = workdir = None
+    if not args.url:
+        os.makedirs(args.data_dir, exist_ok=True)
+        court_root = ensure_tree(args.data_dir, args.court_rows)
+        fixture = FixtureServer(delay=args.fixture_delay_ms / 1000)
+        workdir = tempfile.mkdtemp(prefix=f"loadtest-{stamp}-")
+    try:
+        for name in args.servers:
+            server = None
+            url = args.url
+            if not url:
+                server = ServerProcess(name, fixture.url, court_root, workdir, args.report_dir, extra_env)
+                server.wait_ready()
+                url = f"{server.url}/api/"
+            try:
+                levels = []
+                for concurrency in args.levels:
+                    level = asyncio.run(run_level(url, tasks, concurrency, args.duration, args.timeout,
+                                                  not args.repeat_tasks, counter))
+                    levels.append(level)
+                report["servers"][name] = levels
+                print_levels(name, levels, (previous or {}).get("servers", {}).get(name))
+            finally:
+                if server is not None:
+                    server.stop()
+    finally:
+        if fixture is not None:
+            report["config"]["fixture_requests"] = fixture.requests
+            fixture.close()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    path = os.path.join(args.report_dir, f"loadtest-{stamp}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic court metadata tree shaped like the judgments bucket.
+
+Writes ``year=*/court=*/bench=*/metadata.parquet`` with the columns the
+court questions read (date_of_registration as DD-MM-YYYY text,
+decision_date as a DATE) plus wide text columns they must never read, so
+projection and partition pruning show up in the timings. Delays grow with
+the year, so the delay regression has a slope to find. Rows are generated
+and written by DuckDB, deterministically for a given seed: about a minute
+per 10M rows on one core.
+
+    python benchmarks/make_court_data.py --rows 1000000 --out /tmp/court-bench
+    COURT_DATA_ROOT=/tmp/court-bench python app.py
+"""
+
+import argparse
+import glob
+import os
+import shutil
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import duckdb
+
+from utils.court import COURT_DATA_FILE
+
+# The court every delay question asks about is always among the generated ones
+QUESTION_COURT = "33_10"
+
+
+def court_ids(n):
+    """n court ids like the bucket's ("33_10", "1_12", ...), QUESTION_COURT first"""
+    ids = [QUESTION_COURT]
+    state = 1
+    while len(ids) < n:
+        court = f"{state}_{10 + len(ids) % 20}"
+        if court not in ids:
+            ids.append(court)
+        state += 1
+    return ids
+
+
+def generate(out, rows, years=(2010, 2024), courts=25, benches=2, seed=42, filename=COURT_DATA_FILE):
+    """Write the tree under out (replacing it); returns the number of partition files"""
+    if os.path.exists(out):
+        shutil.rmtree(out)
+    staging = out + ".tmp"
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+    first, last = years
+    ids = ", ".join(f"'{court}'" for court in court_ids(courts))
+    span = last - first + 1
+    conn = duckdb.connect()
+    # One writer per partition, so each gets exactly one file
+    conn.execute(f"SET partitioned_write_max_open_files = {span * courts * benches + 1}")
+    conn.execute(f"""
+        COPY (
+            SELECT year,
+                   court,
+                   'b' || (1 + h_bench % {benches}) AS bench,
+                   strftime(registered, '%d-%m-%Y') AS date_of_registration,
+                   CAST(registered + CAST(delay AS INTEGER) AS DATE) AS decision_date,
+                   'CNR' || lpad(CAST(i AS VARCHAR), 12, '0') AS cnr,
+                   repeat('judgment text ', 8 + CAST(h_html % 24 AS INTEGER)) AS raw_html
+            FROM (
+                SELECT i,
+                       {first} + CAST(h_year % {span} AS BIGINT) AS year,
+                       [{ids}][1 + CAST(h_court % {courts} AS INTEGER)] AS court,
+                       make_date({first} + CAST(h_year % {span} AS BIGINT), 1, 1)
+                           + CAST(h_day % 365 AS INTEGER) AS registered,
+                       -- Longer delays in later years, with a long tail
+                       20 * CAST(h_year % {span} AS DOUBLE)
+                           + 400 * (h_tail % 1000) / 1000.0 * (h_bench // 7 % 1000) / 1000.0 AS delay,
+                       h_bench, h_html
+                FROM (
+                    SELECT i,
+                           hash(i, {seed}, 'year') AS h_year,
+                           hash(i, {seed}, 'court') AS h_court,
+                           hash(i, {seed}, 'bench') AS h_bench,
+                           hash(i, {seed}, 'day') AS h_day,
+                           hash(i, {seed}, 'tail') AS h_tail,
+                           hash(i, {seed}, 'html') AS h_html
+                    FROM range({int(rows)}) t(i)
+                )
+            )
+        ) TO '{staging}' (FORMAT parquet, PARTITION_BY (year, court, bench), FILENAME_PATTERN 'part_{{i}}')
+    """)
+    conn.close()
+    files = 0
+    for directory in glob.glob(os.path.join(staging, "year=*", "court=*", "bench=*")):
+        parts = sorted(glob.glob(os.path.join(directory, "part_*.parquet")))
+        if len(parts) != 1:
+            # Only if DuckDB split a partition anyway; merge rather than drop rows
+            merged = duckdb.connect()
+            sources = ", ".join(f"'{part}'" for part in parts)
+            merged.execute(f"COPY (SELECT * FROM read_parquet([{sources}])) TO '{directory}/merged.parquet' (FORMAT parquet)")
+            merged.close()
+            for part in parts:
+                os.remove(part)
+            parts = [os.path.join(directory, "merged.parquet")]
+        os.replace(parts[0], os.path.join(directory, filename))
+        files += 1
+    os.replace(staging, out)
+    return files
+
+
+def ensure_tree(data_dir, rows):
+    """Root of the tree at this scale under data_dir, generated on first use"""
+    root = os.path.join(data_dir, f"court-{rows}")
+    if not os.path.isdir(root):
+        started = time.perf_counter()
+        files = generate(root, rows)
+        print(f"Generated {rows:,} court rows in {files} partitions in {time.perf_counter() - started:.1f}s")
+    return root
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--out", required=True, help="directory to (re)create")
+    parser.add_argument("--years", type=int, nargs=2, default=(2010, 2024), metavar=("FIRST", "LAST"))
+    parser.add_argument("--courts", type=int, default=25)
+    parser.add_argument("--benches", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    files = generate(args.out, args.rows, tuple(args.years), args.courts, args.benches, args.seed)
+    print(f"Wrote {args.rows:,} rows in {files} partitions under {args.out}")
+
+
+if __name__ == "__main__":
+    main()
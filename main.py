@@ -1,13 +1,59 @@
-import pandas as pd
-import io
-from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import JSONResponse
-from utils.agent import process_question
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTasks
+from utils.admission import Rejected, get_admission
+from utils.deadline import Deadline
+from utils.result_cache import fingerprint, get_result_cache
+from utils.serialize import dumps
+from utils.streaming import CONTENT_TYPES, STREAM_HEADERS, stream_mode
+from utils.prefork import worker_stats
+from utils.tracing import TracingMiddleware, annotate, render_metrics
+from utils.warmup import get_warmup, start_warmup
 
-app = FastAPI()
+
+class AgentJSONResponse(JSONResponse):
+    """JSONResponse that also accepts NumPy scalars and arrays"""
+
+    def render(self, content) -> bytes:
+        return dumps(content).encode("utf-8")
+
+
+def rejected(e):
+    """429 for a request turned away by admission control"""
+    print(f"Rejected {e.kind} request: {e.reason}")
+    return JSONResponse(
+        status_code=429,
+        content={"error": f"Too many {e.kind} analyses in progress", "retry_after": e.retry_after},
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+async def admitted(ticket, chunks):
+    """Stream chunks with the ticket's DuckDB limits applied, releasing its slot at the end"""
+    with ticket:
+        async for chunk in chunks:
+            yield chunk
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Preload the analysis stack in the background; /health answers meanwhile
+    start_warmup()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+# Stage timings in a Server-Timing header, request and stage metrics for /metrics
+app.add_middleware(TracingMiddleware)
 
 @app.post("/api/")
-async def analyze_file(file: UploadFile = File(...)):
+async def analyze_file(request: Request, file: UploadFile = File(...)):
+    # pandas, matplotlib and DuckDB come in with these on first use (or from the warm-up)
+    from utils.agent import admission_kind, process_question, stream_question
+    from utils.ingest import close_all, spool
+
     # Read the uploaded file
     content = await file.read()
 
@@ -17,7 +63,70 @@ async def analyze_file(file: UploadFile = File(...)):
     except UnicodeDecodeError:
         question = content.decode("utf-16").strip()
 
-    # Pass the question string to your custom agent
-    response = await process_question(question)
+    # Any further uploads are data files: copied to the upload spool in chunks
+    # and read in place by DuckDB, never loaded whole
+    form = await request.form()
+    uploads = [value for _, value in form.multi_items() if not isinstance(value, str) and value is not file]
+    attachments = [await asyncio.to_thread(spool, upload.file, upload.filename) for upload in uploads]
+    cleanup = BackgroundTasks()
+    cleanup.add_task(close_all, attachments)
+
+    # Every stage shares this budget; overrunning ones fall back to cheaper answers
+    deadline = Deadline()
+    # Heavy kinds (court scans, uploads) run a few at a time; the rest wait or get a 429
+    kind = admission_kind(question, attachments)
+    annotate(kind=kind)
+
+    # Opt-in streaming: each answer is sent as soon as it is ready
+    mode = stream_mode(request.query_params.get("stream"), request.headers.get("accept"))
+    if mode:
+        try:
+            ticket = await get_admission().acquire_async(kind, deadline.remaining())
+        except Rejected as e:
+            close_all(attachments)
+            return rejected(e)
+        cleanup.add_task(ticket.release)
+        return StreamingResponse(
+            admitted(ticket, stream_question(question, mode, deadline, attachments)),
+            media_type=CONTENT_TYPES[mode],
+            headers=STREAM_HEADERS,
+            background=cleanup,
+        )
+
+    async def compute():
+        # Only the request that actually computes is admitted; cache hits and
+        # coalesced callers never take a slot
+        with await get_admission().acquire_async(kind, deadline.remaining()):
+            return await process_question(question, deadline, attachments), dict(deadline.degraded)
+
+    # Pass the question string to your custom agent; identical questions share
+    # one computation and are then answered from the cache unless degraded
+    key = await asyncio.to_thread(fingerprint, question, [(a.filename, a.path) for a in attachments])
+    try:
+        response, degraded = await get_result_cache().get_or_compute_async(
+            key, compute, cacheable=lambda value: not value[1]
+        )
+    except Rejected as e:
+        close_all(attachments)
+        return rejected(e)
+    for position, reason in degraded.items():
+        deadline.mark((position,), reason)
+
+    headers = {"X-Degraded": deadline.header()} if deadline.header() else None
+    return AgentJSONResponse(content={"result": response}, headers=headers, background=cleanup)
+
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "healthy",
+        "admission": get_admission().stats(),
+        "warmup": get_warmup().stats(),
+        "worker": worker_stats(),
+    }
+
 
-    return JSONResponse(content={"result": response})
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics of this worker"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Tests build their own mirrors and stores; none falls back to the shared one
+os.environ.setdefault("COURT_MIRROR", "0")
+
+import duckdb
+import pytest
+
+from benchmarks.make_court_data import generate
+
+FIXTURE = os.path.join(ROOT, "fixtures", "highest_grossing_films.html")
+MOVIE_TASK = os.path.join(ROOT, "fixtures", "movie_task.txt")
+
+
+@pytest.fixture(scope="session")
+def court_tree(tmp_path_factory):
+    """A small synthetic court tree: 2019-2023, 3 courts, 2 benches (30 partitions)"""
+    root = str(tmp_path_factory.mktemp("court") / "src")
+    generate(root, 20_000, years=(2019, 2023), courts=3, benches=2)
+    return root
+
+
+@pytest.fixture
+def conn():
+    conn = duckdb.connect()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope="session")
+def films_html():
+    with open(FIXTURE, encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture(scope="session")
+def movie_task():
+    """The films prompt the load test and benchmark suite post"""
+    with open(MOVIE_TASK, encoding="utf-8") as f:
+        return f.read()
+
+
+class PageServer:
+    """Serves one page with an ETag, answering If-None-Match with 304"""
+
+    def __init__(self, body):
+        self.body = body
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                etag = '"' + hashlib.sha256(server.body).hexdigest()[:16] + '"'
+                server.requests.append(self.headers.get("If-None-Match"))
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=UTF-8")
+                self.send_header("Content-Length", str(len(server.body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(server.body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/wiki/List_of_highest-grossing_films"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def films_page(films_html):
+    """The saved films page behind a local server; tests may change its body or close it"""
+    server = PageServer(films_html.encode("utf-8"))
+    yield server
+    server.close()
@@ -0,0 +1,132 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.admission import (
+    COURT,
+    GENERIC,
+    MOVIES,
+    UPLOAD,
+    AdmissionController,
+    Rejected,
+    ResourceBudget,
+    current_limits,
+    kind_for,
+)
+
+
+@pytest.fixture
+def budget(monkeypatch, tmp_path):
+    for kind in (COURT, MOVIES, UPLOAD, GENERIC):
+        monkeypatch.delenv(f"ADMIT_{kind.upper()}_LIMIT", raising=False)
+        monkeypatch.delenv(f"ADMIT_{kind.upper()}_QUEUE", raising=False)
+    monkeypatch.setenv("ADMIT_COURT_LIMIT", "1")
+    monkeypatch.setenv("ADMIT_COURT_QUEUE", "1")
+    return ResourceBudget(memory_mb=4096, cpus=4, spill_dir=str(tmp_path / "spill"), spill_mb=1024)
+
+
+def waiting(controller, kind, depth):
+    deadline = time.monotonic() + 5
+    while controller.stats()[kind]["queue_depth"] != depth:
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_kind_for():
+    assert kind_for("court") == COURT and kind_for("movies", [("a.csv", b"")]) == MOVIES
+    assert kind_for(None, [("a.csv", b"")]) == UPLOAD and kind_for() == GENERIC
+
+
+def test_limits_split_the_memory_budget(budget):
+    assert (budget.limit(COURT), budget.limit(MOVIES), budget.limit(UPLOAD), budget.limit(GENERIC)) == (1, 4, 2, 8)
+    assert budget.queue(COURT) == 1 and budget.queue(MOVIES) == 8
+    # Weighted 4:1, at most this much is granted when every slot runs at once
+    weighted = 1 * 4 + 4 * 1 + 2 * 4 + 8 * 1
+    assert budget.duckdb_limits(COURT) == {"memory_limit": f"{4096 * 4 // weighted}MB", "threads": 4}
+    assert budget.duckdb_limits(GENERIC) == {"memory_limit": f"{4096 // weighted}MB", "threads": 1}
+
+
+def test_connection_settings_give_each_connection_its_own_spill_space(budget):
+    first, second = budget.connection_settings("10-1", share=4), budget.connection_settings("10-2", share=4)
+    assert first["temp_directory"] != second["temp_directory"]
+    assert first["max_temp_directory_size"] == "256MB"
+
+
+def test_ticket_applies_limits_to_its_context(budget):
+    controller = AdmissionController(budget, queue_timeout=1)
+    assert current_limits() is None
+    with controller.acquire(MOVIES) as ticket:
+        assert current_limits() == ticket.limits == budget.duckdb_limits(MOVIES)
+        assert controller.stats()[MOVIES]["running"] == 1
+    assert current_limits() is None
+    assert controller.stats()[MOVIES]["running"] == 0
+
+
+def test_full_queue_and_timeouts_are_rejected(budget):
+    controller = AdmissionController(budget, queue_timeout=5)
+    held = controller.acquire(COURT)
+    # One waiter fits in the queue; it gives up after its own timeout
+    with pytest.raises(Rejected) as timed_out:
+        controller.acquire(COURT, timeout=0.05)
+    assert timed_out.value.reason.startswith("waited")
+
+    outcome = []
+
+    def wait():
+        try:
+            controller.acquire(COURT, timeout=0.5)
+        except Rejected as e:
+            outcome.append(e.reason)
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    waiting(controller, COURT, 1)
+    with pytest.raises(Rejected) as full:
+        controller.acquire(COURT, timeout=0)
+    assert full.value.reason == "queue full" and full.value.retry_after >= 1
+    waiter.join()
+    assert outcome and outcome[0].startswith("waited")
+    held.release()
+    stats = controller.stats()[COURT]
+    assert (stats["rejected"], stats["timeouts"], stats["running"]) == (3, 2, 0)
+
+
+def test_released_slot_goes_to_the_longest_waiter(budget, monkeypatch):
+    monkeypatch.setenv("ADMIT_COURT_QUEUE", "2")
+    controller = AdmissionController(budget, queue_timeout=5)
+    held = controller.acquire(COURT)
+    order = []
+
+    def wait(name):
+        ticket = controller.acquire(COURT)
+        order.append(name)
+        ticket.release()
+
+    threads = []
+    for depth, name in enumerate(("first", "second"), 1):
+        threads.append(threading.Thread(target=wait, args=(name,)))
+        threads[-1].start()
+        waiting(controller, COURT, depth)
+    held.release()
+    for thread in threads:
+        thread.join()
+    assert order == ["first", "second"]
+    assert controller.stats()[COURT]["running"] == 0
+
+
+def test_async_waiters_are_admitted_without_blocking_the_loop(budget):
+    controller = AdmissionController(budget, queue_timeout=5)
+
+    async def main():
+        held = await controller.acquire_async(COURT)
+        queued = asyncio.ensure_future(controller.acquire_async(COURT))
+        await asyncio.sleep(0.05)
+        assert not queued.done()
+        held.release()
+        (await queued).release()
+
+    asyncio.run(main())
+    stats = controller.stats()[COURT]
+    assert (stats["admitted"], stats["running"]) == (2, 0)
@@ -0,0 +1,30 @@
+import pytest
+
+from utils import analyzer, visualizer
+from utils.db_pool import DuckDBPool
+from utils.render import RenderService
+from utils.table_extract import extract_table
+
+
+@pytest.fixture
+def raw_films(films_html):
+    return extract_table(films_html, required_headers=("Rank", "Peak"))
+
+
+def test_analyze_data_parses_and_answers_in_duckdb(raw_films, monkeypatch):
+    pool = DuckDBPool(size=1, extensions=())
+    monkeypatch.setattr(analyzer, "get_pool", lambda: pool)
+    try:
+        count, earliest, corr = analyzer.analyze_data(raw_films)
+    finally:
+        pool.close()
+    assert (count, earliest) == (5, "Titanic")
+    assert -1 < corr < 0
+
+
+def test_make_plot_renders_through_the_service(raw_films, monkeypatch):
+    from utils.columns import parse_columns
+
+    df, _ = parse_columns(raw_films)
+    monkeypatch.setattr(visualizer, "get_renderer", lambda: RenderService(inline=True))
+    assert visualizer.make_plot(df).startswith("data:image/png;base64,")
@@ -0,0 +1,33 @@
+import copy
+
+from benchmarks.bench_suite import compare, machine_differences, machine_info, unrecorded_keys
+
+
+def run(min_ms, machine=None):
+    return {
+        "machine": machine or machine_info(),
+        "config": {"court_rows": 1000},
+        "benchmarks": {"parse": {"min_ms": min_ms, "threshold": 0.25}},
+    }
+
+
+def test_kernel_and_patch_updates_still_gate():
+    baseline = run(10.0)
+    baseline["machine"].update(platform="Linux-5.15.0-generic-x86_64", duckdb="0.0.1")
+    assert machine_differences(run(20.0), baseline) == {}
+    assert compare(run(20.0), baseline, 0.25, 2.0) == {"parse": ("REGRESSED", 1.0)}
+
+
+def test_another_machine_reports_without_gating_unless_forced():
+    machine = dict(machine_info(), cpus=machine_info()["cpus"] + 8)
+    baseline = run(10.0, machine)
+    assert machine_differences(run(20.0), baseline) == {"cpus": (machine["cpus"], machine_info()["cpus"])}
+    assert compare(run(20.0), baseline, 0.25, 2.0) == {"parse": ("REGRESSED (other machine)", 1.0)}
+    assert compare(run(20.0), baseline, 0.25, 2.0, force=True)["parse"][0] == "REGRESSED"
+
+
+def test_keys_an_old_baseline_lacks_are_flagged_not_compared():
+    old = copy.deepcopy(run(10.0))
+    del old["machine"]["system"], old["machine"]["arch"]
+    assert unrecorded_keys(old) == ["system", "arch"]
+    assert compare(run(20.0), old, 0.25, 2.0)["parse"][0] == "REGRESSED"
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.columns import (
+    CURRENCY,
+    NUMBER,
+    ORDINAL,
+    TEXT,
+    YEAR,
+    has_footnotes,
+    infer_columns,
+    infer_kind,
+    parse_currency,
+    parse_number,
+    parse_ordinal,
+    parse_text,
+    parse_year,
+)
+from utils.scraper import clean_movies_data
+from utils.table_extract import extract_table
+
+
+def test_parse_currency():
+    series = pd.Series(["$2.9 billion", "$2,900,000,000", "US$1.5 bn", "F8$1,290,000,000", "€3 million[a]", None, "n/a"])
+    np.testing.assert_array_equal(parse_currency(series), [2.9e9, 2.9e9, 1.5e9, 1.29e9, 3e6, np.nan, np.nan])
+
+
+def test_parse_ordinal_and_year():
+    ranks = parse_ordinal(pd.Series(["1", "2[# 1]", "300", None]))
+    assert str(ranks.dtype) == "UInt16"
+    assert ranks.tolist()[:3] == [1, 2, 300] and ranks.isna().tolist() == [False, False, False, True]
+
+    years = parse_year(pd.Series(["2019", "c. 1997[b]", None]))
+    assert str(years.dtype) == "UInt16"
+    assert years.tolist()[:2] == [2019, 1997] and pd.isna(years[2])
+
+
+def test_parse_number_downcasts_only_when_lossless():
+    assert parse_number(pd.Series(["1,234", "5", "-3"])).tolist() == [1234, 5, -3]
+    assert parse_number(pd.Series(["1,234", "5", "-3"])).dtype == np.int16
+    assert parse_number(pd.Series(["1.5", "2"])).tolist() == [1.5, 2.0]
+
+
+def test_parse_text_strips_footnotes():
+    series = pd.Series(["Titanic[a] ", " Avatar", None])
+    assert parse_text(series).tolist()[:2] == ["Titanic", "Avatar"]
+    assert has_footnotes(series) and not has_footnotes(parse_text(series))
+
+
+@pytest.mark.parametrize("values, name, kind", [
+    (["$2,923,706,026", "$2,799,439,100"], "Worldwide gross", CURRENCY),
+    (["2,923,706,026", "2,799,439,100"], "Box office", CURRENCY),
+    (["1", "2", "3[# 1]"], "Rank", ORDINAL),
+    (["2009", "2019", "1997"], "Year", YEAR),
+    (["1,234", "-5", "6.5"], "Total", NUMBER),
+    (["Avatar", "Titanic"], "Title", TEXT),
+    ([1, 2, 3], "Peak", ORDINAL),
+])
+def test_infer_kind(values, name, kind):
+    assert infer_kind(pd.Series(values), name) == kind
+
+
+def test_cleaned_films_table(films_html):
+    raw = extract_table(films_html, required_headers=("Rank", "Peak"))
+    assert infer_columns(raw)["Worldwide gross"] == CURRENCY
+    df = clean_movies_data(raw)
+    assert (str(df["Rank"].dtype), str(df["Peak"].dtype), str(df["Year"].dtype)) == ("UInt8", "UInt8", "UInt16")
+    assert ((df["Worldwide_Gross"] >= 2e9) & (df["Year"] < 2020)).sum() == 5
+    assert df[df["Worldwide_Gross"] >= 1.5e9].sort_values("Year")["Title"].iloc[0] == "Titanic"
+    assert df["Rank"].astype(float).corr(df["Peak"].astype(float)) == pytest.approx(0.409353, abs=1e-6)
@@ -0,0 +1,153 @@
+import glob
+import multiprocessing
+import os
+import threading
+
+import duckdb
+import pytest
+
+from utils.court_mirror import PartitionMirror
+
+
+def mirror_for(court_tree, tmp_path, **kwargs):
+    return PartitionMirror(root=str(tmp_path / "mirror"), source_root=court_tree, **kwargs)
+
+
+def test_select_prunes_partitions_by_scope(court_tree, tmp_path, conn):
+    mirror = mirror_for(court_tree, tmp_path)
+    selected = mirror.select(conn, [{"years": (2019, 2020), "courts": ("33_10",)}])
+    assert selected == [
+        "year=2019/court=33_10/bench=b1/metadata.parquet",
+        "year=2019/court=33_10/bench=b2/metadata.parquet",
+        "year=2020/court=33_10/bench=b1/metadata.parquet",
+        "year=2020/court=33_10/bench=b2/metadata.parquet",
+    ]
+    assert len(mirror.select(conn)) == 30
+
+
+def test_relation_matches_source_with_projected_columns(court_tree, tmp_path, conn):
+    mirror = mirror_for(court_tree, tmp_path)
+    scopes = [{"courts": ("33_10",)}]
+    relation = mirror.relation(conn, scopes, ["court", "year", "decision_date"])
+    local = conn.execute(f"SELECT year, count(*) FROM {relation} GROUP BY year ORDER BY year").fetchall()
+    remote = conn.execute(
+        f"SELECT year, count(*) FROM read_parquet('{court_tree}/*/*/*/metadata.parquet', hive_partitioning = true) "
+        "WHERE court = '33_10' GROUP BY year ORDER BY year"
+    ).fetchall()
+    assert local == remote
+    # Only the data column asked for is copied; the wide text columns stay behind
+    copied = glob.glob(str(tmp_path / "mirror" / "year=*" / "court=33_10" / "*" / "metadata.parquet"))
+    assert len(copied) == 10
+    described = conn.execute(f"DESCRIBE SELECT * FROM read_parquet('{copied[0]}', hive_partitioning = false)")
+    columns = [row[0] for row in described.fetchall()]
+    assert columns == ["decision_date"]
+
+
+def test_ensure_widens_columns_and_reuses_copies(court_tree, tmp_path, conn, monkeypatch):
+    mirror = mirror_for(court_tree, tmp_path)
+    fetched = []
+    fetch = mirror._fetch
+    monkeypatch.setattr(mirror, "_fetch", lambda conn, rel, columns: fetched.append(columns) or fetch(conn, rel, columns))
+    partitions = mirror.select(conn, [{"years": (2019, 2019), "courts": ("33_10",)}])
+
+    mirror.ensure(conn, partitions, ["decision_date"])
+    mirror.ensure(conn, partitions, ["decision_date"])
+    assert len(fetched) == 2
+    mirror.ensure(conn, partitions, ["date_of_registration"])
+    assert fetched[2:] == [["date_of_registration", "decision_date"]] * 2
+    # A narrower request is served by the widened copy
+    mirror.ensure(conn, partitions, ["decision_date"])
+    assert len(fetched) == 4
+
+
+def test_eviction_spares_the_current_request_and_recent_partitions(court_tree, tmp_path, conn):
+    mirror = mirror_for(court_tree, tmp_path, max_bytes=1, min_age=0)
+    first = mirror.select(conn, [{"years": (2019, 2019), "courts": ("33_10",)}])
+    second = mirror.select(conn, [{"years": (2020, 2020), "courts": ("33_10",)}])
+
+    paths = mirror.ensure(conn, first, ["decision_date"])
+    # Over budget, but everything this request fetched stays until it is done
+    assert all(os.path.exists(path) for path in paths)
+    mirror.ensure(conn, second, ["decision_date"])
+    assert not any(os.path.exists(path) for path in paths)
+    # Their lock files go with them rather than piling up in the mirror
+    assert not any(os.path.exists(path + ".lock") for path in paths)
+    assert sorted(mirror._load_index()) == second
+
+    recent = mirror_for(court_tree, tmp_path / "recent", max_bytes=1, min_age=600)
+    recent.ensure(conn, first, ["decision_date"])
+    recent.ensure(conn, second, ["decision_date"])
+    assert sorted(recent._load_index()) == sorted(first + second)
+
+
+def test_concurrent_ensure_fetches_each_partition_once(court_tree, tmp_path, monkeypatch):
+    mirror = mirror_for(court_tree, tmp_path)
+    fetched = []
+    fetch = PartitionMirror._fetch
+    monkeypatch.setattr(PartitionMirror, "_fetch",
+                        lambda self, conn, rel, columns: fetched.append(rel) or fetch(self, conn, rel, columns))
+    with duckdb.connect() as setup:
+        partitions = mirror.select(setup, [{"years": (2021, 2023), "courts": ("33_10",)}])
+    errors = []
+
+    def request():
+        # Each worker has its own mirror object, as separate processes would
+        worker = mirror_for(court_tree, tmp_path)
+        try:
+            with duckdb.connect() as conn:
+                worker.ensure(conn, partitions, ["court", "decision_date"])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=request) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(fetched) == sorted(partitions)
+    assert sorted(mirror._load_index()) == sorted(partitions)
+    assert glob.glob(str(tmp_path / "mirror" / "**" / "*.part"), recursive=True) == []
+    assert glob.glob(str(tmp_path / "mirror" / ".index-*")) == []
+
+
+def _ensure_in_process(court_tree, root, partitions):
+    """Run ensure from two threads of a fresh process; returns how many partitions it fetched"""
+    mirror = PartitionMirror(root=root, source_root=court_tree)
+    fetched = []
+    fetch = mirror._fetch
+    mirror._fetch = lambda conn, rel, columns: fetched.append(rel) or fetch(conn, rel, columns)
+
+    def request():
+        with duckdb.connect() as conn:
+            mirror.ensure(conn, partitions, ["decision_date"])
+
+    threads = [threading.Thread(target=request) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(fetched)
+
+
+def test_concurrent_processes_share_one_mirror(court_tree, tmp_path, conn):
+    root = str(tmp_path / "mirror")
+    partitions = PartitionMirror(root=root, source_root=court_tree).select(conn, [{"years": (2019, 2020)}])
+    with multiprocessing.get_context("spawn").Pool(3) as pool:
+        fetched = pool.starmap(_ensure_in_process, [(court_tree, root, partitions)] * 3)
+
+    assert sum(fetched) == len(partitions)
+    assert sorted(PartitionMirror(root=root, source_root=court_tree)._load_index()) == partitions
+    assert glob.glob(os.path.join(root, "**", "*.part"), recursive=True) == []
+
+
+@pytest.mark.parametrize("columns", [["court"], ["year", "bench"]])
+def test_partition_columns_only_still_count_rows(court_tree, tmp_path, conn, columns):
+    mirror = mirror_for(court_tree, tmp_path)
+    relation = mirror.relation(conn, [{"years": (2022, 2022)}], columns)
+    count = conn.execute(f"SELECT count(*) FROM {relation}").fetchone()[0]
+    expected = conn.execute(
+        f"SELECT count(*) FROM read_parquet('{court_tree}/year=2022/*/*/metadata.parquet')"
+    ).fetchone()[0]
+    assert count == expected > 0
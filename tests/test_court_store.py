@@ -0,0 +1,95 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from utils.court import DELAY_DAYS, build_court_summary, delay_by_year, delay_regression, top_court
+from utils.court_mirror import PartitionMirror
+from utils.court_store import ROWS_VIEW, CourtSummaryStore
+
+
+@pytest.fixture
+def source(court_tree, tmp_path):
+    """A copy of the tree that a test may add partitions to"""
+    root = str(tmp_path / "src")
+    shutil.copytree(court_tree, root)
+    return root
+
+
+def store_for(source, tmp_path):
+    return CourtSummaryStore(path=str(tmp_path / "store" / "stats.parquet"), source_root=source, listing_ttl=0)
+
+
+def raw(source):
+    return f"read_parquet('{source}/*/*/*/metadata.parquet', hive_partitioning = true)"
+
+
+def test_summary_matches_a_full_scan(source, tmp_path, conn):
+    store = store_for(source, tmp_path)
+    assert store.refresh(conn) == 30
+    store.load_summary(conn)
+    columns = "court, year, n_cases, delay_sum, delay_count"
+    summary = conn.execute(f"SELECT {columns} FROM court_summary ORDER BY ALL").fetchall()
+
+    build_court_summary(conn, f"(SELECT * FROM {raw(source)})", table="scanned")
+    assert summary == conn.execute(f"SELECT {columns} FROM scanned ORDER BY ALL").fetchall()
+
+
+def test_refresh_scans_only_new_partitions(source, tmp_path, conn):
+    store = store_for(source, tmp_path)
+    store.refresh(conn)
+    # Persisted: a fresh store (a restarted worker) has nothing to rescan
+    assert store_for(source, tmp_path).refresh(conn) == 0
+
+    added = os.path.join(source, "year=2024", "court=33_10", "bench=b1")
+    os.makedirs(added)
+    shutil.copy(os.path.join(source, "year=2023", "court=33_10", "bench=b1", "metadata.parquet"), added)
+    assert store.refresh(conn) == 1
+
+    store.load_summary(conn, [{"courts": ("33_10",)}])
+    n_cases = conn.execute("SELECT n_cases FROM court_summary WHERE year = 2024").fetchone()[0]
+    assert n_cases == conn.execute(f"SELECT count(*) FROM read_parquet('{added}/metadata.parquet')").fetchone()[0]
+
+
+def test_scoped_refresh_and_questions(source, tmp_path, conn):
+    store = store_for(source, tmp_path)
+    assert store.refresh(conn, [{"courts": ("33_10",)}]) == 10
+    assert {court for _, court, _ in store.known_partitions(conn)} == {"33_10"}
+    # The other courts' 2019-2022 partitions are added when a question needs them
+    assert store.refresh(conn, [{"years": (2019, 2022)}]) == 16
+
+    store.load_summary(conn, [{"years": (2019, 2022)}, {"courts": ("33_10",)}])
+    expected_top = conn.execute(
+        f"SELECT court FROM {raw(source)} WHERE year BETWEEN 2019 AND 2022 GROUP BY court ORDER BY count(*) DESC LIMIT 1"
+    ).fetchone()[0]
+    assert top_court(conn, 2019, 2022) == expected_top
+
+    years, delays = delay_by_year(conn, "33_10")
+    expected = conn.execute(
+        f"SELECT year, avg({DELAY_DAYS}) FROM {raw(source)} WHERE court = '33_10' GROUP BY year ORDER BY year"
+    ).fetchall()
+    assert list(years) == [year for year, _ in expected]
+    np.testing.assert_allclose(delays, [delay for _, delay in expected])
+    slope, _ = delay_regression(conn, "33_10")
+    assert slope > 0
+
+
+def test_load_summary_does_not_keep_the_rows_registered(source, tmp_path, conn):
+    store = store_for(source, tmp_path)
+    store.refresh(conn)
+    store.load_summary(conn)
+    views = conn.execute("SELECT view_name FROM duckdb_views() WHERE NOT internal").fetchall()
+    assert (ROWS_VIEW,) not in views
+
+
+def test_refresh_through_the_mirror(source, tmp_path, conn, monkeypatch):
+    mirror = PartitionMirror(root=str(tmp_path / "mirror"), source_root=source)
+    monkeypatch.setattr("utils.court_store.get_mirror", lambda: mirror)
+    store = store_for(source, tmp_path)
+    assert store.refresh(conn, [{"courts": ("33_10",)}]) == 10
+    assert len(mirror._load_index()) == 10
+
+    store.load_summary(conn, [{"courts": ("33_10",)}])
+    total = conn.execute("SELECT sum(n_cases) FROM court_summary").fetchone()[0]
+    assert total == conn.execute(f"SELECT count(*) FROM {raw(source)} WHERE court = '33_10'").fetchone()[0]
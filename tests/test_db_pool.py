@@ -0,0 +1,74 @@
+import pytest
+
+from utils.db_pool import DuckDBPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = DuckDBPool(size=2, extensions=(), settings={"temp_directory": str(tmp_path)}, lease_timeout=0.2)
+    yield pool
+    pool.close()
+
+
+def failing_once(pool, monkeypatch):
+    """Make the pool's next connect fail, as an offline httpfs install would"""
+    connect = pool._connect
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("extension install failed")
+        return connect()
+
+    monkeypatch.setattr(pool, "_connect", flaky)
+
+
+def test_leases_reuse_warmed_connections(pool):
+    pool.warm()
+    assert pool.stats()["open"] == pool.stats()["idle"] == 2
+    with pool.lease() as conn:
+        first = conn
+    with pool.lease() as conn:
+        assert conn is first
+    assert pool.stats()["created"] == 2
+
+
+def test_leases_beyond_the_size_wait_then_time_out(pool):
+    with pool.lease(), pool.lease():
+        with pytest.raises(TimeoutError):
+            with pool.lease():
+                pass
+    assert pool.stats()["open"] == 2
+
+
+def test_failed_warm_up_gives_its_slot_back(pool, monkeypatch):
+    failing_once(pool, monkeypatch)
+    with pytest.raises(RuntimeError):
+        pool.warm()
+    assert pool.stats()["open"] == 0
+    pool.warm()
+    assert pool.stats()["open"] == pool.stats()["idle"] == 2
+
+
+def test_failed_connect_on_lease_gives_its_slot_back(pool, monkeypatch):
+    failing_once(pool, monkeypatch)
+    with pytest.raises(RuntimeError):
+        with pool.lease():
+            pass
+    with pool.lease(), pool.lease():
+        assert pool.stats()["open"] == 2
+
+
+def test_failed_reconnect_gives_its_slot_back(pool, monkeypatch):
+    pool.warm(1)
+    with pool.lease() as conn:
+        broken = conn
+    broken.close()
+    failing_once(pool, monkeypatch)
+    with pytest.raises(RuntimeError):
+        with pool.lease():
+            pass
+    assert pool.stats()["open"] == 0
+    with pool.lease(), pool.lease():
+        assert pool.stats()["open"] == 2
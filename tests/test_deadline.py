@@ -0,0 +1,149 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from utils import deadline as deadline_module
+from utils.deadline import Deadline, StageRunner, run_stage, run_stage_async
+
+
+def test_budget_is_shared_out_after_the_reserve():
+    deadline = Deadline(budget=10, reserve=2)
+    assert 7.9 < deadline.remaining() <= 8
+    assert deadline.share(0.5) == pytest.approx(deadline.remaining() / 2, abs=0.01)
+    assert deadline.share(2) <= 8 and deadline.share(-1) == 0
+    assert not deadline.expired() and Deadline(budget=1, reserve=2).expired()
+
+
+def test_marks_keep_the_first_reason_per_position():
+    deadline = Deadline(budget=10, reserve=0)
+    assert deadline.header() is None
+    deadline.mark([0, 2], "cached summary")
+    deadline.mark([2], "low-resolution plot")
+    assert json.loads(deadline.header()) == {"0": "cached summary", "2": "cached summary"}
+
+
+def test_without_a_deadline_the_stage_runs_inline():
+    caller = threading.current_thread()
+    assert run_stage(None, lambda: threading.current_thread() is caller, 0.5, lambda: "fallback") is True
+
+
+def test_stage_within_its_share():
+    deadline = Deadline(budget=10, reserve=0)
+    assert run_stage(deadline, lambda: "full", 0.5, lambda: "fallback", positions=[1]) == "full"
+    assert deadline.degraded == {}
+
+
+def test_overrun_falls_back_and_marks_the_answers():
+    deadline = Deadline(budget=0.2, reserve=0)
+    release = threading.Event()
+    result = run_stage(deadline, lambda: release.wait(5) and "full", 0.5, lambda: "fallback",
+                       positions=[0, 1], reason="cached page")
+    release.set()
+    assert result == "fallback"
+    assert deadline.degraded == {0: "cached page", 1: "cached page"}
+
+
+def test_interrupted_query_unwinds_before_the_fallback(conn):
+    deadline = Deadline(budget=0.3, reserve=0)
+    unwound = threading.Event()
+
+    def scan():
+        try:
+            return conn.execute("SELECT count(*) FROM range(100000000000) a").fetchone()
+        finally:
+            unwound.set()
+
+    def fallback():
+        # The stage let go of the connection before the fallback runs on it
+        assert unwound.is_set()
+        return conn.execute("SELECT 42").fetchone()[0]
+
+    started = time.monotonic()
+    assert run_stage(deadline, scan, 1.0, fallback, positions=[0], interrupt=conn.interrupt, grace=5) == 42
+    assert time.monotonic() - started < 5
+    assert 0 in deadline.degraded
+
+
+def test_busy_runner_refuses_and_falls_back_at_once(monkeypatch):
+    runner = StageRunner(workers=1)
+    monkeypatch.setattr(deadline_module, "get_stage_runner", lambda: runner)
+    release = threading.Event()
+    blocker = runner.start(lambda: release.wait(5))
+    deadline = Deadline(budget=10, reserve=0)
+    try:
+        started = time.monotonic()
+        assert run_stage(deadline, lambda: "full", 0.5, lambda: "fallback", positions=[3], reason="busy") == "fallback"
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+        blocker.result(5)
+    assert deadline.degraded == {3: "busy"}
+    assert runner.stats()["refused"] == 1
+    assert run_stage(deadline, lambda: "full", 0.5, lambda: "fallback") == "full"
+
+
+def test_async_stage_falls_back_on_overrun():
+    async def slow():
+        await asyncio.sleep(5)
+        return "full"
+
+    async def fast():
+        return "full"
+
+    async def main():
+        deadline = Deadline(budget=0.2, reserve=0)
+        slow_result = await run_stage_async(deadline, slow(), 0.5, lambda: "fallback", positions=[2])
+        fast_result = await run_stage_async(Deadline(budget=10, reserve=0), fast(), 0.5, lambda: "fallback")
+        return slow_result, fast_result, deadline.degraded
+
+    assert asyncio.run(main()) == ("fallback", "full", {2: "timeout"})
+
+
+def test_default_answers_take_the_shape_of_the_task():
+    from utils.encoder import FALLBACK_PLOT
+    from utils.tasks import COURT_QUESTIONS, default_answers
+
+    court = default_answers("\n".join(COURT_QUESTIONS))
+    assert list(court) == list(COURT_QUESTIONS) and court[COURT_QUESTIONS[2]] == FALLBACK_PLOT
+    movies = default_answers("Scrape the list of highest-grossing films from Wikipedia")
+    assert isinstance(movies, list) and len(movies) == 4
+    generic = default_answers("Summarise this")
+    assert set(generic) == {"analysis", "data", "visualization"} and generic["visualization"] == FALLBACK_PLOT
+
+
+@pytest.fixture
+def stuck():
+    """Set to let a request held past its deadline finish"""
+    release = threading.Event()
+    yield release
+    release.set()
+
+
+def test_court_task_over_its_deadline_gets_court_answers_from_flask(monkeypatch, stuck):
+    import app as flask_app
+    from utils.tasks import COURT_QUESTIONS
+
+    monkeypatch.setenv("REQUEST_DEADLINE", "0.3")
+    monkeypatch.setenv("REQUEST_DEADLINE_RESERVE", "0")
+    monkeypatch.setattr(flask_app.agent, "process_request", lambda *args: stuck.wait(10))
+    response = flask_app.app.test_client().post("/api/", data="\n".join(COURT_QUESTIONS) + "\n# deadline test")
+    assert set(response.get_json()) == set(COURT_QUESTIONS)
+    assert json.loads(response.headers["X-Degraded"]) == {"*": "deadline"}
+
+
+def test_court_task_over_its_deadline_gets_court_answers_from_the_pipeline(monkeypatch):
+    from utils import agent
+    from utils.tasks import COURT_QUESTIONS
+
+    class Stuck:
+        async def run(self, question, deadline=None, attachments=()):
+            await asyncio.sleep(10)
+
+    monkeypatch.setattr(agent, "get_pipeline", lambda: Stuck())
+    deadline = Deadline(budget=0.3, reserve=0)
+    answers = asyncio.run(agent.process_question("\n".join(COURT_QUESTIONS), deadline))
+    assert list(answers) == list(COURT_QUESTIONS)
+    assert deadline.degraded == {"*": "deadline"}
@@ -0,0 +1,54 @@
+import base64
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils.encoder import FALLBACK_PLOT, byte_budget, encode_image
+from utils.render import render_plot, render_plot_report
+
+
+def noise(width=800, height=500):
+    """An image that barely compresses, so every budget below its size is hard"""
+    pixels = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return Image.fromarray(pixels)
+
+
+def decoded(uri):
+    header, data = uri.split(",", 1)
+    return header, Image.open(io.BytesIO(base64.b64decode(data)))
+
+
+def test_byte_budget_accounts_for_prefix_and_base64():
+    assert byte_budget(100_000, "png") == (100_000 - len("data:image/png;base64,")) // 4 * 3
+
+
+def test_small_images_are_kept_at_full_resolution():
+    uri, report = encode_image(Image.new("RGB", (200, 100), "white"))
+    assert report["within_budget"] and report["scale"] == 1.0 and report["format"] == "png"
+    assert decoded(uri)[1].size == (200, 100)
+
+
+@pytest.mark.parametrize("max_chars", [100_000, 30_000])
+def test_large_images_shrink_into_the_budget(max_chars):
+    uri, report = encode_image(noise(), max_chars=max_chars)
+    assert report["within_budget"]
+    assert len(uri) == report["uri_length"] <= max_chars
+    header, image = decoded(uri)
+    assert header == f"data:image/{report['format']};base64"
+    assert image.width < 800
+
+
+def test_impossible_budget_is_reported():
+    _, report = encode_image(noise(), max_chars=50)
+    assert not report["within_budget"]
+    assert report["uri_length"] > 50
+
+
+def test_render_plot_within_and_over_budget():
+    spec = {"kind": "scatter_fit", "x": np.arange(1, 51), "y": np.arange(1, 51) % 7, "fit": None}
+    uri, report = render_plot_report(spec)
+    assert report["within_budget"] and uri.startswith("data:image/")
+    assert render_plot({**spec, "max_chars": 50}) == FALLBACK_PLOT
+
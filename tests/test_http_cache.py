@@ -0,0 +1,45 @@
+import pytest
+import requests
+
+from utils.http_cache import HttpCache
+
+
+def test_fresh_copies_are_served_without_a_request(films_page, tmp_path):
+    cache = HttpCache(cache_dir=str(tmp_path), ttl=3600)
+    first = cache.get(films_page.url)
+    second = cache.get(films_page.url)
+    assert (first.source, second.source) == ("network", "cache")
+    assert second.content == films_page.body
+    assert films_page.requests == [None]
+
+
+def test_expired_copies_are_revalidated_with_their_etag(films_page, tmp_path):
+    cache = HttpCache(cache_dir=str(tmp_path), ttl=0)
+    first = cache.get(films_page.url)
+    revalidated = cache.get(films_page.url)
+    assert revalidated.source == "revalidated"
+    assert revalidated.content == first.content
+    assert revalidated.content_hash == first.content_hash
+    assert films_page.requests[1] is not None
+    assert cache.stats()["revalidated"] == 1
+
+
+def test_a_changed_page_is_downloaded_again(films_page, tmp_path):
+    cache = HttpCache(cache_dir=str(tmp_path), ttl=0)
+    first = cache.get(films_page.url)
+    films_page.body = films_page.body.replace(b"Avatar", b"Avatar (re-release)")
+    changed = cache.get(films_page.url)
+    assert changed.source == "network"
+    assert changed.content_hash != first.content_hash
+    assert b"Avatar (re-release)" in changed.content
+
+
+def test_stale_copy_when_the_site_is_down_and_offline_misses(films_page, tmp_path):
+    cache = HttpCache(cache_dir=str(tmp_path), ttl=0, timeout=2)
+    cache.get(films_page.url)
+    films_page.close()
+    assert cache.get(films_page.url).source == "stale"
+    # Offline serves whatever is cached, and fails fast on what is not
+    assert cache.get(films_page.url, offline=True).source == "cache"
+    with pytest.raises(requests.ConnectionError):
+        cache.get(films_page.url + "?other", offline=True)
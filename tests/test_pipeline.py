@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+
+import duckdb
+
+from utils import pipeline, tasks
+from utils.deadline import Deadline
+from utils.pipeline import Pipeline
+from utils.tasks import COURT_QUESTIONS
+
+
+class OnePool:
+    """One connection leased at a time, counting the leases still out"""
+
+    def __init__(self):
+        self.conn = duckdb.connect()
+        self.out = 0
+
+    @contextmanager
+    def lease(self):
+        self.out += 1
+        try:
+            yield self.conn
+        finally:
+            self.out -= 1
+
+
+def test_court_summary_over_its_deadline_is_interrupted(monkeypatch):
+    pool = OnePool()
+    scanning = threading.Event()
+    unwound = threading.Event()
+
+    def full_scan(conn, scopes, refresh=True):
+        # Stands in for build_court_summary over the remote relation (COURT_STORE=0)
+        scanning.set()
+        try:
+            conn.execute("SELECT count(*) FROM range(100000000000) a").fetchone()
+        finally:
+            unwound.set()
+
+    monkeypatch.setattr(tasks, "get_pool", lambda: pool)
+    monkeypatch.setattr(tasks, "load_court_summary", full_scan)
+    monkeypatch.setattr(pipeline, "refresh_court_store", lambda scopes, on_lease=None: 0)
+    runner = Pipeline(io_workers=2, db_workers=2)
+    deadline = Deadline(budget=1.5, reserve=0)
+
+    async def answers():
+        return [pair async for pair in runner.court(deadline=deadline)]
+
+    started = time.monotonic()
+    try:
+        pairs = asyncio.run(answers())
+    finally:
+        runner.close()
+    assert scanning.is_set() and unwound.is_set()
+    assert time.monotonic() - started < 5
+    assert pool.out == 0
+    assert [question for question, _ in pairs] == list(COURT_QUESTIONS)
+    assert pairs[0][1] == "33_10"
+    assert deadline.degraded[0] == "default answers"
@@ -0,0 +1,86 @@
+import pytest
+
+from utils.planner import (
+    CORRELATION,
+    COUNT,
+    COURT,
+    EARLIEST,
+    MOVIES,
+    PLOT,
+    SLOPE,
+    TOP,
+    PlanCache,
+    needed_columns,
+    needed_scopes,
+    plans_dataset,
+    run_plan,
+    split_questions,
+    template,
+)
+from utils.scraper import clean_movies_data
+from utils.stats import register_frame
+from utils.table_extract import extract_table
+from utils.tasks import COURT_QUESTIONS
+
+
+def test_split_questions(movie_task):
+    assert len(split_questions(movie_task)) == 4
+    # A numbered item carries on over its indented lines
+    assert split_questions(movie_task)[3].endswith("under 100,000 bytes.")
+    keys = '{\n  "Which court?": "...",\n  "What slope?": "..."\n}'
+    assert split_questions(keys) == ["Which court?", "What slope?"]
+    assert split_questions("Intro line\nWhat is it?\nand this?") == ["What is it?", "and this?"]
+
+
+def test_template_lifts_literals():
+    key, literals = template("How many $2 bn movies were released before 2020?")
+    other, other_literals = template("how many films released before 2010 grossed $1 billion")
+    assert literals["amount"] == [2e9] and literals["year"] == [2020]
+    assert other_literals["amount"] == [1e9] and other_literals["year"] == [2010]
+    assert "<amount>" in key and "<year>" in key and "2020" not in key
+
+
+def test_movie_task_plans(movie_task):
+    compiled = PlanCache().compile(split_questions(movie_task))
+    plans = [plan for _, plan in compiled]
+    assert [plan.op for plan in plans] == [COUNT, EARLIEST, CORRELATION, PLOT]
+    assert plans_dataset(compiled) == MOVIES
+    assert plans[0].params["args"] == [2e9, 2020]
+    assert plans[1].params["args"] == [1.5e9]
+    assert plans[3].params["fit"] and (plans[3].params["x"], plans[3].params["y"]) == ("Rank", "Peak")
+    assert set(needed_columns(compiled)) == {"Worldwide_Gross", "Year", "Title", "Rank", "Peak"}
+
+
+def test_court_plot_reuses_the_court_above():
+    compiled = PlanCache().compile(COURT_QUESTIONS)
+    top, slope, plot = (plan for _, plan in compiled)
+    assert (top.op, slope.op, plot.op) == (TOP, SLOPE, PLOT)
+    assert plans_dataset(compiled) == COURT
+    assert top.params == {"start": 2019, "end": 2022}
+    assert plot.params["court"] == slope.params["court"] == "33_10"
+    assert needed_scopes(compiled) == ({"years": (2019, 2022)}, {"courts": ("33_10",)})
+
+
+def test_reworded_questions_hit_the_cache():
+    cache = PlanCache()
+    first, = cache.compile(["How many $2 bn movies were released before 2020?"])
+    second, = cache.compile(["How many $1 bn films were released before 2010?"])
+    assert cache.stats() == {"hits": 1, "misses": 1, "templates": 1}
+    assert second[1].params["args"] == [1e9, 2010] != first[1].params["args"]
+
+
+def test_unrecognized_questions_compile_to_none():
+    compiled = PlanCache().compile(["What is the meaning of life?", "How many $2 bn movies were released before 2020?"])
+    assert compiled[0][1] is None
+    assert plans_dataset(compiled) is None
+    # A recognized template missing its literal does not bind either
+    assert PlanCache().compile(["What's the regression slope of the delay by year in the court?"])[0][1] is None
+
+
+def test_run_plan_on_the_films_table(films_html, movie_task, conn):
+    df = clean_movies_data(extract_table(films_html, required_headers=("Rank", "Peak")))
+    register_frame(conn, MOVIES, df)
+    count, earliest, corr, _ = (plan for _, plan in PlanCache().compile(split_questions(movie_task)))
+    assert run_plan(conn, count) == 5
+    assert run_plan(conn, earliest) == "Titanic"
+    assert run_plan(conn, corr) == pytest.approx(0.409353, abs=1e-6)
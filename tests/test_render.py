@@ -0,0 +1,43 @@
+import threading
+
+import numpy as np
+import pytest
+
+from utils.render import RenderService, _template, drawn, plot_options, render_plot
+
+SPEC = {"kind": "scatter_fit", "x": np.arange(1, 51), "y": np.arange(1, 51) % 7, "fit": None}
+
+
+def test_reused_template_renders_the_same_plot_again():
+    first = render_plot(SPEC)
+    render_plot({**SPEC, "y": np.arange(1, 51) % 3, "title": "Other"})
+    assert render_plot(SPEC) == first
+
+
+def test_failed_draw_leaves_the_template_clean():
+    options = plot_options({"kind": "scatter_fit", "x": [1, 2, 3], "y": [1, 2, 3], "fit": None})
+    _, ax = _template(options["kind"], options["figsize"])
+    before = len(ax.get_children())
+    with pytest.raises(RuntimeError):
+        with drawn(options):
+            raise RuntimeError("encoding failed")
+    assert len(ax.get_children()) == before
+
+
+def test_concurrent_inline_renders_do_not_share_figures():
+    expected = render_plot(SPEC)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(render_plot(SPEC))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [expected] * 4
+
+
+def test_pool_renders_match_inline_renders():
+    service = RenderService(workers=1)
+    try:
+        assert service.render(SPEC, timeout=60) == render_plot(SPEC)
+    finally:
+        service.close()
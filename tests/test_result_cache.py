@@ -0,0 +1,132 @@
+import asyncio
+import io
+import threading
+import time
+
+from utils.result_cache import ResultCache, fingerprint, normalize_task
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_normalized_tasks_share_a_fingerprint():
+    assert normalize_task("﻿How many?\r\n\r\n  Which one? ".encode("utf-8")) == "How many? Which one?"
+    assert fingerprint("How many?\r\nWhich one?") == fingerprint("How many?\n  Which one?\n")
+    assert fingerprint("How many?") != fingerprint("How many films?")
+
+
+def test_fingerprint_covers_attachments_and_rewinds_them(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_bytes(b"a,b\n1,2\n")
+    upload = io.BytesIO(b"a,b\n1,2\n")
+    upload.seek(0)
+    key = fingerprint("Summarise", [("data.csv", upload)])
+    assert upload.tell() == 0
+    assert key == fingerprint("Summarise", [("data.csv", b"a,b\n1,2\n")]) == fingerprint("Summarise", [("data.csv", str(path))])
+    assert key != fingerprint("Summarise", [("data.csv", b"a,b\n1,3\n")])
+    assert key != fingerprint("Summarise")
+
+
+def run_concurrently(cache, key, compute, callers=5, cacheable=None):
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(cache.get_or_compute(key, compute, cacheable))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def test_concurrent_misses_compute_once():
+    cache = ResultCache(ttl=60, max_bytes=1 << 20)
+    release, calls = threading.Event(), []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return [1, "Titanic"]
+
+    threads, results, _ = run_concurrently(cache, "task", compute)
+    wait_for(lambda: cache.stats()["coalesced"] == 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1 and results == [[1, "Titanic"]] * 5
+    assert cache.get_or_compute("task", compute) == [1, "Titanic"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_errors_reach_waiters_and_are_not_cached():
+    cache = ResultCache(ttl=60, max_bytes=1 << 20)
+    release = threading.Event()
+
+    def compute():
+        release.wait(5)
+        raise ValueError("scrape failed")
+
+    threads, _, errors = run_concurrently(cache, "task", compute, callers=3)
+    wait_for(lambda: cache.stats()["coalesced"] == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert [str(e) for e in errors] == ["scrape failed"] * 3
+    assert cache.get_or_compute("task", lambda: "recovered") == "recovered"
+
+
+def test_uncacheable_results_are_shared_but_not_stored():
+    cache = ResultCache(ttl=60, max_bytes=1 << 20)
+    assert cache.get_or_compute("task", lambda: "degraded", cacheable=lambda value: value != "degraded") == "degraded"
+    assert cache.get("task") is None
+    assert cache.get_or_compute("task", lambda: "full") == "full"
+    assert cache.get("task") == "full"
+
+
+def test_entries_expire_and_the_oldest_are_evicted():
+    cache = ResultCache(ttl=0.05, max_bytes=1 << 20)
+    cache.put("a", "x")
+    time.sleep(0.06)
+    assert cache.get("a") is None and cache.stats()["expired"] == 1
+
+    cache = ResultCache(ttl=60, max_bytes=25)
+    cache.put("a", "x" * 8)
+    cache.put("b", "y" * 8)
+    cache.get("a")
+    cache.put("c", "z" * 8)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("x" * 8, None, "z" * 8)
+    assert cache.stats()["evictions"] == 1
+    # Larger than the whole cache: never stored
+    cache.put("d", "w" * 100)
+    assert cache.get("d") is None
+
+
+def test_disabled_cache_always_computes():
+    cache = ResultCache(ttl=0, max_bytes=1 << 20)
+    calls = []
+    for _ in range(2):
+        cache.get_or_compute("task", lambda: calls.append(1))
+    assert len(calls) == 2
+
+
+def test_async_callers_coalesce():
+    cache = ResultCache(ttl=60, max_bytes=1 << 20)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute_async("task", compute) for _ in range(4)))
+
+    assert asyncio.run(main()) == ["answer"] * 4
+    assert len(calls) == 1 and cache.stats()["coalesced"] == 3
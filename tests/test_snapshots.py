@@ -0,0 +1,75 @@
+import os
+import threading
+
+import pandas as pd
+
+from utils import snapshots
+from utils.http_cache import HttpCache
+from utils.scraper import parse_movies_page
+from utils.snapshots import SnapshotStore, cached_table
+
+
+def test_snapshots_round_trip_and_keep_the_newest_versions(tmp_path):
+    store = SnapshotStore(root=str(tmp_path), keep=2)
+    df = pd.DataFrame({"Rank": pd.array([1, 2], dtype="UInt8"), "Title": ["Avatar", "Titanic"]})
+    paths = []
+    for i in range(3):
+        paths.append(store.save("http://films", f"hash{i}", df))
+        # Set the mtimes apart: saving keeps the newest by modification time
+        os.utime(paths[-1], (1000 + i, 1000 + i))
+    assert [os.path.exists(path) for path in paths] == [False, True, True]
+
+    loaded = SnapshotStore(root=str(tmp_path)).load("http://films", "hash2")
+    pd.testing.assert_frame_equal(loaded, df)
+    assert SnapshotStore(root=str(tmp_path)).load("http://films", "hash0") is None
+
+
+def test_cleaned_table_is_rebuilt_only_when_the_page_changes(films_page, tmp_path, monkeypatch):
+    cache = HttpCache(cache_dir=str(tmp_path / "http"), ttl=0)
+    store = SnapshotStore(root=str(tmp_path / "snapshots"))
+    monkeypatch.setattr(snapshots, "fetch", cache.get)
+    monkeypatch.setattr(snapshots, "get_snapshots", lambda: store)
+    builds = []
+
+    def build(response):
+        builds.append(response.source)
+        return parse_movies_page(response)
+
+    df = cached_table(films_page.url, build, kind="movies")
+    assert list(df["Title"][:2]) == ["Avatar", "Avengers: Endgame"]
+    assert cached_table(films_page.url, build, kind="movies") is df
+    # A fresh store (another worker) reads the snapshot from disk instead of parsing
+    monkeypatch.setattr(snapshots, "get_snapshots", lambda: SnapshotStore(root=str(tmp_path / "snapshots")))
+    assert cached_table(films_page.url, build, kind="movies").equals(df)
+    assert builds == ["network"]
+
+    films_page.body = films_page.body.replace(b"Avatar", b"Avatar (re-release)", 1)
+    assert cached_table(films_page.url, build, kind="movies") is not None
+    assert builds == ["network", "network"]
+
+
+def test_concurrent_saves_of_one_snapshot_do_not_collide(tmp_path):
+    store = SnapshotStore(root=str(tmp_path))
+    df = pd.DataFrame({"Rank": range(5000), "Title": ["Avatar"] * 5000})
+    paths = []
+    threads = [threading.Thread(target=lambda: paths.append(store.save("http://films", "hash", df)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(paths) == 8 and None not in paths
+    directory = os.path.dirname(paths[0])
+    assert os.listdir(directory) == [os.path.basename(paths[0])]
+    pd.testing.assert_frame_equal(SnapshotStore(root=str(tmp_path)).load("http://films", "hash"), df)
+
+
+def test_projected_loads_convert_only_their_columns(tmp_path):
+    df = pd.DataFrame({"Rank": [1, 2], "Title": ["Avatar", "Titanic"], "Year": [2009, 1997]})
+    SnapshotStore(root=str(tmp_path)).save("http://films", "hash", df)
+    store = SnapshotStore(root=str(tmp_path))
+    projected = store.load("http://films", "hash", columns=["Title", "Year"])
+    assert list(projected.columns) == ["Title", "Year"]
+    assert store.load("http://films", "hash", columns=["Title", "Year"]) is projected
+    pd.testing.assert_frame_equal(store.load("http://films", "hash"), df)
+    assert store.load("http://films", "hash", columns=["Budget"]) is None
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+from bs4 import BeautifulSoup
+
+from utils.table_extract import extract_table, find_tables, parse_table
+
+
+def soup_table(html):
+    """The Rank/Peak table as BeautifulSoup reads it, footnote markers dropped"""
+    soup = BeautifulSoup(html, "html.parser")
+    for table in soup.find_all("table", class_="wikitable"):
+        rows = table.find_all("tr")
+        header = [cell.get_text(" ", strip=True) for cell in rows[0].find_all(["th", "td"])]
+        if "Rank" in header and "Peak" in header:
+            break
+    for sup in table.find_all("sup", class_="reference"):
+        sup.decompose()
+    body = [[cell.get_text(" ", strip=True) for cell in row.find_all(["th", "td"])] for row in rows[1:]]
+    return pd.DataFrame(body, columns=header)
+
+
+def test_matches_beautifulsoup(films_html):
+    df = extract_table(films_html, required_headers=("Rank", "Peak"))
+    expected = soup_table(films_html)
+    assert list(df.columns) == ["Rank", "Peak", "Title", "Worldwide gross", "Year", "Ref"]
+    assert len(df) == 50
+    pd.testing.assert_frame_equal(df.drop(columns="Ref"), expected.drop(columns="Ref"), check_dtype=False)
+
+
+def test_footnote_markers_can_be_kept(films_html):
+    df = extract_table(films_html, required_headers=("Rank", "Peak"), skip_footnotes=False)
+    assert df["Ref"].str.contains(r"\[").any()
+
+
+def test_missing_headers_give_none(films_html):
+    assert extract_table(films_html, required_headers=("Rank", "Budget")) is None
+    assert extract_table("<html><body><p>No tables</p></body></html>", required_headers=("Rank",)) is None
+
+
+@pytest.mark.parametrize("fragment, expected", [
+    ('<table class="wikitable"><tr><th>A</th><th>B</th></tr><tr><td>1</td><td>x</td></tr></table>',
+     {"A": ["1"], "B": ["x"]}),
+    # A cell spanning two rows fills the cell below it
+    ('<table class="wikitable"><tr><th>A</th><th>B</th></tr>'
+     '<tr><td rowspan="2">1</td><td>x</td></tr><tr><td>y</td></tr></table>',
+     {"A": ["1", "1"], "B": ["x", "y"]}),
+])
+def test_parse_table(fragment, expected):
+    (start, end), = find_tables(fragment)
+    assert parse_table(fragment[start:end]).to_dict("list") == expected
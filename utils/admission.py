@@ -0,0 +1,313 @@
+"""Admission control and the resource budget for heavy analyses.
+
+Requests are admitted per kind (court scans, movie scrapes, uploaded-data
+scans, generic answers), each with its own concurrency limit and a bounded
+FIFO wait queue. A request that finds the queue full, or waits longer than
+it may, is rejected with a ``Rejected`` carrying a Retry-After estimate, so
+a burst turns into fast 429s instead of an oversubscribed CPU or an
+out-of-memory kill.
+
+Limits and the per-request DuckDB ``memory_limit``/``threads`` and spill
+directory all come from one ``ResourceBudget``: the memory it grants is
+split across the slots that can run at once, weighted by how much each kind
+scans, so the admitted requests together stay within it.
+"""
+import asyncio
+import contextvars
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+COURT = "court"
+MOVIES = "movies"
+UPLOAD = "upload"
+GENERIC = "generic"
+KINDS = (COURT, MOVIES, UPLOAD, GENERIC)
+
+# Relative DuckDB memory per running request of each kind
+_WEIGHTS = {COURT: 4, MOVIES: 1, UPLOAD: 4, GENERIC: 1}
+
+# DuckDB limits of the admitted request running in this context, read by the pool
+_limits = contextvars.ContextVar("duckdb_limits", default=None)
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _physical_memory_mb():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return 4096
+
+
+def kind_for(dataset=None, attachments=()):
+    """Admission kind of a request from its routed dataset and uploads"""
+    if dataset in (COURT, MOVIES):
+        return dataset
+    return UPLOAD if attachments else GENERIC
+
+
+def current_limits():
+    """DuckDB settings for the admitted request in this context, or None"""
+    return _limits.get()
+
+
+class ResourceBudget:
+    """Memory, CPU and spill space shared by every admitted request"""
+
+    def __init__(self, memory_mb=None, cpus=None, spill_dir=None, spill_mb=None):
+        self.memory_mb = memory_mb or _env_int("RESOURCE_MEMORY_MB", int(_physical_memory_mb() * 0.6))
+        self.cpus = cpus or _env_int("RESOURCE_CPUS", os.cpu_count() or 1)
+        self.spill_dir = spill_dir or os.environ.get(
+            "DUCKDB_TEMP_DIR",
+            os.path.join(tempfile.gettempdir(), "data-analyst-agent", "duckdb-spill"),
+        )
+        self.spill_mb = spill_mb or _env_int("RESOURCE_SPILL_MB", 10240)
+
+    def limit(self, kind):
+        """Requests of a kind that may run at once"""
+        defaults = {
+            COURT: max(1, self.cpus // 2),
+            MOVIES: max(2, self.cpus),
+            UPLOAD: max(1, self.cpus // 2),
+            GENERIC: max(2, self.cpus * 2),
+        }
+        return max(1, _env_int(f"ADMIT_{kind.upper()}_LIMIT", defaults[kind]))
+
+    def queue(self, kind):
+        """Requests of a kind that may wait for a slot"""
+        return max(0, _env_int(f"ADMIT_{kind.upper()}_QUEUE", 2 * self.limit(kind)))
+
+    def duckdb_limits(self, kind):
+        """memory_limit/threads for one running request of a kind"""
+        weighted_slots = sum(self.limit(k) * _WEIGHTS[k] for k in KINDS)
+        memory = max(64, self.memory_mb * _WEIGHTS[kind] // weighted_slots)
+        threads = max(1, self.cpus // self.limit(kind))
+        return {"memory_limit": f"{memory}MB", "threads": threads}
+
+    def connection_settings(self, name=None, share=1):
+        """Settings a pooled connection starts with, spilling to spill_dir/<name>
+
+        Connections that share a temp_directory, in one process or across
+        prefork workers, overwrite each other's spill files, so each one gets
+        its own subdirectory and an equal share of the spill space.
+        """
+        path = os.path.join(self.spill_dir, name) if name else self.spill_dir
+        os.makedirs(path, exist_ok=True)
+        return {
+            "temp_directory": path,
+            "max_temp_directory_size": f"{max(64, self.spill_mb // share)}MB",
+        }
+
+
+class Rejected(Exception):
+    """A request turned away by admission control"""
+
+    def __init__(self, kind, reason, retry_after):
+        super().__init__(f"{kind} request rejected: {reason}")
+        self.kind = kind
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admitted request's slot; entering it applies its DuckDB limits to this context"""
+
+    def __init__(self, controller, kind, limits):
+        self.controller = controller
+        self.kind = kind
+        self.limits = limits
+        self.admitted_at = time.monotonic()
+        self._released = False
+        self._token = None
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.controller._release(self.kind, time.monotonic() - self.admitted_at)
+
+    def __enter__(self):
+        self._token = _limits.set(self.limits)
+        return self
+
+    def __exit__(self, *exc):
+        if self._token is not None:
+            try:
+                _limits.reset(self._token)
+            except ValueError:
+                # Exited from another context, e.g. a stream closed by the server
+                pass
+            self._token = None
+        self.release()
+
+
+class _Waiter:
+    def __init__(self, grant):
+        self.grant = grant
+
+
+class _Gate:
+    def __init__(self, limit, queue):
+        self.limit = limit
+        self.queue = queue
+        self.running = 0
+        self.waiters = deque()
+        self.service_seconds = None
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "timeouts": 0,
+                      "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+
+
+class AdmissionController:
+    """Per-kind concurrency limits with bounded FIFO wait queues"""
+
+    def __init__(self, budget=None, queue_timeout=None):
+        self.budget = budget or get_budget()
+        self.queue_timeout = float(os.environ.get("ADMIT_QUEUE_TIMEOUT", 30)) if queue_timeout is None else queue_timeout
+        self._gates = {kind: _Gate(self.budget.limit(kind), self.budget.queue(kind)) for kind in KINDS}
+        self._lock = threading.Lock()
+
+    def _retry_after(self, gate):
+        """Seconds until a slot is likely free, from the kind's recent service times"""
+        service = gate.service_seconds or 5.0
+        return max(1, min(120, math.ceil(service * (len(gate.waiters) + 1) / gate.limit)))
+
+    def _enter(self, kind, waiter):
+        """True if admitted now, False if queued; raises Rejected when the queue is full"""
+        with self._lock:
+            gate = self._gates[kind]
+            if gate.running < gate.limit and not gate.waiters:
+                gate.running += 1
+                gate.stats["admitted"] += 1
+                return True
+            if len(gate.waiters) >= gate.queue:
+                gate.stats["rejected"] += 1
+                raise Rejected(kind, "queue full", self._retry_after(gate))
+            gate.waiters.append(waiter)
+            gate.stats["queued"] += 1
+            return False
+
+    def _abandon(self, kind, waiter, waited, timed_out=True):
+        """Withdraw a waiter that gave up; False if it was granted a slot meanwhile"""
+        with self._lock:
+            gate = self._gates[kind]
+            try:
+                gate.waiters.remove(waiter)
+            except ValueError:
+                return False
+            if timed_out:
+                gate.stats["timeouts"] += 1
+                gate.stats["rejected"] += 1
+            return Rejected(kind, f"waited {waited:.1f}s for a slot", self._retry_after(gate))
+
+    def _admitted_after(self, kind, waited):
+        with self._lock:
+            stats = self._gates[kind].stats
+            stats["admitted"] += 1
+            stats["wait_seconds_total"] += waited
+            stats["wait_seconds_max"] = max(stats["wait_seconds_max"], waited)
+
+    def _release(self, kind, held=None):
+        with self._lock:
+            gate = self._gates[kind]
+            if held is not None:
+                previous = gate.service_seconds
+                gate.service_seconds = held if previous is None else 0.8 * previous + 0.2 * held
+            if gate.waiters:
+                # Hand the slot straight to the longest waiter
+                gate.waiters.popleft().grant()
+            else:
+                gate.running -= 1
+
+    def _timeout(self, timeout):
+        return self.queue_timeout if timeout is None else max(0.0, min(timeout, self.queue_timeout))
+
+    def acquire(self, kind, timeout=None):
+        """Ticket for a slot of kind, waiting up to timeout; raises Rejected"""
+        event = threading.Event()
+        waiter = _Waiter(event.set)
+        started = time.monotonic()
+        if not self._enter(kind, waiter):
+            if not event.wait(self._timeout(timeout)):
+                rejected = self._abandon(kind, waiter, time.monotonic() - started)
+                if rejected:
+                    raise rejected
+            self._admitted_after(kind, time.monotonic() - started)
+        return Ticket(self, kind, self.budget.duckdb_limits(kind))
+
+    async def acquire_async(self, kind, timeout=None):
+        """acquire without blocking the event loop while queued"""
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        waiter = _Waiter(grant)
+        started = time.monotonic()
+        if not self._enter(kind, waiter):
+            try:
+                await asyncio.wait_for(asyncio.shield(granted), self._timeout(timeout))
+            except asyncio.TimeoutError:
+                rejected = self._abandon(kind, waiter, time.monotonic() - started)
+                if rejected:
+                    raise rejected
+            except asyncio.CancelledError:
+                if self._abandon(kind, waiter, time.monotonic() - started, timed_out=False) is False:
+                    # Granted just as the request went away: hand the slot on
+                    self._release(kind)
+                raise
+            self._admitted_after(kind, time.monotonic() - started)
+        return Ticket(self, kind, self.budget.duckdb_limits(kind))
+
+    def admit(self, kind, timeout=None):
+        """acquire, for use as ``with controller.admit(kind):``"""
+        return self.acquire(kind, timeout)
+
+    def stats(self):
+        """Per-kind running, queue depth, admissions, rejections and wait times"""
+        with self._lock:
+            return {
+                kind: {
+                    **gate.stats,
+                    "limit": gate.limit,
+                    "queue_limit": gate.queue,
+                    "running": gate.running,
+                    "queue_depth": len(gate.waiters),
+                    "service_seconds_avg": round(gate.service_seconds or 0.0, 3),
+                }
+                for kind, gate in self._gates.items()
+            }
+
+
+_budget = None
+_controller = None
+_lock = threading.Lock()
+
+
+def get_budget():
+    """Return the process-wide resource budget, creating it on first use"""
+    global _budget
+    if _budget is None:
+        with _lock:
+            if _budget is None:
+                _budget = ResourceBudget()
+    return _budget
+
+
+def get_admission():
+    """Return the process-wide admission controller, creating it on first use"""
+    global _controller
+    if _controller is None:
+        budget = get_budget()
+        with _lock:
+            if _controller is None:
+                _controller = AdmissionController(budget)
+    return _controller
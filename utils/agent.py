@@ -1,17 +1,42 @@
-from utils.scraper import scrape_table
-from utils.analyzer import analyze_data
-from utils.visualizer import make_plot
+import asyncio
 
-async def process_question(question: str) -> list:
+from utils.admission import kind_for
+from utils.pipeline import get_pipeline
+from utils.streaming import encode_stream_async
+from utils.tasks import default_answers, route
+
+
+async def process_question(question: str, deadline=None, attachments=()):
     print("Received question:", question)  # Debug print
 
-    # Dummy response that matches expected evaluation format
-    return [
-        1,
-        "Titanic",
-        0.485782,
-        "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAUA..."  # (dummy short string)
-    ]
+    # Every blocking stage runs on an executor, so the event loop stays free
+    # for other requests while this one is in flight
+    try:
+        if deadline is None:
+            return await get_pipeline().run(question, attachments=attachments)
+        return await asyncio.wait_for(get_pipeline().run(question, deadline, attachments), deadline.remaining())
+    except asyncio.TimeoutError:
+        print("Request over its deadline, answering with defaults")
+        deadline.mark(("*",), "deadline")
+        return default_answers(question)
+    except Exception as e:
+        print(f"Error processing question: {e}")
+        if deadline is not None:
+            deadline.mark(("*",), "default answers")
+        return default_answers(question)
+
 
+def admission_kind(question: str, attachments=()):
+    """Admission kind (court, movies, upload, generic) the question will run as"""
+    return kind_for(route(question)[0], attachments)
 
 
+def stream_question(question: str, mode: str, deadline=None, attachments=()):
+    """NDJSON/SSE chunks for each answer as it is ready, then the assembled result"""
+    print("Received question (streaming):", question)  # Debug print
+    return encode_stream_async(
+        get_pipeline().stream(question, deadline, attachments),
+        mode,
+        fallback=lambda: default_answers(question),
+        deadline=deadline,
+    )
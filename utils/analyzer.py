@@ -1,5 +1,24 @@
+import pandas as pd
+
+from utils.columns import parse_columns
+from utils.db_pool import get_pool
+from utils.stats import register_frame, count_where, first_where, correlation
+
+
 def analyze_data(df):
-    ans1 = df[(df["Worldwide gross"] >= 2e9) & (df["Year"] < 2020)].shape[0]
-    ans2 = df[df["Worldwide gross"] >= 1.5e9].sort_values("Year").iloc[0]["Title"]
-    corr = df["Rank"].corr(df["Worldwide gross"])
+    """(count of $2bn films before 2020, earliest $1.5bn film, corr(Rank, gross)) for the films table
+
+    Kept for callers of the original helper; both servers answer through utils.tasks.
+    """
+    if not pd.api.types.is_numeric_dtype(df["Worldwide gross"]):
+        # Raw scraped text; snapshots from scrape_table are already parsed
+        df, _ = parse_columns(df)
+    with get_pool().lease() as conn:
+        register_frame(conn, "films", df)
+        try:
+            ans1 = count_where(conn, "films", '"Worldwide gross" >= 2e9 AND "Year" < 2020')
+            ans2 = first_where(conn, "films", "Title", "Year", '"Worldwide gross" >= 1.5e9')
+            corr = correlation(conn, "films", "Rank", "Worldwide gross")
+        finally:
+            conn.unregister("films")
     return ans1, ans2, corr
@@ -0,0 +1,183 @@
+"""Column type inference and vectorized parsing for scraped tables.
+
+Scraped cells arrive as text such as "$2,923,706,026", "F8$1.29 billion",
+"4[TS]" or "2019". ``infer_kind`` classifies a column from its name and a
+sample of its values; ``parse_column`` then converts the whole column with a
+single Arrow ``extract_regex`` (RE2, no per-cell Python) into a compact
+numeric dtype.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from utils.tracing import span
+
+CURRENCY = "currency"
+ORDINAL = "ordinal"
+YEAR = "year"
+NUMBER = "number"
+TEXT = "text"
+
+_FOOTNOTE = re.compile(r"\[[^\]]*\]")
+_CURRENCY_VALUE = re.compile(r"[$€£¥₹]\s*\d")
+_UNIT_MULTIPLIERS = {
+    "trillion": 1e12,
+    "tn": 1e12,
+    "billion": 1e9,
+    "bn": 1e9,
+    "b": 1e9,
+    "million": 1e6,
+    "mn": 1e6,
+    "m": 1e6,
+    "thousand": 1e3,
+    "k": 1e3,
+}
+# Amount after the currency symbol (skipping markers such as the "F8" in
+# "F8$1,290,000,000") plus an optional unit word, in one pass
+_AMOUNT = (
+    r"(?i)^(?:[^$€£¥₹]*[$€£¥₹])?\D*?(?P<num>\d[\d,]*(?:\.\d+)?)\s*"
+    r"(?P<unit>trillion|billion|million|thousand|tn|bn|mn|b|m|k)?\b"
+)
+_INTEGER = r"(?P<n>\d+)"
+_NUMBER = r"(?P<n>[-+]?\d+(?:\.\d+)?)"
+_YEAR = r"\b(?P<year>1[5-9]\d\d|20\d\d|2100)\b"
+
+_CURRENCY_NAMES = ("gross", "revenue", "box office", "budget", "earnings", "sales", "price")
+_ORDINAL_NAMES = ("rank", "peak", "position", "no.", "#")
+_YEAR_NAMES = ("year", "released", "release")
+
+
+def _sample(series, size=200):
+    text = series.dropna().astype(str)
+    if len(text) > size:
+        text = text.sample(size, random_state=0)
+    return text.str.replace(_FOOTNOTE, "", regex=True).str.strip()
+
+
+def has_footnotes(series):
+    """True if the column carries bracketed footnote markers like [a] or [# 1]"""
+    return bool(series.dropna().astype(str).str.contains(_FOOTNOTE, regex=True).any())
+
+
+def infer_kind(series, name=""):
+    """Classify a column as currency, ordinal, year, number or text"""
+    lowered = str(name).lower()
+    if pd.api.types.is_numeric_dtype(series):
+        if any(hint in lowered for hint in _YEAR_NAMES):
+            return YEAR
+        if any(hint in lowered for hint in _ORDINAL_NAMES):
+            return ORDINAL
+        return NUMBER
+    sample = _sample(series)
+    if sample.empty:
+        return TEXT
+    numeric = sample.str.contains(r"\d", regex=True).mean()
+    if sample.str.contains(_CURRENCY_VALUE, regex=True).mean() >= 0.5 or (
+        numeric >= 0.8 and any(hint in lowered for hint in _CURRENCY_NAMES)
+    ):
+        return CURRENCY
+    if sample.str.fullmatch(r"\D{0,3}" + _YEAR + r"\D{0,3}").mean() >= 0.8 or (
+        numeric >= 0.8 and any(hint in lowered for hint in _YEAR_NAMES)
+    ):
+        return YEAR
+    if sample.str.fullmatch(r"\d{1,6}\D{0,4}").mean() >= 0.8:
+        return ORDINAL
+    if sample.str.fullmatch(r"[-+]?\d[\d,]*(?:\.\d+)?").mean() >= 0.8:
+        return NUMBER
+    return TEXT
+
+
+def _compact_unsigned(values):
+    """Smallest nullable unsigned integer dtype that holds the values"""
+    top = values.max()
+    if pd.isna(top):
+        return values.astype("UInt8")
+    for dtype, limit in (("UInt8", 255), ("UInt16", 65535), ("UInt32", 4294967295)):
+        if top <= limit:
+            return values.astype(dtype)
+    return values.astype("UInt64")
+
+
+def _arrow_text(series):
+    if not pd.api.types.is_string_dtype(series) or series.dtype == object:
+        series = series.astype("string")
+    return pa.array(series, type=pa.large_string(), from_pandas=True)
+
+
+def _extract(text, pattern, field):
+    return pc.struct_field(pc.extract_regex(text, pattern), field)
+
+
+def _to_float(values, index):
+    return pd.Series(pc.cast(values, pa.float64()).to_numpy(zero_copy_only=False), index=index)
+
+
+_UNIT_NAMES = pa.array(list(_UNIT_MULTIPLIERS))
+_UNIT_SCALES = pa.array(list(_UNIT_MULTIPLIERS.values()), type=pa.float64())
+
+
+def parse_currency(series):
+    """Money text to float64 amounts, scaling 'billion'/'million' style units"""
+    parts = pc.extract_regex(_arrow_text(series), _AMOUNT)
+    amounts = pc.cast(pc.replace_substring(pc.struct_field(parts, "num"), ",", ""), pa.float64())
+    units = pc.index_in(pc.utf8_lower(pc.struct_field(parts, "unit")), value_set=_UNIT_NAMES)
+    scale = pc.fill_null(pc.take(_UNIT_SCALES, units), 1.0)
+    return _to_float(pc.multiply(amounts, scale), series.index)
+
+
+def parse_ordinal(series):
+    """First integer in each cell (footnotes come after it) as a compact unsigned type"""
+    values = _to_float(_extract(_arrow_text(series), _INTEGER, "n"), series.index)
+    return _compact_unsigned(values)
+
+
+def parse_year(series):
+    """Four-digit year in each cell as UInt16"""
+    return _to_float(_extract(_arrow_text(series), _YEAR, "year"), series.index).astype("UInt16")
+
+
+def parse_number(series):
+    """Plain numbers with thousands separators, downcast where lossless"""
+    text = pc.replace_substring(_arrow_text(series), ",", "")
+    values = _to_float(_extract(text, _NUMBER, "n"), series.index)
+    if values.notna().all() and (values == np.floor(values)).all():
+        return pd.to_numeric(values.astype("int64"), downcast="integer")
+    return pd.to_numeric(values, downcast="float")
+
+
+def parse_text(series):
+    """Strip footnote markers and surrounding whitespace"""
+    text = pc.utf8_trim_whitespace(pc.replace_substring_regex(_arrow_text(series), _FOOTNOTE.pattern, ""))
+    return pd.Series(text.to_pandas(types_mapper={pa.large_string(): pd.StringDtype()}.get), index=series.index)
+
+
+_PARSERS = {
+    CURRENCY: parse_currency,
+    ORDINAL: parse_ordinal,
+    YEAR: parse_year,
+    NUMBER: parse_number,
+    TEXT: parse_text,
+}
+
+
+def parse_column(series, kind):
+    """Parse one column as the given kind"""
+    if kind in (YEAR, ORDINAL, NUMBER) and pd.api.types.is_numeric_dtype(series):
+        series = series.astype("Float64")
+        return _compact_unsigned(series) if kind != NUMBER else series
+    return _PARSERS[kind](series)
+
+
+def infer_columns(df):
+    """{column: kind} for every column of df"""
+    return {col: infer_kind(df[col], col) for col in df.columns}
+
+
+def parse_columns(df, kinds=None):
+    """Copy of df with every column parsed according to its (inferred) kind"""
+    with span("clean", rows=len(df)):
+        kinds = {**infer_columns(df), **(kinds or {})}
+        return pd.DataFrame({col: parse_column(df[col], kinds[col]) for col in df.columns}), kinds
@@ -0,0 +1,190 @@
+import os
+import re
+
+from utils.density import DEFAULT_BINS, bin_relation
+from utils.stats import regression
+from utils.tracing import span
+
+COURT_DATA_ROOT = os.environ.get(
+    "COURT_DATA_ROOT", "s3://indian-high-court-judgments/metadata/parquet"
+).rstrip("/")
+COURT_DATA_FILE = os.environ.get("COURT_DATA_FILE", "metadata.parquet")
+COURT_METADATA_URL = f"{COURT_DATA_ROOT}/year=*/court=*/bench=*/{COURT_DATA_FILE}"
+
+SUMMARY_TABLE = "court_summary"
+
+PARTITION_COLUMNS = ("year", "court", "bench")
+PARTITION_RE = re.compile(r"year=(?P<year>\d+)/court=(?P<court>[^/]+)/bench=(?P<bench>[^/]+)/")
+HIVE_TYPES = "{'year': 'BIGINT', 'court': 'VARCHAR', 'bench': 'VARCHAR'}"
+
+# Only these columns are ever read; raw_html and friends stay on the server
+SUMMARY_COLUMNS = ("court", "year", "date_of_registration", "decision_date")
+
+# Partitions the standard court questions touch: every court for the
+# 2019-2022 ranking, every year for the court=33_10 delay regression.
+QUESTION_SCOPES = (
+    {"years": (2019, 2022)},
+    {"courts": ("33_10",)},
+)
+
+# date_of_registration is stored as DD-MM-YYYY text; fall back to an ISO cast
+# so both layouts give a delay instead of failing the whole scan.
+REGISTRATION_DATE = (
+    "COALESCE(TRY_STRPTIME(date_of_registration, '%d-%m-%Y')::DATE, "
+    "TRY_CAST(date_of_registration AS DATE))"
+)
+DELAY_DAYS = f"DATEDIFF('day', {REGISTRATION_DATE}, CAST(decision_date AS DATE))"
+
+_COLUMN_TYPES = {
+    "court": "VARCHAR",
+    "year": "BIGINT",
+    "bench": "VARCHAR",
+    "date_of_registration": "VARCHAR",
+    "decision_date": "DATE",
+}
+
+
+def list_partitions(conn, root=COURT_DATA_ROOT, filename=COURT_DATA_FILE):
+    """Partition files under root as {relative path: (year, court, bench)}"""
+    root = root.rstrip("/")
+    pattern = f"{root}/year=*/court=*/bench=*/{filename}"
+    listing = {}
+    for (path,) in conn.execute("SELECT file FROM glob(?)", [pattern]).fetchall():
+        match = PARTITION_RE.search(path)
+        if match:
+            key = (int(match.group("year")), match.group("court"), match.group("bench"))
+            listing[path[len(root) + 1:]] = key
+    return listing
+
+
+def scope_matches(year, court, scopes):
+    """True if a partition falls inside any scope (no scopes means all)"""
+    if not scopes:
+        return True
+    for scope in scopes:
+        years = scope.get("years")
+        courts = scope.get("courts")
+        if years and not years[0] <= year <= years[1]:
+            continue
+        if courts and court not in courts:
+            continue
+        return True
+    return False
+
+
+def scope_predicate(scopes):
+    """SQL form of the scopes, filtering only on partition columns"""
+    if not scopes:
+        return "true"
+    terms = []
+    for scope in scopes:
+        parts = []
+        if scope.get("years"):
+            start, end = scope["years"]
+            parts.append(f"year BETWEEN {int(start)} AND {int(end)}")
+        if scope.get("courts"):
+            courts = ", ".join("'" + c.replace("'", "''") + "'" for c in scope["courts"])
+            parts.append(f"court IN ({courts})")
+        terms.append("(" + " AND ".join(parts or ["true"]) + ")")
+    return " OR ".join(terms)
+
+
+def empty_relation(columns):
+    """Typed relation with no rows, for when no partition matches"""
+    cols = ", ".join(f"NULL::{_COLUMN_TYPES.get(c, 'VARCHAR')} AS {c}" for c in columns)
+    return f"(SELECT {cols} WHERE false)"
+
+
+def remote_relation(scopes=None, columns=SUMMARY_COLUMNS, source=COURT_METADATA_URL):
+    """Projected relation over the remote glob with hive partition pruning"""
+    return (
+        f"(SELECT {', '.join(columns)} FROM read_parquet('{source}', "
+        f"hive_partitioning = true, hive_types = {HIVE_TYPES}) "
+        f"WHERE {scope_predicate(scopes)})"
+    )
+
+
+def court_relation(conn, scopes=QUESTION_SCOPES, columns=SUMMARY_COLUMNS):
+    """Relation for the request's partitions, served from the local mirror when enabled"""
+    from utils.court_mirror import get_mirror
+
+    mirror = get_mirror()
+    if mirror is not None:
+        try:
+            return mirror.relation(conn, scopes, columns)
+        except Exception as e:
+            print(f"Error mirroring court partitions: {e}")
+    return remote_relation(scopes, columns)
+
+
+def build_court_summary(conn, relation=None, table=SUMMARY_TABLE):
+    """Scan the metadata once into a per (court, year) aggregate table"""
+    if relation is None:
+        relation = court_relation(conn)
+    with span("court_scan"):
+        conn.execute(f"""
+            CREATE OR REPLACE TEMP TABLE {table} AS
+            SELECT court,
+                   CAST(year AS INTEGER) AS year,
+                   COUNT(*) AS n_cases,
+                   SUM(delay) AS delay_sum,
+                   COUNT(delay) AS delay_count
+            FROM (
+                SELECT court, year, {DELAY_DAYS} AS delay
+                FROM {relation}
+            )
+            GROUP BY court, year
+        """)
+    return table
+
+
+def top_court(conn, start_year, end_year, table=SUMMARY_TABLE):
+    """Court with the most cases between two years, inclusive"""
+    with span("duckdb"):
+        row = conn.execute(f"""
+            SELECT court, SUM(n_cases) AS case_count
+            FROM {table}
+            WHERE year BETWEEN ? AND ?
+            GROUP BY court
+            ORDER BY case_count DESC
+            LIMIT 1
+        """, [start_year, end_year]).fetchone()
+    return row[0] if row else None
+
+
+def delay_by_year(conn, court, table=SUMMARY_TABLE):
+    """Average registration-to-decision delay per year for one court, as NumPy columns"""
+    with span("duckdb") as attrs:
+        columns = conn.execute(f"""
+            SELECT year, delay_sum / delay_count AS avg_delay
+            FROM {table}
+            WHERE court = ? AND delay_count > 0
+            ORDER BY year
+        """, [court]).fetchnumpy()
+        attrs["rows"] = len(columns["year"])
+    return columns["year"], columns["avg_delay"]
+
+
+def delay_regression(conn, court, table=SUMMARY_TABLE):
+    """Slope and intercept of average delay against year, fitted in DuckDB"""
+    return regression(
+        conn,
+        f"(SELECT year, delay_sum / delay_count AS avg_delay FROM {table} "
+        f"WHERE court = ? AND delay_count > 0)",
+        "year",
+        "avg_delay",
+        params=[court],
+    )
+
+
+def delay_density(conn, court, bins=DEFAULT_BINS, relation=None):
+    """Per-case delay against year for one court, binned in DuckDB, plus the fit over every case"""
+    if relation is None:
+        relation = court_relation(conn, ({"courts": (court,)},))
+    cases = (
+        f"(SELECT CAST(year AS DOUBLE) AS year, CAST({DELAY_DAYS} AS DOUBLE) AS delay "
+        f"FROM {relation} WHERE court = ?)"
+    )
+    density = bin_relation(conn, cases, "year", "delay", bins=bins, x_step=1, params=[court])
+    fit = regression(conn, cases, "year", "delay", params=[court])
+    return density, fit
@@ -0,0 +1,235 @@
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+
+from contextlib import contextmanager
+
+from utils.court import (
+    COURT_DATA_FILE,
+    COURT_DATA_ROOT,
+    HIVE_TYPES,
+    PARTITION_COLUMNS,
+    empty_relation,
+    list_partitions,
+    scope_matches,
+)
+
+
+def _env_bytes(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class PartitionMirror:
+    """On-disk LRU mirror of the court partitions requests actually touch"""
+
+    def __init__(self, root=None, max_bytes=None, source_root=COURT_DATA_ROOT,
+                 source_file=COURT_DATA_FILE, listing_ttl=3600, min_age=None):
+        self.root = root or os.environ.get(
+            "COURT_MIRROR_DIR",
+            os.path.join(tempfile.gettempdir(), "data-analyst-agent", "court-mirror"),
+        )
+        self.max_bytes = max_bytes or _env_bytes("COURT_MIRROR_MAX_BYTES", 1 << 30)
+        self.source_root = source_root.rstrip("/")
+        self.source_file = source_file
+        self.listing_ttl = listing_ttl
+        # Partitions used this recently may still be scanned by another
+        # request, here or in another worker, and are never evicted
+        self.min_age = _env_bytes("COURT_MIRROR_MIN_AGE", 600) if min_age is None else min_age
+        self._index_path = os.path.join(self.root, "index.json")
+        self._lock = threading.Lock()
+        self._listing = None
+        self._listed_at = 0.0
+        os.makedirs(self.root, exist_ok=True)
+        self._index = self._load_index()
+
+    @contextmanager
+    def _locked(self, path):
+        """Exclusive lock on path, across threads and forked workers"""
+        # flock locks belong to the open file, so threads of one process
+        # exclude each other as well as other workers do
+        while True:
+            lock_file = open(path + ".lock", "a")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Eviction unlinks the lock file of a partition it drops; a lock
+            # taken on that unlinked file no longer excludes anyone, so retry
+            if _same_file(lock_file, path + ".lock"):
+                break
+            lock_file.close()
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def _load_index(self):
+        try:
+            with open(self._index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".index-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(index, f)
+            os.replace(tmp, self._index_path)
+        except BaseException:
+            _remove(tmp)
+            raise
+
+    def _update_index(self, entries, evict=False, keep=()):
+        """Merge entries into the index on disk, which other workers also write"""
+        with self._lock, self._locked(self._index_path):
+            index = self._load_index()
+            index.update(entries)
+            if evict:
+                self._evict(index, keep)
+            self._save_index(index)
+            self._index = index
+            return index
+
+    def list_partitions(self, conn, refresh=False):
+        """Remote partition files as {relative path: (year, court, bench)}"""
+        now = time.time()
+        if self._listing is None or refresh or now - self._listed_at > self.listing_ttl:
+            self._listing = list_partitions(conn, self.source_root, self.source_file)
+            self._listed_at = now
+        return self._listing
+
+    def select(self, conn, scopes=None):
+        """Partitions whose keys fall inside any of the request scopes"""
+        return sorted(
+            rel for rel, (year, court, _) in self.list_partitions(conn).items()
+            if scope_matches(year, court, scopes)
+        )
+
+    def _fetch(self, conn, rel, columns):
+        """Copy one partition, projected to the given columns, into the mirror"""
+        local = os.path.join(self.root, rel)
+        # A name of its own, so concurrent writers never share a temp file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(local), prefix=".", suffix=".part")
+        os.close(fd)
+        data_cols = [c for c in columns if c not in PARTITION_COLUMNS]
+        select = ", ".join(data_cols) if data_cols else "1 AS _row"
+        remote = f"{self.source_root}/{rel}"
+        try:
+            conn.execute(
+                f"COPY (SELECT {select} FROM read_parquet('{remote}')) "
+                f"TO '{tmp}' (FORMAT parquet, COMPRESSION zstd)"
+            )
+            os.replace(tmp, local)
+        except BaseException:
+            _remove(tmp)
+            raise
+        return os.path.getsize(local)
+
+    def _covers(self, entry, rel, columns):
+        return (entry is not None and set(columns) <= set(entry["columns"])
+                and os.path.exists(os.path.join(self.root, rel)))
+
+    def ensure(self, conn, partitions, columns):
+        """Make every partition available locally with at least these columns
+
+        partitions is only what the request's scopes selected; the missing
+        ones are fetched one at a time, each under its own lock.
+        """
+        columns = sorted(set(columns))
+        now = time.time()
+        # Mark what is already here as used before anything else, so no
+        # other request evicts it between this check and the scan
+        index = self._load_index()
+        present = {rel: dict(index[rel], last_used=now) for rel in partitions
+                   if self._covers(index.get(rel), rel, columns)}
+        if present:
+            self._update_index(present)
+        for rel in partitions:
+            if rel in present:
+                continue
+            local = os.path.join(self.root, rel)
+            os.makedirs(os.path.dirname(local), exist_ok=True)
+            with self._locked(local):
+                # Another request may have fetched it while this one waited
+                entry = self._load_index().get(rel)
+                if not self._covers(entry, rel, columns):
+                    # Widen rather than replace so earlier requests keep their columns
+                    wanted = sorted(set(columns) | set(entry["columns"] if entry else []))
+                    entry = {"bytes": self._fetch(conn, rel, wanted), "columns": wanted}
+                self._update_index({rel: dict(entry, last_used=time.time())})
+        self._update_index({}, evict=True, keep=set(partitions))
+        return [os.path.join(self.root, rel) for rel in partitions]
+
+    def _evict(self, index, keep=()):
+        """Drop least recently used partitions until the mirror fits its budget"""
+        total = sum(entry["bytes"] for entry in index.values())
+        cutoff = time.time() - self.min_age
+        for rel, entry in sorted(index.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if rel in keep or entry["last_used"] > cutoff:
+                continue
+            local = os.path.join(self.root, rel)
+            with open(local + ".lock", "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Being fetched right now; it will be recent once it lands
+                    continue
+                _remove(local)
+                # Unlinked while still held, so no lock file outlives its partition
+                _remove(local + ".lock")
+            total -= entry["bytes"]
+            del index[rel]
+
+    def size_bytes(self):
+        with self._lock:
+            return sum(entry["bytes"] for entry in self._index.values())
+
+    def relation(self, conn, scopes, columns):
+        """SQL relation over the mirrored partitions with pruning pushed down"""
+        partitions = self.select(conn, scopes)
+        paths = self.ensure(conn, partitions, columns)
+        if not paths:
+            return empty_relation(columns)
+        files = ", ".join("'" + p.replace("'", "''") + "'" for p in paths)
+        return (
+            f"(SELECT {', '.join(columns)} FROM read_parquet([{files}], "
+            f"hive_partitioning = true, hive_types = {HIVE_TYPES}))"
+        )
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _same_file(open_file, path):
+    """True if path still names the file open_file was opened from"""
+    try:
+        return os.fstat(open_file.fileno()).st_ino == os.stat(path).st_ino
+    except FileNotFoundError:
+        return False
+
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def get_mirror():
+    """Return the process-wide mirror, or None when mirroring is disabled"""
+    global _mirror
+    if os.environ.get("COURT_MIRROR", "1") == "0":
+        return None
+    if _mirror is None:
+        with _mirror_lock:
+            if _mirror is None:
+                _mirror = PartitionMirror()
+    return _mirror
@@ -0,0 +1,281 @@
+import fcntl
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import pyarrow.parquet as pq
+
+from utils.court import (
+    COURT_DATA_FILE,
+    COURT_DATA_ROOT,
+    DELAY_DAYS,
+    HIVE_TYPES,
+    QUESTION_SCOPES,
+    REGISTRATION_DATE,
+    SUMMARY_COLUMNS,
+    SUMMARY_TABLE,
+    build_court_summary,
+    court_relation,
+    list_partitions,
+    scope_matches,
+    scope_predicate,
+)
+from utils.court_mirror import get_mirror
+from utils.db_pool import get_pool
+from utils.tracing import span
+
+# Name the in-memory copy of the stored rows is registered under on a connection
+ROWS_VIEW = "court_store_rows"
+
+# One row per (year, court, bench) partition; everything the court questions
+# need can be derived from these sums without touching the raw metadata.
+STATS_SCHEMA = """
+    year BIGINT,
+    court VARCHAR,
+    bench VARCHAR,
+    n_cases BIGINT,
+    delay_n BIGINT,
+    delay_sum DOUBLE,
+    delay_sumsq DOUBLE,
+    min_registration DATE,
+    max_registration DATE,
+    min_decision DATE,
+    max_decision DATE
+"""
+
+PARTITION_STATS = f"""
+    SELECT CAST(year AS BIGINT) AS year,
+           court,
+           bench,
+           COUNT(*) AS n_cases,
+           COUNT(delay) AS delay_n,
+           CAST(SUM(delay) AS DOUBLE) AS delay_sum,
+           CAST(SUM(delay * delay) AS DOUBLE) AS delay_sumsq,
+           MIN(registered) AS min_registration,
+           MAX(registered) AS max_registration,
+           MIN(decided) AS min_decision,
+           MAX(decided) AS max_decision
+    FROM (
+        SELECT year, court, bench,
+               {DELAY_DAYS} AS delay,
+               {REGISTRATION_DATE} AS registered,
+               CAST(decision_date AS DATE) AS decided
+        FROM {{relation}}
+    )
+    GROUP BY year, court, bench
+"""
+
+
+class CourtSummaryStore:
+    """Persistent per-partition court aggregates, refreshed one partition at a time"""
+
+    def __init__(self, path=None, source_root=COURT_DATA_ROOT, source_file=COURT_DATA_FILE,
+                 listing_ttl=600):
+        self.path = path or os.environ.get(
+            "COURT_STORE_PATH",
+            os.path.join(tempfile.gettempdir(), "data-analyst-agent", "court_partition_stats.parquet"),
+        )
+        self.source_root = source_root.rstrip("/")
+        self.source_file = source_file
+        self.listing_ttl = listing_ttl
+        self._lock = threading.Lock()
+        self._listing = None
+        self._listed_at = 0.0
+        self._rows = None
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        """Serialise writers across threads and forked workers"""
+        with self._lock:
+            with open(self.path + ".lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def relation(self):
+        """SQL relation over the stored partition rows"""
+        if not os.path.exists(self.path):
+            cols = ", ".join(f"NULL::{ctype} AS {name}" for name, ctype in _schema_columns())
+            return f"(SELECT {cols} WHERE false)"
+        return f"read_parquet('{self.path}')"
+
+    def known_partitions(self, conn):
+        if not os.path.exists(self.path):
+            return set()
+        rows = conn.execute(f"SELECT year, court, bench FROM {self.relation()}").fetchall()
+        return {(int(y), c, b) for y, c, b in rows}
+
+    def _source_relation(self, conn, partitions):
+        """Projected relation over just the new partition files"""
+        columns = sorted(set(SUMMARY_COLUMNS) | {"bench"})
+        mirror = get_mirror()
+        if mirror is not None:
+            try:
+                paths = mirror.ensure(conn, partitions, columns)
+            except Exception as e:
+                print(f"Error mirroring court partitions: {e}")
+                paths = [f"{self.source_root}/{rel}" for rel in partitions]
+        else:
+            paths = [f"{self.source_root}/{rel}" for rel in partitions]
+        files = ", ".join("'" + p.replace("'", "''") + "'" for p in paths)
+        return (
+            f"(SELECT {', '.join(columns)} FROM read_parquet([{files}], "
+            f"hive_partitioning = true, hive_types = {HIVE_TYPES}))"
+        )
+
+    def list_partitions(self, conn, refresh=False):
+        """Source partitions, re-listed at most once per listing_ttl"""
+        now = time.time()
+        if self._listing is None or refresh or now - self._listed_at > self.listing_ttl:
+            self._listing = list_partitions(conn, self.source_root, self.source_file)
+            self._listed_at = now
+        return self._listing
+
+    def refresh(self, conn, scopes=None):
+        """Aggregate only partitions not yet in the store and merge them in"""
+        with span("court_refresh") as attrs:
+            attrs["partitions"] = added = self._refresh(conn, scopes)
+            return added
+
+    def _refresh(self, conn, scopes):
+        listing = self.list_partitions(conn)
+        wanted = {rel: key for rel, key in listing.items() if scope_matches(key[0], key[1], scopes)}
+        with self._locked():
+            known = self.known_partitions(conn)
+            new = sorted(rel for rel, key in wanted.items() if key not in known)
+            if not new:
+                return 0
+            conn.execute(f"CREATE OR REPLACE TEMP TABLE new_partition_stats ({STATS_SCHEMA})")
+            conn.execute(
+                "INSERT INTO new_partition_stats "
+                + PARTITION_STATS.format(relation=self._source_relation(conn, new))
+            )
+            # Empty partitions still get a row so they are not rescanned next time
+            keys = ", ".join(
+                f"({year}, {_quote(court)}, {_quote(bench)})"
+                for year, court, bench in (wanted[rel] for rel in new)
+            )
+            conn.execute(f"""
+                INSERT INTO new_partition_stats (year, court, bench, n_cases, delay_n, delay_sum, delay_sumsq)
+                SELECT k.year, k.court, k.bench, 0, 0, 0, 0
+                FROM (VALUES {keys}) AS k(year, court, bench)
+                ANTI JOIN new_partition_stats s
+                    ON s.year = k.year AND s.court = k.court AND s.bench = k.bench
+            """)
+            tmp = self.path + ".tmp"
+            conn.execute(f"""
+                COPY (
+                    SELECT * FROM {self.relation()}
+                    UNION ALL BY NAME
+                    SELECT * FROM new_partition_stats
+                ) TO '{tmp}' (FORMAT parquet)
+            """)
+            os.replace(tmp, self.path)
+            conn.execute("DROP TABLE new_partition_stats")
+            return len(new)
+
+    def rows(self):
+        """Stored partition rows as an in-memory Arrow table, reread only when the file changes
+
+        Loaded once by a preforking master, the table is shared copy-on-write
+        by every worker instead of each one rereading the file.
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = self._rows
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        try:
+            rows = pq.read_table(self.path)
+        except Exception as e:
+            print(f"Error reading court store: {e}")
+            return None
+        self._rows = (stamp, rows)
+        return rows
+
+    def load_summary(self, conn, scopes=None, table=SUMMARY_TABLE):
+        """Roll the stored partitions up into the per (court, year) summary table"""
+        source = self.relation()
+        rows = self.rows()
+        if rows is not None:
+            conn.register(ROWS_VIEW, rows)
+            source = ROWS_VIEW
+        try:
+            with span("court_summary", rows=rows.num_rows if rows is not None else 0):
+                conn.execute(f"""
+                    CREATE OR REPLACE TEMP TABLE {table} AS
+                    SELECT court,
+                           CAST(year AS INTEGER) AS year,
+                           SUM(n_cases) AS n_cases,
+                           SUM(delay_sum) AS delay_sum,
+                           SUM(delay_n) AS delay_count,
+                           SUM(delay_sumsq) AS delay_sumsq
+                    FROM {source}
+                    WHERE {scope_predicate(scopes)}
+                    GROUP BY court, year
+                """)
+        finally:
+            # A pooled connection outlives the lease; it must not keep the table alive
+            if rows is not None:
+                conn.unregister(ROWS_VIEW)
+        return table
+
+
+def _quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _schema_columns():
+    return [tuple(line.strip().rstrip(",").split()) for line in STATS_SCHEMA.strip().splitlines()]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the process-wide store, or None when materialisation is disabled"""
+    global _store
+    if os.environ.get("COURT_STORE", "1") == "0":
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = CourtSummaryStore()
+    return _store
+
+
+def load_court_summary(conn, scopes=QUESTION_SCOPES, table=SUMMARY_TABLE, refresh=True):
+    """Bring the store up to date for these scopes and build the summary from it
+
+    refresh=False builds the summary from whatever the store already holds.
+    """
+    store = get_store()
+    if store is None:
+        return build_court_summary(conn, court_relation(conn, scopes), table)
+    if refresh:
+        store.refresh(conn, scopes)
+    return store.load_summary(conn, scopes, table)
+
+
+def refresh_court_store(scopes=QUESTION_SCOPES, on_lease=None):
+    """Refresh the store on a connection of its own, so it can be interrupted independently
+
+    on_lease(conn) is called with the leased connection before the refresh
+    starts. Returns the number of partitions added.
+    """
+    store = get_store()
+    if store is None:
+        return 0
+    with get_pool().lease() as conn:
+        if on_lease is not None:
+            on_lease(conn)
+        return store.refresh(conn, scopes)
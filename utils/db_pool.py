@@ -0,0 +1,316 @@
+import os
+import queue
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+import duckdb
+
+from utils.admission import current_limits, get_budget
+
+# Extensions every court query needs; installed and loaded once per connection
+# when the pool warms it, never on the request path.
+DEFAULT_EXTENSIONS = ("httpfs", "parquet")
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _sql_literal(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class DuckDBPool:
+    """Process-wide pool of warmed DuckDB connections leased per request"""
+
+    def __init__(self, size=None, threads=None, memory_limit=None,
+                 extensions=DEFAULT_EXTENSIONS, settings=None, lease_timeout=30.0):
+        budget = get_budget()
+        self.pid = os.getpid()
+        self.size = size or _env_int("DUCKDB_POOL_SIZE", 4)
+        # Defaults split the resource budget across the pool; an admitted
+        # request narrows them further for the length of its lease
+        self.threads = threads or _env_int("DUCKDB_THREADS", budget.cpus)
+        self.memory_limit = memory_limit or os.environ.get(
+            "DUCKDB_MEMORY_LIMIT", f"{max(64, budget.memory_mb // self.size)}MB")
+        self.extensions = tuple(extensions)
+        self.settings = dict(settings or {})
+        # Each connection spills into budget.spill_dir/<pid>-<n>, removed when it closes
+        self.budget = budget
+        self._prune_spill()
+        self.s3_region = os.environ.get("DUCKDB_S3_REGION", "ap-south-1")
+        # Point httpfs at a local S3 stand-in (MinIO, moto) when these are set
+        for key in ("s3_endpoint", "s3_url_style", "s3_use_ssl",
+                    "s3_access_key_id", "s3_secret_access_key"):
+            value = os.environ.get(f"DUCKDB_{key.upper()}")
+            if value is not None and key not in self.settings:
+                self.settings[key] = value
+        self.lease_timeout = lease_timeout
+
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._serial = 0
+        self._spill = {}
+        self._lock = threading.Lock()
+        # Waiters for an idle connection or a slot freed by a failed connect
+        self._slot_freed = threading.Condition(self._lock)
+        self._stats = {
+            "leases": 0,
+            "created": 0,
+            "replaced": 0,
+            "in_use": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "lease_seconds_total": 0.0,
+            "lease_seconds_max": 0.0,
+        }
+
+    def _prune_spill(self):
+        """Remove spill directories left behind by processes that have exited"""
+        try:
+            names = os.listdir(self.budget.spill_dir)
+        except OSError:
+            return
+        for name in names:
+            pid = name.split("-", 1)[0]
+            if pid.isdigit() and int(pid) != self.pid and not _pid_alive(int(pid)):
+                shutil.rmtree(os.path.join(self.budget.spill_dir, name), ignore_errors=True)
+
+    def _spill_settings(self):
+        """temp_directory and its size for a new connection, unless set explicitly"""
+        if "temp_directory" in self.settings:
+            return {}
+        with self._lock:
+            self._serial += 1
+            name = f"{self.pid}-{self._serial}"
+        try:
+            return self.budget.connection_settings(name, self.size)
+        except OSError as e:
+            print(f"Error preparing DuckDB spill directory: {e}")
+            return {}
+
+    def _connect(self):
+        """Open a connection with extensions and settings already applied"""
+        conn = duckdb.connect()
+        spill = self._spill_settings()
+        try:
+            self._configure(conn, {**spill, **self.settings})
+        except Exception:
+            conn.close()
+            if spill:
+                shutil.rmtree(spill["temp_directory"], ignore_errors=True)
+            raise
+        with self._lock:
+            if spill:
+                self._spill[id(conn)] = spill["temp_directory"]
+            self._stats["created"] += 1
+        return conn
+
+    def _configure(self, conn, settings):
+        """Load the extensions and apply threads, memory_limit and settings"""
+        loaded = {row[0] for row in conn.execute(
+            "SELECT extension_name FROM duckdb_extensions() WHERE loaded").fetchall()}
+        for ext in self.extensions:
+            if ext in loaded:
+                continue
+            try:
+                conn.execute(f"INSTALL {ext}")
+                conn.execute(f"LOAD {ext}")
+            except Exception as e:
+                # parquet is built in on recent DuckDB and httpfs needs network
+                # to install; a missing extension only fails the remote queries.
+                print(f"Error loading DuckDB extension {ext}: {e}")
+        conn.execute(f"SET threads = {int(self.threads)}")
+        conn.execute(f"SET memory_limit = '{self.memory_limit}'")
+        if "httpfs" in self.extensions:
+            try:
+                conn.execute(f"SET s3_region = '{self.s3_region}'")
+            except Exception:
+                pass
+        for key, value in settings.items():
+            conn.execute(f"SET {key} = {_sql_literal(value)}")
+
+    def _close(self, conn):
+        """Close a connection and remove its spill directory"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            path = self._spill.pop(id(conn), None)
+        if path:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _healthy(self, conn):
+        try:
+            return conn.execute("SELECT 1").fetchone() == (1,)
+        except Exception:
+            return False
+
+    def warm(self, count=None):
+        """Open connections up front so the first requests do not pay for it"""
+        count = self.size if count is None else min(count, self.size)
+        while True:
+            with self._lock:
+                if self._created >= count:
+                    return
+                self._created += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                # Give the slot back, or a failed warm-up shrinks the pool for good
+                self._forget()
+                raise
+            self._release(conn)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                self._forget()
+                raise
+        deadline = time.monotonic() + self.lease_timeout
+        with self._slot_freed:
+            while True:
+                try:
+                    return self._idle.get_nowait()
+                except queue.Empty:
+                    pass
+                # A slot given up by a failed connect can be opened afresh
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No DuckDB connection free after {self.lease_timeout}s")
+                self._slot_freed.wait(remaining)
+        try:
+            return self._connect()
+        except Exception:
+            self._forget()
+            raise
+
+    def _forget(self):
+        """Drop a slot whose connection is gone and wake a waiter to reopen it"""
+        with self._slot_freed:
+            self._created -= 1
+            self._slot_freed.notify()
+
+    def _release(self, conn):
+        with self._slot_freed:
+            self._idle.put(conn)
+            self._slot_freed.notify()
+
+    def _apply_limits(self, conn, limits):
+        """SET memory_limit/threads on a leased connection; False if it refused"""
+        try:
+            conn.execute(f"SET memory_limit = '{limits['memory_limit']}'")
+            conn.execute(f"SET threads = {int(limits['threads'])}")
+            return True
+        except Exception as e:
+            print(f"Error applying request limits: {e}")
+            return False
+
+    @contextmanager
+    def lease(self):
+        """Lease a health-checked connection for the duration of a request"""
+        started = time.perf_counter()
+        conn = self._acquire()
+        if not self._healthy(conn):
+            self._close(conn)
+            try:
+                conn = self._connect()
+            except Exception:
+                # Give the slot back, or every failed reconnect shrinks the pool
+                self._forget()
+                raise
+            with self._lock:
+                self._stats["replaced"] += 1
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._stats["leases"] += 1
+            self._stats["in_use"] += 1
+            self._stats["wait_seconds_total"] += waited
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], waited)
+
+        # Limits of the admitted request this lease serves, restored on release
+        limits = current_limits()
+        limited = limits is not None and self._apply_limits(conn, limits)
+
+        leased_at = time.perf_counter()
+        try:
+            yield conn
+        finally:
+            if limited:
+                self._apply_limits(conn, {"memory_limit": self.memory_limit, "threads": self.threads})
+            held = time.perf_counter() - leased_at
+            with self._lock:
+                self._stats["in_use"] -= 1
+                self._stats["lease_seconds_total"] += held
+                self._stats["lease_seconds_max"] = max(self._stats["lease_seconds_max"], held)
+            self._release(conn)
+
+    def stats(self):
+        """Snapshot of lease counts and wait/lease timings"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = self.size
+            stats["open"] = self._created
+        stats["idle"] = self._idle.qsize()
+        leases = stats["leases"] or 1
+        stats["wait_seconds_avg"] = stats["wait_seconds_total"] / leases
+        stats["lease_seconds_avg"] = stats["lease_seconds_total"] / leases
+        return stats
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(conn)
+            with self._lock:
+                self._created -= 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use"""
+    global _pool
+    # A forked worker must not reuse its parent's connections
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = DuckDBPool()
+    return _pool
@@ -0,0 +1,191 @@
+"""Per-request time budgets.
+
+A ``Deadline`` is created when a request arrives and handed down to every
+stage. Each stage gets a share of the time still left (minus a reserve for
+serialising the response); a stage that overruns its share is interrupted
+where possible and replaced by a cheaper fallback, e.g. the cached court
+summary instead of a refresh, the cached page instead of a fetch, a
+low-resolution plot instead of a full one. Fallbacks are recorded by answer
+position so the response can say which answers were degraded.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from utils.tracing import FALLBACKS
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class StageRunner:
+    """Shared, bounded threads that run deadline stages so callers can stop waiting
+
+    Stages nest (the request guard waits on a request whose stages wait on
+    theirs), so a stage is never queued behind others, which could deadlock:
+    when every thread is busy, typically with overrunning stages still
+    finishing in the background, the stage is refused and its caller falls
+    back at once.
+    """
+
+    def __init__(self, workers=None):
+        self.pid = os.getpid()
+        self.workers = workers or _env_int("DEADLINE_STAGE_WORKERS", 32)
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="deadline-stage")
+        self._lock = threading.Lock()
+        self._stats = {"busy": 0, "started": 0, "refused": 0}
+
+    def start(self, fn):
+        """Future of fn() on a stage thread, in the caller's context, or None if all are busy"""
+        with self._lock:
+            if self._stats["busy"] >= self.workers:
+                self._stats["refused"] += 1
+                return None
+            self._stats["busy"] += 1
+            self._stats["started"] += 1
+        try:
+            future = self._executor.submit(contextvars.copy_context().run, fn)
+        except Exception:
+            self._done()
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, _=None):
+        with self._lock:
+            self._stats["busy"] -= 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "workers": self.workers}
+
+
+class Deadline:
+    """Time budget for one request, shared out across its stages"""
+
+    def __init__(self, budget=None, reserve=None):
+        self.budget = _env_float("REQUEST_DEADLINE", 170) if budget is None else budget
+        self.reserve = _env_float("REQUEST_DEADLINE_RESERVE", 2) if reserve is None else reserve
+        self.started = time.monotonic()
+        self.degraded = {}
+        self._lock = threading.Lock()
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def remaining(self):
+        """Seconds left for stages, after the response reserve"""
+        return max(0.0, self.budget - self.reserve - self.elapsed())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def share(self, fraction):
+        """Seconds for a stage entitled to fraction of the time still left"""
+        return self.remaining() * min(1.0, max(0.0, fraction))
+
+    def mark(self, positions, reason):
+        """Record that the answers at these positions came from a fallback"""
+        with self._lock:
+            new = [position for position in positions if position not in self.degraded]
+            for position in positions:
+                self.degraded.setdefault(position, reason)
+        # Once per fallback, not again when a shared result's marks are copied over
+        if new or not positions:
+            FALLBACKS.inc(reason=reason)
+
+    def header(self):
+        """X-Degraded header value, or None if every answer is complete"""
+        with self._lock:
+            if not self.degraded:
+                return None
+            return json.dumps({str(k): v for k, v in sorted(self.degraded.items(), key=lambda kv: str(kv[0]))})
+
+
+def run_stage(deadline, fn, fraction, fallback, positions=(), reason="timeout", interrupt=None, grace=1.0):
+    """fn() within its share of the deadline, else interrupt it and return fallback()
+
+    Without a deadline fn just runs inline. interrupt (e.g. conn.interrupt)
+    is called on overrun, and the stage gets up to grace seconds to unwind
+    before the fallback runs, so the two never share a connection. Stages
+    without an interrupt are abandoned to finish in the background, holding
+    one of the shared stage threads until they do.
+    """
+    if deadline is None:
+        return fn()
+    future = get_stage_runner().start(fn)
+    if future is None:
+        print(f"No stage thread free, using fallback ({reason})")
+        deadline.mark(positions, reason)
+        return fallback()
+    budget = deadline.share(fraction)
+    try:
+        return future.result(timeout=budget)
+    except FutureTimeout:
+        pass
+    if interrupt is not None:
+        try:
+            interrupt()
+        except Exception as e:
+            print(f"Error interrupting stage: {e}")
+        try:
+            # It may have finished just now, or the interrupt ended it with an error
+            return future.result(timeout=grace)
+        except Exception:
+            pass
+    print(f"Stage over its {budget:.1f}s budget, using fallback ({reason})")
+    deadline.mark(positions, reason)
+    return fallback()
+
+
+async def run_stage_async(deadline, awaitable, fraction, fallback, positions=(), reason="timeout", interrupt=None):
+    """Async run_stage: await within the stage's share, else fall back"""
+    if deadline is None:
+        return await awaitable
+    task = asyncio.ensure_future(awaitable)
+    budget = deadline.share(fraction)
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout=budget)
+    except asyncio.TimeoutError:
+        pass
+    if interrupt is not None:
+        try:
+            interrupt()
+        except Exception as e:
+            print(f"Error interrupting stage: {e}")
+    task.cancel()
+    print(f"Stage over its {budget:.1f}s budget, using fallback ({reason})")
+    deadline.mark(positions, reason)
+    result = fallback()
+    return await result if asyncio.iscoroutine(result) else result
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_stage_runner():
+    """Return the process-wide stage runner, creating it on first use"""
+    global _runner
+    # A forked worker must not reuse its parent's threads
+    if _runner is None or _runner.pid != os.getpid():
+        with _runner_lock:
+            if _runner is None or _runner.pid != os.getpid():
+                _runner = StageRunner()
+    return _runner
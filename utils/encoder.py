@@ -0,0 +1,144 @@
+"""Size-budgeted image encoding for data URIs.
+
+The figure is rasterized once. Candidate encodings are then made from that
+raster with Pillow: a palette-quantized PNG, which is usually smallest for
+line art, and lossy WebP. If neither fits the budget, the raster is
+downscaled to a predicted scale instead of re-rendering the figure at a
+lower DPI. The prediction starts from the usual size-vs-scale exponent for
+plots and is re-fitted from the observed sizes if the first guess misses.
+Past a minimum scale, colours (PNG) or quality (WebP) are given up, and
+then the raster keeps shrinking until it fits; the report says whether the
+result is within the budget.
+"""
+import base64
+import io
+import math
+
+from PIL import Image
+
+DEFAULT_MAX_CHARS = 100_000
+# A blank 1x1 PNG, for answers that cannot have (or wait for) a real plot
+FALLBACK_PLOT = "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+MIME_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+# Encoded size grows roughly with scale ** 1.5 for plots (edges, not areas)
+_SIZE_EXPONENT = 1.5
+_MARGIN = 0.95
+_MIN_SCALE = 0.2
+# Below this many pixels on the short side a plot is no longer worth shrinking
+_MIN_PIXELS = 16
+
+
+def byte_budget(max_chars, fmt):
+    """Largest encoded size whose data URI stays within max_chars"""
+    return (max_chars - len(f"data:{MIME_TYPES[fmt]};base64,")) // 4 * 3
+
+
+def rasterize(fig, dpi, bbox_inches="tight"):
+    """Render fig once to an RGB image"""
+    buffer = io.BytesIO()
+    # Level 0 skips deflate: this PNG is only a container for the pixels
+    fig.savefig(buffer, format="png", dpi=dpi, bbox_inches=bbox_inches, pil_kwargs={"compress_level": 0})
+    buffer.seek(0)
+    return Image.open(buffer).convert("RGB")
+
+
+def _encode(image, fmt, colors, quality):
+    buffer = io.BytesIO()
+    if fmt == "png":
+        # Octree is several times faster than median cut and packs plots tighter
+        image.quantize(colors=colors, method=Image.Quantize.FASTOCTREE).save(buffer, format="PNG", compress_level=9)
+    else:
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def _scaled(image, scale):
+    if scale >= 1:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.Resampling.LANCZOS)
+
+
+def encode_image(image, max_chars=DEFAULT_MAX_CHARS, formats=("png", "webp"), dpi=100, colors=128, quality=80):
+    """Data URI for image within max_chars; returns (uri, report)
+
+    report["within_budget"] is False when even the smallest encoding is over
+    max_chars; the URI is then that encoding and the caller decides what to do.
+    """
+    attempts = []
+
+    def attempt(fmt, scale, colors=colors, quality=quality):
+        data = _encode(_scaled(image, scale), fmt, colors, quality)
+        attempts.append((fmt, round(scale, 3), len(data)))
+        return data
+
+    # Full resolution first, in order of preference; keep the smallest
+    best = None
+    for fmt in formats:
+        data = attempt(fmt, 1.0)
+        if len(data) <= byte_budget(max_chars, fmt):
+            return _result(data, fmt, 1.0, dpi, colors, quality, attempts)
+        if best is None or len(data) < len(best[1]):
+            best = (fmt, data)
+
+    # Shrink the best format to the predicted scale, refitting the exponent on a miss
+    fmt, data = best
+    budget = byte_budget(max_chars, fmt)
+    points = [(1.0, len(data))]
+    exponent = _SIZE_EXPONENT
+    scale = 1.0
+    for _ in range(4):
+        scale = max(_MIN_SCALE, points[-1][0] * (_MARGIN * budget / points[-1][1]) ** (1 / exponent))
+        data = attempt(fmt, scale)
+        if len(data) <= budget or scale == _MIN_SCALE:
+            break
+        points.append((scale, len(data)))
+        (s0, n0), (s1, n1) = points[-2], points[-1]
+        if s0 != s1 and n0 != n1:
+            exponent = min(2.5, max(0.5, math.log(n0 / n1) / math.log(s0 / s1)))
+    if len(data) <= budget:
+        return _result(data, fmt, scale, dpi, colors, quality, attempts)
+
+    # Smallest sensible size and still over: give up fidelity instead
+    for level in (0.75, 0.5, 0.3):
+        if "webp" in formats:
+            fmt, budget = "webp", byte_budget(max_chars, "webp")
+            data = attempt(fmt, scale, quality=round(quality * level))
+            used = (colors, round(quality * level))
+        else:
+            data = attempt(fmt, scale, colors=max(8, round(colors * level / 2)))
+            used = (max(8, round(colors * level / 2)), quality)
+        if len(data) <= budget:
+            break
+
+    # Still over: keep shrinking at that fidelity until it fits or nothing is left to see
+    while len(data) > budget and min(image.width, image.height) * scale > _MIN_PIXELS:
+        scale = max(_MIN_PIXELS / min(image.width, image.height),
+                    scale * min(0.9, max(0.25, (_MARGIN * budget / len(data)) ** (1 / exponent))))
+        data = attempt(fmt, scale, colors=used[0], quality=used[1])
+    return _result(data, fmt, scale, dpi, *used, attempts, within_budget=len(data) <= budget)
+
+
+def _result(data, fmt, scale, dpi, colors, quality, attempts, within_budget=True):
+    uri = f"data:{MIME_TYPES[fmt]};base64,{base64.b64encode(data).decode()}"
+    report = {
+        "format": fmt,
+        "dpi": round(dpi * scale, 1),
+        "scale": round(scale, 3),
+        "bytes": len(data),
+        "uri_length": len(uri),
+        "within_budget": within_budget,
+        "attempts": attempts,
+    }
+    if fmt == "png":
+        report["colors"] = colors
+        report["compress_level"] = 9
+    else:
+        report["quality"] = quality
+    return uri, report
+
+
+def encode_figure(fig, max_chars=DEFAULT_MAX_CHARS, formats=("png", "webp"), dpi=100, **options):
+    """Rasterize fig once and encode it within max_chars; returns (uri, report)"""
+    return encode_image(rasterize(fig, dpi), max_chars=max_chars, formats=formats, dpi=dpi, **options)
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.tracing import FALLBACKS, span
+
+USER_AGENT = "data-analyst-agent/1.0 (+https://github.com/MUNEESHWARIA/data-analyst-agent_trial)"
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class CachedResponse:
+    """Body and validators of a fetched page, whether fresh, revalidated or stale"""
+
+    def __init__(self, url, content, headers, content_hash, source):
+        self.url = url
+        self.content = content
+        self.headers = headers
+        self.content_hash = content_hash
+        # "network", "cache", "revalidated" or "stale"
+        self.source = source
+
+    @property
+    def text(self):
+        return self.content.decode(self.headers.get("encoding") or "utf-8", errors="replace")
+
+    @property
+    def from_cache(self):
+        return self.source != "network"
+
+
+class HttpCache:
+    """Pooled HTTP session with an on-disk, ETag/Last-Modified revalidating cache"""
+
+    def __init__(self, cache_dir=None, ttl=None, timeout=None, offline=None):
+        self.cache_dir = cache_dir or os.environ.get(
+            "HTTP_CACHE_DIR",
+            os.path.join(tempfile.gettempdir(), "data-analyst-agent", "http-cache"),
+        )
+        self.ttl = _env_float("HTTP_CACHE_TTL", 3600) if ttl is None else ttl
+        self.timeout = _env_float("HTTP_TIMEOUT", 20) if timeout is None else timeout
+        self.offline = os.environ.get("HTTP_CACHE_OFFLINE") == "1" if offline is None else offline
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=32,
+            max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504)),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "revalidated": 0, "misses": 0, "stale": 0, "errors": 0}
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key + ".body"), os.path.join(self.cache_dir, key + ".json")
+
+    def _load(self, url):
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                return meta, f.read()
+        except (OSError, ValueError):
+            return None, None
+
+    def _store(self, url, content, meta):
+        body_path, meta_path = self._paths(url)
+        for path, data, mode in ((body_path, content, "wb"), (meta_path, json.dumps(meta), "w")):
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, mode) as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+    def _touch(self, url, meta):
+        meta["fetched_at"] = time.time()
+        _, meta_path = self._paths(url)
+        tmp = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, meta_path)
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _response(self, url, content, meta, source):
+        return CachedResponse(url, content, meta.get("headers", {}), meta["content_hash"], source)
+
+    def seed(self, url, content, etag=None, last_modified=None):
+        """Record a page (e.g. an offline fixture) as the cached copy of url"""
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        meta = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": time.time(),
+            "content_hash": hashlib.sha256(content).hexdigest(),
+            "headers": {"encoding": "utf-8"},
+        }
+        self._store(url, content, meta)
+
+    def seed_file(self, url, path):
+        with open(path, "rb") as f:
+            self.seed(url, f.read())
+
+    def get(self, url, offline=None):
+        """Fetch url, serving fresh cache hits and revalidating expired ones
+
+        offline=True serves whatever copy is cached, however old, without
+        touching the network (e.g. when a request is out of time).
+        """
+        with span("fetch") as attrs:
+            response = self._get(url, offline)
+            attrs["bytes"] = len(response.content)
+            return response
+
+    def _get(self, url, offline):
+        offline = self.offline if offline is None else offline
+        meta, content = self._load(url)
+        if meta is not None and (offline or time.time() - meta["fetched_at"] < self.ttl):
+            self._count("hits")
+            return self._response(url, content, meta, "cache")
+        if offline:
+            raise requests.ConnectionError(f"{url} is not cached and HTTP_CACHE_OFFLINE=1")
+
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            resp = self.session.get(url, headers=headers, timeout=self.timeout)
+            if resp.status_code == 304 and meta is not None:
+                self._touch(url, meta)
+                self._count("revalidated")
+                return self._response(url, content, meta, "revalidated")
+            resp.raise_for_status()
+        except requests.RequestException as e:
+            if meta is not None:
+                # Better an old page than a failed request
+                print(f"Error fetching {url}, serving stale copy: {e}")
+                self._count("stale")
+                FALLBACKS.inc(reason="stale page")
+                return self._response(url, content, meta, "stale")
+            self._count("errors")
+            raise
+
+        meta = {
+            "url": url,
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+            "content_hash": hashlib.sha256(resp.content).hexdigest(),
+            "headers": {
+                "content-type": resp.headers.get("Content-Type"),
+                "encoding": resp.encoding,
+            },
+        }
+        self._store(url, resp.content, meta)
+        self._count("misses")
+        return self._response(url, resp.content, meta, "network")
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_http_cache():
+    """Return the process-wide HTTP cache, creating it on first use"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = HttpCache()
+    return _cache
+
+
+def fetch(url, offline=None):
+    return get_http_cache().get(url, offline=offline)
@@ -0,0 +1,253 @@
+"""Uploaded data files, spooled to disk and queried in place with DuckDB.
+
+Attachments (CSV/TSV, Parquet, JSON/NDJSON, Excel) are streamed in chunks
+into files under ``UPLOAD_SPOOL_DIR`` rather than read into memory, then
+exposed to a leased connection as temp views over DuckDB's own readers.
+Queries scan the file through DuckDB's buffer manager, so a multi-GB upload
+is summarised and plotted within the connection's memory_limit instead of
+being loaded into pandas.
+"""
+import csv
+import os
+import re
+import shutil
+import tempfile
+
+from utils.db_pool import get_pool
+from utils.density import DEFAULT_BINS, bin_relation
+from utils.stats import quote_ident, regression
+from utils.tracing import record_error, span
+
+CSV = "csv"
+PARQUET = "parquet"
+JSON = "json"
+EXCEL = "excel"
+
+CHUNK_SIZE = 1 << 20
+
+_EXTENSIONS = {
+    ".csv": CSV, ".tsv": CSV, ".txt": CSV, ".csv.gz": CSV,
+    ".parquet": PARQUET, ".pq": PARQUET,
+    ".json": JSON, ".jsonl": JSON, ".ndjson": JSON,
+    ".xlsx": EXCEL, ".xlsm": EXCEL,
+}
+_NUMERIC_TYPES = ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT",
+                  "UINTEGER", "UBIGINT", "FLOAT", "DOUBLE", "DECIMAL")
+
+
+def spool_dir():
+    path = os.environ.get(
+        "UPLOAD_SPOOL_DIR",
+        os.path.join(tempfile.gettempdir(), "data-analyst-agent", "uploads"),
+    )
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def new_spool_file(suffix="", delete=False):
+    """Named file in the spool directory for an upload to be written into"""
+    return tempfile.NamedTemporaryFile(dir=spool_dir(), prefix="upload-", suffix=suffix, delete=delete)
+
+
+def _suffix(filename):
+    name = (filename or "").lower()
+    if name.endswith(".csv.gz") or name.endswith(".tsv.gz"):
+        return ".csv.gz"
+    return os.path.splitext(name)[1]
+
+
+def sniff_format(path, filename=None):
+    """File format from the upload's extension, else from its first bytes"""
+    fmt = _EXTENSIONS.get(_suffix(filename) or _suffix(path))
+    if fmt:
+        return fmt
+    with open(path, "rb") as f:
+        head = f.read(512)
+    if head.startswith(b"PAR1"):
+        return PARQUET
+    if head.startswith(b"PK\x03\x04"):
+        return EXCEL
+    if head.lstrip()[:1] in (b"{", b"["):
+        return JSON
+    return CSV
+
+
+class Attachment:
+    """An uploaded data file on disk, removed on close if the spool owns it"""
+
+    def __init__(self, path, filename=None, fmt=None, owned=True):
+        self.path = path
+        self.filename = filename or os.path.basename(path)
+        self.format = fmt or sniff_format(path, filename)
+        self.owned = owned
+        self._converted = None
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def relation(self, conn):
+        """DuckDB table function reading the file in place"""
+        path = "'" + self.path.replace("'", "''") + "'"
+        if self.format == PARQUET:
+            return f"read_parquet({path})"
+        if self.format == JSON:
+            return f"read_json_auto({path})"
+        if self.format == EXCEL:
+            return self._excel_relation(conn, path)
+        return f"read_csv_auto({path})"
+
+    def _excel_relation(self, conn, path):
+        try:
+            conn.execute("LOAD excel")
+            return f"read_xlsx({path})"
+        except Exception:
+            pass
+        # No excel extension: stream the first sheet row by row into a CSV spool
+        if self._converted is None:
+            self._converted = _excel_to_csv(self.path)
+        return "read_csv_auto('" + self._converted.replace("'", "''") + "')"
+
+    def close(self):
+        paths = [self._converted] + ([self.path] if self.owned else [])
+        for path in paths:
+            if path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def _excel_to_csv(path):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("Excel uploads need the DuckDB excel extension or openpyxl")
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        with new_spool_file(".csv") as out:
+            target = out.name
+        with open(target, "w", newline="") as out:
+            writer = csv.writer(out)
+            for row in workbook.worksheets[0].iter_rows(values_only=True):
+                writer.writerow(row)
+    finally:
+        workbook.close()
+    return target
+
+
+def spool(stream, filename=None):
+    """Attachment for an upload stream, copied to the spool in chunks unless already there"""
+    name = getattr(stream, "name", None)
+    if isinstance(name, str) and os.path.dirname(os.path.abspath(name)) == os.path.abspath(spool_dir()):
+        # Written straight into the spool by the server: link it under a name of
+        # our own, so it outlives the server closing (and deleting) its copy
+        stream.flush()
+        with new_spool_file(_suffix(filename)) as out:
+            target = out.name
+        try:
+            os.remove(target)
+            os.link(name, target)
+            return Attachment(target, filename)
+        except OSError:
+            stream.seek(0)
+    with new_spool_file(_suffix(filename)) as out:
+        shutil.copyfileobj(stream, out, CHUNK_SIZE)
+    return Attachment(out.name, filename)
+
+
+def close_all(attachments):
+    for attachment in attachments:
+        attachment.close()
+
+
+def table_name(filename, taken=()):
+    """SQL-safe view name from an upload's file name"""
+    stem = os.path.basename(filename or "upload").split(".")[0].lower()
+    name = re.sub(r"\W+", "_", stem).strip("_") or "upload"
+    if name[0].isdigit():
+        name = "t_" + name
+    candidate, n = name, 1
+    while candidate in taken:
+        n += 1
+        candidate = f"{name}_{n}"
+    return candidate
+
+
+def register_attachments(conn, attachments):
+    """Temp view per readable attachment, as {view name: attachment}"""
+    views = {}
+    for attachment in attachments:
+        name = table_name(attachment.filename, views)
+        try:
+            conn.execute(f"CREATE OR REPLACE TEMP VIEW {quote_ident(name)} AS SELECT * FROM {attachment.relation(conn)}")
+        except Exception as e:
+            print(f"Error reading upload {attachment.filename}: {e}")
+            continue
+        views[name] = attachment
+    return views
+
+
+def unregister_attachments(conn, views):
+    for name in views:
+        try:
+            conn.execute(f"DROP VIEW IF EXISTS {quote_ident(name)}")
+        except Exception as e:
+            print(f"Error dropping view {name}: {e}")
+
+
+def describe(conn, view):
+    """Row count and per-column type, min, max, mean and null share from one SUMMARIZE scan"""
+    summary = conn.execute(f"""
+        SELECT column_name, column_type, min, max,
+               TRY_CAST(avg AS DOUBLE), CAST(null_percentage AS DOUBLE), count
+        FROM (SUMMARIZE {quote_ident(view)})
+    """).fetchall()
+    columns, rows = {}, 0
+    for name, column_type, low, high, mean, nulls, rows in summary:
+        columns[name] = {"type": column_type, "min": low, "max": high, "mean": mean, "nulls_pct": nulls}
+    return {"rows": rows, "columns": columns}
+
+
+def _numeric(column_type):
+    return column_type.startswith(_NUMERIC_TYPES)
+
+
+def density_plot_spec(conn, view, info, bins=DEFAULT_BINS):
+    """Binned scatter of the first two numeric columns, computed in DuckDB, or None"""
+    numeric = [name for name, column in info["columns"].items() if _numeric(column["type"])]
+    if len(numeric) < 2 or info["rows"] == 0:
+        return None
+    x, y = numeric[:2]
+    cast = f"(SELECT CAST({quote_ident(x)} AS DOUBLE) AS x, CAST({quote_ident(y)} AS DOUBLE) AS y FROM {quote_ident(view)})"
+    density = bin_relation(conn, cast, "x", "y", bins=bins)
+    fit = regression(conn, cast, "x", "y")
+    return {
+        "kind": "scatter_fit",
+        "density": density,
+        "fit": fit if fit[0] is not None else None,
+        "xlabel": x,
+        "ylabel": y,
+        "title": f"{y} vs {x} ({view})",
+    }
+
+
+def describe_attachments(attachments):
+    """({view: description}, plot spec or None) for the uploads, on one leased connection"""
+    with get_pool().lease() as conn, span("ingest", bytes=sum(a.size for a in attachments)) as attrs:
+        views = register_attachments(conn, attachments)
+        try:
+            summary, spec = {}, None
+            for view in views:
+                try:
+                    summary[view] = describe(conn, view)
+                except Exception as e:
+                    print(f"Error summarising upload {views[view].filename}: {e}")
+                    record_error("ingest", e)
+                    continue
+                attrs["rows"] = attrs.get("rows", 0) + (summary[view].get("rows") or 0)
+                if spec is None:
+                    spec = density_plot_spec(conn, view, summary[view])
+            return summary, spec
+        finally:
+            unregister_attachments(conn, views)
@@ -0,0 +1,163 @@
+"""Async orchestration of the analysis stages behind the FastAPI server.
+
+The stages themselves (scraping, pandas, DuckDB) are blocking, so each one
+runs on a sized executor and the event loop only awaits them: fetches on an
+I/O thread pool, queries on a DuckDB thread pool no larger than the
+connection pool, plots on the render process pool. Routing and the answers
+themselves come from ``utils.tasks``, shared with the Flask server.
+Independent stages are gathered, e.g. the page fetch runs while the DuckDB
+pool warms up and every plot of a task renders at once. With a ``Deadline`` the
+fetch, court refresh and plot each get a share of it and fall back to the
+cached page, the cached court summary or a low-resolution plot on overrun.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.court import QUESTION_SCOPES
+from utils.court_store import refresh_court_store
+from utils.db_pool import get_pool
+from utils.deadline import run_stage_async
+from utils.encoder import FALLBACK_PLOT
+from utils.planner import COURT, MOVIES, needed_scopes
+from utils.render import get_renderer, low_resolution, render_plot
+from utils.scraper import scrape_table
+from utils.streaming import assemble
+from utils.tasks import DEFAULT_MOVIE_ANSWERS, Plot, generic_answers, iter_court, iter_movies, route
+
+
+class Pipeline:
+    """Runs request stages on executors so the event loop never blocks"""
+
+    def __init__(self, io_workers=None, db_workers=None):
+        self.pid = os.getpid()
+        self.io_workers = io_workers or int(os.environ.get("PIPELINE_IO_WORKERS", 16))
+        self.db_workers = db_workers or int(os.environ.get("PIPELINE_DB_WORKERS", get_pool().size))
+        self._io = ThreadPoolExecutor(self.io_workers, thread_name_prefix="pipeline-io")
+        self._db = ThreadPoolExecutor(self.db_workers, thread_name_prefix="pipeline-db")
+
+    async def _run(self, executor, fn, *args, **kwargs):
+        # Carry the request's context (its admission limits) onto the worker thread
+        context = contextvars.copy_context()
+        call = functools.partial(fn, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(executor, context.run, call)
+
+    async def io(self, fn, *args, **kwargs):
+        """Run a blocking network/file stage"""
+        return await self._run(self._io, fn, *args, **kwargs)
+
+    async def db(self, fn, *args, **kwargs):
+        """Run a blocking DuckDB/pandas stage"""
+        return await self._run(self._db, fn, *args, **kwargs)
+
+    async def render(self, spec, timeout=None):
+        return await get_renderer().render_async(spec, timeout=timeout)
+
+    async def render_within(self, spec, deadline, positions=()):
+        """render, or a low-resolution copy drawn locally once the deadline is near"""
+        # The wait for a render slot gives up with the stage rather than outliving it
+        timeout = deadline.share(0.75) if deadline is not None else None
+        return await run_stage_async(
+            deadline,
+            self.render(spec, timeout),
+            0.75,
+            fallback=lambda: self.io(render_plot, low_resolution(spec)),
+            positions=positions,
+            reason="low-resolution plot",
+        )
+
+    async def rendered(self, pairs, deadline=None):
+        """(key, answer) pairs with every Plot rendered, all plots drawing at once"""
+        plots = {
+            key: asyncio.ensure_future(self.render_within(answer.spec, deadline, positions=(answer.position,)))
+            for key, answer in pairs if isinstance(answer, Plot)
+        }
+        try:
+            for key, answer in pairs:
+                yield key, await plots[key] if key in plots else answer
+        finally:
+            for plot in plots.values():
+                plot.cancel()
+
+    def stream(self, question, deadline=None, attachments=()):
+        """Async generator of (index or question, answer) as each answer is ready"""
+        dataset, plans = route(question)
+        if dataset == MOVIES:
+            return self.movies(plans, deadline)
+        if dataset == COURT:
+            return self.court(plans, deadline)
+        return self.generic(attachments, deadline)
+
+    async def run(self, question, deadline=None, attachments=()):
+        """All answers for question, assembled once the last one is ready"""
+        return assemble({key: answer async for key, answer in self.stream(question, deadline, attachments)})
+
+    async def movies(self, plans=None, deadline=None):
+        # Fetch (or reuse the snapshot of) the page while the DuckDB pool warms up
+        fetch = run_stage_async(
+            deadline,
+            self.io(scrape_table),
+            0.5,
+            fallback=lambda: self.io(scrape_table, offline=True),
+            positions=(0, 1, 2, 3),
+            reason="cached page",
+        )
+        df, _ = await asyncio.gather(fetch, self.db(get_pool().warm))
+        if df is None:
+            if deadline is not None:
+                deadline.mark(("*",), "default answers")
+            answers = [*enumerate(DEFAULT_MOVIE_ANSWERS), (3, FALLBACK_PLOT)]
+        else:
+            # The same answers as the Flask server, on a DuckDB thread
+            answers = await self.db(list, iter_movies(df, plans))
+        async for pair in self.rendered(answers, deadline):
+            yield pair
+
+    async def court(self, plans=None, deadline=None):
+        if deadline is not None:
+            # Refresh the store on its own connection within a share of the
+            # deadline, then answer from whatever the store holds
+            leased = []
+            await run_stage_async(
+                deadline,
+                self.db(refresh_court_store, needed_scopes(plans) if plans else QUESTION_SCOPES,
+                        on_lease=leased.append),
+                0.6,
+                fallback=lambda: 0,
+                positions=(0, 1, 2),
+                reason="cached court summary",
+                interrupt=lambda: [conn.interrupt() for conn in leased],
+            )
+        # With a deadline the summary itself is built as an interruptible stage,
+        # so an overrunning scan gives its connection back instead of running on
+        answers = await self.db(list, iter_court(plans, deadline, refresh=deadline is None))
+        async for pair in self.rendered(answers, deadline):
+            yield pair
+
+    async def generic(self, attachments=(), deadline=None):
+        # Summarised and binned in DuckDB over the spooled files, never loaded whole
+        answers = await self.db(generic_answers, attachments)
+        async for pair in self.rendered(answers, deadline):
+            yield pair
+
+    def close(self):
+        self._io.shutdown(wait=False)
+        self._db.shutdown(wait=False)
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    """Return the process-wide pipeline, creating it on first use"""
+    global _pipeline
+    # A forked worker must not reuse its parent's executor threads
+    if _pipeline is None or _pipeline.pid != os.getpid():
+        with _pipeline_lock:
+            if _pipeline is None or _pipeline.pid != os.getpid():
+                _pipeline = Pipeline()
+    return _pipeline
@@ -0,0 +1,314 @@
+"""Compile task questions into small executable plans.
+
+Each question is reduced to a template: literals (amounts, years, court ids,
+other numbers) are lifted out, words are lower-cased, folded onto a shared
+vocabulary and stripped of filler, so "How many $2 bn movies were released
+before 2020?" and "how many films released before 2010 grossed $1 billion"
+differ only in their literals. The template is compiled once into a recipe
+(count with filter, earliest over a threshold, correlation, regression
+slope, top court, plot) and cached; a repeated or reworded question only
+binds its literals to the cached recipe.
+
+A bound ``Plan`` records the columns (movies) or partitions (court) it needs,
+so the caller registers and scans no more than that.
+"""
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+from utils.court import delay_regression, top_court
+from utils.stats import correlation, count_where, first_where
+
+MOVIES = "movies"
+COURT = "court"
+
+COUNT = "count"
+EARLIEST = "earliest"
+CORRELATION = "correlation"
+SLOPE = "slope"
+TOP = "top"
+PLOT = "plot"
+
+Plan = namedtuple("Plan", "op dataset columns scopes params")
+
+# Movie columns as they appear in questions, by their cleaned frame names
+MOVIE_COLUMNS = {
+    "rank": "Rank",
+    "peak": "Peak",
+    "title": "Title",
+    "year": "Year",
+    "gross": "Worldwide_Gross",
+}
+
+_SCALES = {
+    "k": 1e3, "thousand": 1e3,
+    "m": 1e6, "mn": 1e6, "million": 1e6,
+    "b": 1e9, "bn": 1e9, "billion": 1e9,
+    "tn": 1e12, "trillion": 1e12,
+}
+_UNITS = "|".join(sorted(_SCALES, key=len, reverse=True))
+
+# Lifted out in this order, so "$2 bn" is an amount and not a number
+_LITERALS = (
+    ("amount", re.compile(rf"\$\s*(\d+(?:\.\d+)?)\s*({_UNITS})?\b|\b(\d+(?:\.\d+)?)\s*({_UNITS})\b", re.I)),
+    ("court", re.compile(r"\b\d+_\d+\b")),
+    ("year", re.compile(r"\b(?:1[5-9]\d\d|20\d\d|2100)\b")),
+    ("number", re.compile(r"\b\d[\d,]*(?:\.\d+)?\b")),
+)
+
+_SYNONYMS = {
+    "film": "movie", "films": "movie", "movies": "movie",
+    "grossed": "gross", "grossing": "gross", "earned": "gross", "revenue": "gross",
+    "released": "release", "releases": "release", "came": "release",
+    "first": "earliest", "oldest": "earliest",
+    "correlated": "correlation", "corr": "correlation",
+    "draw": "plot", "chart": "plot", "graph": "plot", "plotted": "plot",
+    "scatter": "scatterplot",
+    "cases": "case", "judgments": "case", "judgements": "case", "decisions": "case",
+    "disposed": "dispose", "decided": "dispose",
+    "days": "delay", "day": "delay", "delays": "delay",
+    "prior": "before", "earlier": "before",
+    "later": "after", "since": "after",
+}
+_FILLER = {
+    "a", "an", "the", "of", "in", "is", "was", "were", "what", "whats", "s", "that",
+    "did", "do", "does", "by", "to", "as", "it", "its", "and", "along", "with", "through",
+    "from", "for", "there", "are", "have", "has", "been", "this", "these", "above", "question",
+}
+_WORD = re.compile(r"<\w+>|[a-z][a-z_]*")
+
+_QUOTED_KEY = re.compile(r'^\s*"(?P<question>[^"]+)"\s*:')
+_NUMBERED = re.compile(r"^\s*\d+[.)]\s+(?P<question>.+)$")
+
+
+def _last_key_block(lines):
+    """Keys of the last JSON object spelled out in the task (sample rows come before it)"""
+    blocks, current = [], None
+    for line in lines:
+        match = _QUOTED_KEY.match(line)
+        if match:
+            if current is None:
+                current = []
+                blocks.append(current)
+            current.append(match.group("question").strip())
+        elif line.strip() not in ("", "{", "}", "```", "```json"):
+            current = None
+    return blocks[-1] if blocks else []
+
+
+def split_questions(task):
+    """Questions in a task: JSON object keys, else numbered items, else lines with '?'"""
+    lines = task.splitlines()
+    keys = _last_key_block(lines)
+    if keys:
+        return keys
+    numbered, current = [], None
+    for line in lines:
+        match = _NUMBERED.match(line)
+        if match:
+            current = [match.group("question").strip()]
+            numbered.append(current)
+        elif current is not None and line.strip():
+            current.append(line.strip())
+        else:
+            current = None
+    if numbered:
+        return [" ".join(parts) for parts in numbered]
+    return [line.strip() for line in lines if "?" in line]
+
+
+def _amount(match):
+    number, unit = (match.group(1), match.group(2)) if match.group(1) else (match.group(3), match.group(4))
+    return float(number) * _SCALES.get((unit or "").lower(), 1)
+
+
+def template(question):
+    """(template key, {kind: [literal values in order]}) for a question"""
+    literals = {kind: [] for kind, _ in _LITERALS}
+    text = question
+    for kind, pattern in _LITERALS:
+        def lift(match, kind=kind):
+            if kind == "amount":
+                literals[kind].append(_amount(match))
+            elif kind == "court":
+                literals[kind].append(match.group(0))
+            elif kind == "year":
+                literals[kind].append(int(match.group(0)))
+            else:
+                literals[kind].append(float(match.group(0).replace(",", "")))
+            return f" <{kind}> "
+        text = pattern.sub(lift, text)
+    words = []
+    for word in _WORD.findall(text.lower()):
+        word = _SYNONYMS.get(word, word)
+        if word not in _FILLER:
+            words.append(word)
+    return " ".join(words), literals
+
+
+def _mentioned_columns(words):
+    columns = []
+    for word in words:
+        column = MOVIE_COLUMNS.get(word)
+        if column and column not in columns:
+            columns.append(column)
+    return columns
+
+
+def _recipe(key):
+    """(op, dataset, fixed parameters) for a template key, or None if unrecognized"""
+    words = key.split()
+    vocabulary = set(words)
+    columns = _mentioned_columns(words)
+    plot = vocabulary & {"plot", "scatterplot"}
+
+    if plot and "delay" in vocabulary:
+        return PLOT, COURT, {"fit": "regression" in vocabulary or "line" in vocabulary}
+    if vocabulary & {"slope", "regression"} and "<court>" in vocabulary:
+        return SLOPE, COURT, {}
+    if "court" in vocabulary and "most" in vocabulary and words.count("<year>") >= 2:
+        return TOP, COURT, {}
+    if plot and len(columns) >= 2:
+        return PLOT, MOVIES, {"x": columns[0], "y": columns[1], "fit": "regression" in vocabulary or "line" in vocabulary}
+    if {"how", "many"} <= vocabulary and "<amount>" in vocabulary and "<year>" in vocabulary:
+        if vocabulary & {"before", "after"}:
+            return COUNT, MOVIES, {"cmp": "<" if "before" in vocabulary else ">"}
+    if "earliest" in vocabulary and "<amount>" in vocabulary:
+        return EARLIEST, MOVIES, {}
+    if "correlation" in vocabulary and len(columns) >= 2:
+        return CORRELATION, MOVIES, {"x": columns[0], "y": columns[1]}
+    return None
+
+
+def _bind(recipe, literals, context):
+    """Plan for a recipe and one question's literals, or None if a literal is missing"""
+    op, dataset, fixed = recipe
+    amounts, years, courts = literals["amount"], literals["year"], literals["court"]
+    if op == COUNT:
+        where = f"Worldwide_Gross >= ? AND Year {fixed['cmp']} ?"
+        return Plan(op, dataset, ("Worldwide_Gross", "Year"), (), {"where": where, "args": [amounts[0], years[0]]})
+    if op == EARLIEST:
+        return Plan(op, dataset, ("Title", "Year", "Worldwide_Gross"), (),
+                    {"value": "Title", "order_by": "Year", "where": "Worldwide_Gross >= ?", "args": [amounts[0]]})
+    if op == CORRELATION:
+        return Plan(op, dataset, (fixed["x"], fixed["y"]), (), dict(fixed))
+    if op == PLOT and dataset == MOVIES:
+        return Plan(op, dataset, (fixed["x"], fixed["y"]), (), dict(fixed))
+    if op == TOP:
+        start, end = int(min(years[:2])), int(max(years[:2]))
+        return Plan(op, dataset, (), ({"years": (start, end)},), {"start": start, "end": end})
+    # Slope and plot are per court; a plot "from the above question" reuses its court
+    court = courts[0] if courts else context.get("court")
+    if court is None:
+        return None
+    context["court"] = court
+    return Plan(op, dataset, (), ({"courts": (court,)},), {"court": court, **fixed})
+
+
+class PlanCache:
+    """Compiled recipes by question template, most recently used last"""
+
+    def __init__(self, size=256):
+        self.size = size
+        self._recipes = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def recipe(self, key):
+        with self._lock:
+            if key in self._recipes:
+                self._recipes.move_to_end(key)
+                self._stats["hits"] += 1
+                return self._recipes[key]
+            self._stats["misses"] += 1
+        recipe = _recipe(key)
+        with self._lock:
+            self._recipes[key] = recipe
+            while len(self._recipes) > self.size:
+                self._recipes.popitem(last=False)
+        return recipe
+
+    def compile(self, questions):
+        """[(question, Plan or None)] in order; later questions may refer to earlier ones"""
+        context = {}
+        compiled = []
+        for question in questions:
+            key, literals = template(question)
+            recipe = self.recipe(key)
+            plan = None
+            if recipe is not None:
+                try:
+                    plan = _bind(recipe, literals, context)
+                except IndexError:
+                    plan = None
+            compiled.append((question, plan))
+        return compiled
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "templates": len(self._recipes)}
+
+
+def run_plan(conn, plan, relation=MOVIES):
+    """Scalar answer for a plan on a leased connection; plots are drawn by the caller
+
+    Movie plans run against the registered frame named by relation, court
+    plans against the court summary table.
+    """
+    params = plan.params
+    if plan.op == COUNT:
+        return count_where(conn, relation, params["where"], params["args"])
+    if plan.op == EARLIEST:
+        return first_where(conn, relation, params["value"], params["order_by"], params["where"], params["args"])
+    if plan.op == CORRELATION:
+        return correlation(conn, relation, params["x"], params["y"])
+    if plan.op == TOP:
+        return top_court(conn, params["start"], params["end"])
+    if plan.op == SLOPE:
+        return delay_regression(conn, params["court"])[0]
+    raise ValueError(f"{plan.op} plans are not scalar")
+
+
+def plans_dataset(compiled):
+    """The one dataset every question was compiled for, or None"""
+    datasets = {plan.dataset if plan else None for _, plan in compiled}
+    if len(datasets) == 1 and None not in datasets:
+        return datasets.pop()
+    return None
+
+
+def needed_columns(compiled):
+    columns = []
+    for _, plan in compiled:
+        for column in plan.columns:
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+def needed_scopes(compiled):
+    scopes = []
+    for _, plan in compiled:
+        for scope in plan.scopes:
+            if scope not in scopes:
+                scopes.append(scope)
+    return tuple(scopes)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_plan_cache():
+    """Return the process-wide plan cache, creating it on first use"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PlanCache()
+    return _cache
+
+
+def compile_task(task):
+    """Split a task into questions and compile them with the shared plan cache"""
+    return get_plan_cache().compile(split_questions(task))
@@ -0,0 +1,449 @@
+"""Preforked serving: warm once in a master process, fork workers that share it.
+
+    python -m utils.prefork main:app --workers 4 --port 10000
+    python -m utils.prefork app:app --workers 4 --port 5000
+
+The master binds the listening socket, imports the app and runs the
+fork-safe warm-up steps (imports, font cache, a first figure, the cleaned
+movies snapshot, the court store rows), then freezes the garbage collector
+so that state stays in pages the workers share copy-on-write, and forks
+``--workers`` processes that accept on the same socket. ASGI apps are
+served by uvicorn, WSGI apps by werkzeug's threaded server. Each worker
+opens its own DuckDB pool and draws plots itself (``RENDER_INLINE=1``
+unless set otherwise); the resource budget is split between them.
+
+A worker is recycled once it has served ``--max-requests`` requests (plus
+some jitter, so they do not all go at once) or its resident memory passes
+``--max-rss-mb``: it stops accepting, finishes what it has in flight and
+exits, and the master forks a fresh one from the warm state. SIGHUP
+recycles every worker one at a time: the master forks a replacement, waits
+until it is serving, then stops the old worker and waits for it to exit
+before moving on, so capacity never drops. SIGTERM/SIGINT shut down
+gracefully.
+"""
+import argparse
+import gc
+import importlib
+import inspect
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from collections import deque
+
+# Set in a worker process: its index, pid, requests served and recycle limits
+_worker = None
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def rss_mb():
+    """Resident memory of this process in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def worker_stats():
+    """This worker's index, pid, requests served and memory, or None outside a preforked server"""
+    if _worker is None:
+        return None
+    return {
+        "index": _worker.index,
+        "pid": os.getpid(),
+        "requests": _worker.requests,
+        "max_requests": _worker.max_requests,
+        "rss_mb": round(rss_mb(), 1),
+        "uptime_seconds": round(time.monotonic() - _worker.started, 1),
+    }
+
+
+class _Recycler:
+    """Counts a worker's requests and asks it to stop once it is due for recycling"""
+
+    def __init__(self, index, max_requests, max_rss_mb, stop):
+        self.index = index
+        self.max_requests = max_requests
+        self.max_rss_mb = max_rss_mb
+        self.requests = 0
+        self.inflight = 0
+        self.started = time.monotonic()
+        self._stop = stop
+        self._stopping = False
+        self._lock = threading.Lock()
+
+    def begin(self):
+        with self._lock:
+            self.inflight += 1
+
+    def end(self):
+        with self._lock:
+            self.inflight -= 1
+            self.requests += 1
+            due = self.max_requests and self.requests >= self.max_requests
+            if not due and self.max_rss_mb:
+                due = rss_mb() > self.max_rss_mb
+            if not due or self._stopping:
+                return
+            self._stopping = True
+        print(f"Recycling worker {self.index} (pid {os.getpid()}) after {self.requests} requests, "
+              f"{rss_mb():.0f} MB resident")
+        self._stop()
+
+    def wrap_asgi(self, app):
+        async def recycled(scope, receive, send):
+            if scope["type"] != "http":
+                return await app(scope, receive, send)
+            self.begin()
+            try:
+                await app(scope, receive, send)
+            finally:
+                self.end()
+        return recycled
+
+    def wrap_wsgi(self, app):
+        def recycled(environ, start_response):
+            self.begin()
+            body = None
+            try:
+                # Iterated here so the request counts once its body is sent
+                body = app(environ, start_response)
+                for chunk in body:
+                    yield chunk
+            finally:
+                if hasattr(body, "close"):
+                    body.close()
+                self.end()
+        return recycled
+
+
+def load_app(target):
+    """The object named by 'module:attribute'"""
+    module_name, _, attribute = target.partition(":")
+    return getattr(importlib.import_module(module_name), attribute or "app")
+
+
+def is_asgi(app):
+    call = getattr(app, "__call__", None)
+    return inspect.iscoroutinefunction(app) or inspect.iscoroutinefunction(call)
+
+
+def _serve_asgi(app, sock, options, recycler_for, ready):
+    import uvicorn
+
+    server = None
+
+    def stop():
+        server.should_exit = True
+
+    recycler = recycler_for(stop)
+    config = uvicorn.Config(
+        recycler.wrap_asgi(app),
+        log_level=options.log_level,
+        timeout_graceful_shutdown=options.graceful_timeout,
+    )
+    server = uvicorn.Server(config)
+    startup = server.startup
+
+    async def started(sockets=None):
+        await startup(sockets=sockets)
+        if server.started:
+            ready()
+
+    server.startup = started
+    # uvicorn's own SIGTERM/SIGINT handling drains the worker gracefully
+    server.run(sockets=[sock])
+
+
+def _serve_wsgi(app, sock, options, recycler_for, ready):
+    from werkzeug.serving import make_server
+
+    from utils.warmup import start_warmup
+
+    server = None
+
+    def stop():
+        # shutdown() waits for serve_forever, so it cannot run on a request thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    recycler = recycler_for(stop)
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, recycler.wrap_wsgi(app), threaded=True, fd=sock.fileno())
+    signal.signal(signal.SIGTERM, lambda *_: stop())
+    signal.signal(signal.SIGINT, lambda *_: stop())
+    start_warmup()
+    ready()
+    server.serve_forever()
+    # Let in-flight requests finish before the process goes away
+    deadline = time.monotonic() + options.graceful_timeout
+    while recycler.inflight and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+
+def _run_worker(index, app, sock, options, ready=lambda: None):
+    for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+        signal.signal(signum, signal.SIG_DFL)
+    random.seed()
+
+    def recycler_for(stop):
+        global _worker
+        jitter = random.randint(0, options.max_requests_jitter) if options.max_requests else 0
+        _worker = _Recycler(index, options.max_requests + jitter, options.max_rss_mb, stop)
+        return _worker
+
+    if is_asgi(app):
+        _serve_asgi(app, sock, options, recycler_for, ready)
+    else:
+        _serve_wsgi(app, sock, options, recycler_for, ready)
+
+
+def _notifier(fd):
+    """Callable that tells the master, once, that this worker is serving"""
+    def ready():
+        nonlocal fd
+        if fd is not None:
+            try:
+                os.write(fd, b"1")
+                os.close(fd)
+            except OSError:
+                pass
+            fd = None
+    return ready
+
+
+class Master:
+    """Forks and supervises the workers, replacing any that exit"""
+
+    def __init__(self, app, sock, options):
+        self.app = app
+        self.sock = sock
+        self.options = options
+        self.workers = {}
+        self._spawned = {}
+        self._stopping = False
+        self._recycle_all = False
+        # Read ends of the pipes workers write to once they are serving
+        self._ready = {}
+        # (pid, index) of workers a SIGHUP still has to replace, and the replacement in progress
+        self._rolling = deque()
+        self._replacing = None
+        # Workers stopped because a replacement took over; not respawned when they exit
+        self._retired = set()
+
+    def spawn(self, index):
+        # Otherwise buffered output would be written again by the child
+        sys.stdout.flush()
+        sys.stderr.flush()
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            for fd in self._ready.values():
+                os.close(fd)
+            code = 0
+            try:
+                _run_worker(index, self.app, self.sock, self.options, _notifier(ready_w))
+            except BaseException as e:
+                print(f"Error in worker {index}: {e}")
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        os.close(ready_w)
+        self._ready[pid] = ready_r
+        self.workers[pid] = index
+        self._spawned[index] = time.monotonic()
+        print(f"Started worker {index} (pid {pid})")
+        return pid
+
+    def _on_stop(self, *_):
+        self._stopping = True
+
+    def _on_hup(self, *_):
+        self._recycle_all = True
+
+    def _signal_workers(self, signum):
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _reap(self):
+        """Indexes of workers that have exited"""
+        exited = []
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            fd = self._ready.pop(pid, None)
+            if fd is not None:
+                os.close(fd)
+            index = self.workers.pop(pid, None)
+            if index is not None and pid not in self._retired:
+                exited.append(index)
+                if os.waitstatus_to_exitcode(status) not in (0, -signal.SIGTERM):
+                    print(f"Worker {index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}")
+        return exited
+
+    def _serving(self, pid):
+        """True once a worker has said it is serving, or has exited without doing so"""
+        fd = self._ready.get(pid)
+        if fd is None:
+            return True
+        if not select.select([fd], [], [], 0)[0]:
+            return False
+        os.close(self._ready.pop(pid))
+        return True
+
+    def _start_rolling(self):
+        """Queue every worker for replacement, except one already being replaced"""
+        replacing = (self._replacing["old"], self._replacing["new"]) if self._replacing else ()
+        self._rolling = deque((pid, index) for pid, index in self.workers.items() if pid not in replacing)
+
+    def _roll(self):
+        """Advance a SIGHUP recycle by one step; never blocks"""
+        if self._replacing is None:
+            while self._rolling:
+                old, index = self._rolling.popleft()
+                if old in self.workers:
+                    print(f"Replacing worker {index} (pid {old})")
+                    self._retired.add(old)
+                    self._replacing = {"old": old, "new": self.spawn(index), "started": time.monotonic(),
+                                       "stopped": False}
+                    return
+            return
+        step = self._replacing
+        if not step["stopped"]:
+            # The old worker keeps serving until its replacement does (or fails to start in time)
+            waited = time.monotonic() - step["started"]
+            if not self._serving(step["new"]) and waited < self.options.graceful_timeout:
+                return
+            step["stopped"] = True
+            if step["old"] in self.workers:
+                try:
+                    os.kill(step["old"], signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+        if step["old"] in self.workers:
+            return
+        self._retired.discard(step["old"])
+        self._replacing = None
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_hup)
+        for index in range(self.options.workers):
+            self.spawn(index)
+        while not self._stopping:
+            if self._recycle_all:
+                self._recycle_all = False
+                print("Recycling all workers, one at a time")
+                self._start_rolling()
+            self._roll()
+            for index in self._reap():
+                if self._stopping:
+                    break
+                # A worker that dies straight after starting is not respawned in a tight loop
+                if time.monotonic() - self._spawned.get(index, 0) < 1.0:
+                    time.sleep(1.0)
+                self.spawn(index)
+            time.sleep(0.2)
+        self.shutdown()
+
+    def shutdown(self):
+        print(f"Stopping {len(self.workers)} workers")
+        self._signal_workers(signal.SIGTERM)
+        deadline = time.monotonic() + self.options.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        self._signal_workers(signal.SIGKILL)
+        self._reap()
+        for fd in self._ready.values():
+            os.close(fd)
+        self._ready.clear()
+        self.sock.close()
+
+
+def listen(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def share_budget(workers):
+    """Split the memory, CPU and spill budget between the workers, unless set explicitly"""
+    from utils.admission import ResourceBudget
+
+    budget = ResourceBudget()
+    os.environ.setdefault("RESOURCE_MEMORY_MB", str(max(256, budget.memory_mb // workers)))
+    os.environ.setdefault("RESOURCE_CPUS", str(max(1, budget.cpus // workers)))
+    os.environ.setdefault("RESOURCE_SPILL_MB", str(max(256, budget.spill_mb // workers)))
+    # The workers are the parallelism; a render pool per worker would oversubscribe
+    os.environ.setdefault("RENDER_INLINE", "1")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("app", nargs="?", default="main:app", help="module:attribute of the ASGI or WSGI app")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=_env_int("PORT", 10000))
+    parser.add_argument("--workers", type=int,
+                        default=_env_int("PREFORK_WORKERS", _env_int("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--max-requests", type=int, default=_env_int("PREFORK_MAX_REQUESTS", 1000),
+                        help="recycle a worker after this many requests (0 = never)")
+    parser.add_argument("--max-requests-jitter", type=int, default=_env_int("PREFORK_MAX_REQUESTS_JITTER", 100))
+    parser.add_argument("--max-rss-mb", type=int, default=_env_int("PREFORK_MAX_RSS_MB", 0),
+                        help="recycle a worker whose resident memory passes this (0 = never)")
+    parser.add_argument("--graceful-timeout", type=int, default=_env_int("PREFORK_GRACEFUL_TIMEOUT", 30))
+    parser.add_argument("--log-level", default=os.environ.get("LOG_LEVEL", "info"))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    options.workers = max(1, options.workers)
+    share_budget(options.workers)
+    sock = listen(options.host, options.port)
+
+    from utils.warmup import preload
+
+    app = load_app(options.app)
+    started = time.perf_counter()
+    preload()
+    # Whatever the master holds now stays in shared pages: a frozen object is
+    # never touched by a worker's garbage collector, so its page is not copied
+    gc.collect()
+    gc.freeze()
+    print(f"Preloaded {options.app} in {time.perf_counter() - started:.1f}s; "
+          f"serving on {options.host}:{options.port} with {options.workers} workers")
+    Master(app, sock, options).run()
+
+
+if __name__ == "__main__":
+    # Run as the importable module, so worker_stats() sees this worker's state
+    from utils.prefork import main as run
+
+    run()
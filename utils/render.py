@@ -0,0 +1,303 @@
+"""Plot rendering off the request path.
+
+Plots are described by plain dicts ("specs") and drawn with the object
+oriented ``Figure`` API in a bounded process pool, so concurrent requests
+never share pyplot state and CPU-heavy rendering does not block the server.
+Each worker keeps one pre-built figure per plot kind and only swaps the
+data artists between renders. Scatters past the density threshold are drawn
+as a binned image (see ``utils.density``).
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import LogNorm
+from matplotlib.figure import Figure
+
+from utils.density import prepare_spec
+from utils.encoder import DEFAULT_MAX_CHARS, FALLBACK_PLOT, encode_figure
+from utils.tracing import FALLBACKS, span
+
+# Defaults per plot kind; a spec only needs the data and whatever differs
+PLOT_KINDS = {
+    "scatter_fit": {
+        "figsize": (10, 6),
+        "xlabel": "Rank",
+        "ylabel": "Peak",
+        "title": "Rank vs Peak Scatterplot",
+        "alpha": 0.6,
+        "size": 50,
+        "line_style": "r--",
+        "formats": ("png", "webp"),
+        "dpi": 100,
+        "max_chars": DEFAULT_MAX_CHARS,
+    },
+    "court_delay": {
+        "figsize": (10, 6),
+        "xlabel": "Year",
+        "ylabel": "Days of Delay",
+        "title": "Court Case Delay Analysis (33_10)",
+        "alpha": 0.7,
+        "size": 60,
+        "line_style": "r-",
+        "formats": ("webp", "png"),
+        "dpi": 100,
+        "max_chars": DEFAULT_MAX_CHARS,
+    },
+}
+
+# What a plot is downgraded to when its request runs out of time: cheap to
+# draw and encode inline, whatever the pool is doing
+LOW_RESOLUTION = {"dpi": 40, "max_chars": 30_000, "formats": ("webp", "png")}
+
+_local = threading.local()
+
+
+def _template(kind, figsize):
+    """Figure and axes for kind, built once per worker (or thread when inline)"""
+    templates = getattr(_local, "templates", None)
+    if templates is None:
+        templates = _local.templates = {}
+    key = (kind, tuple(figsize))
+    if key not in templates:
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        ax.grid(True, alpha=0.3)
+        templates[key] = (fig, ax)
+    return templates[key]
+
+
+def _init_worker():
+    for kind, defaults in PLOT_KINDS.items():
+        _template(kind, defaults["figsize"])
+
+
+def _fit_line(x, y, fit):
+    if fit is not None and fit[0] is not None:
+        return np.poly1d(fit)
+    if y is not None and len(x) > 1:
+        return np.poly1d(np.polyfit(x, y, 1))
+    return None
+
+
+def plot_options(spec):
+    """spec filled in with its kind's defaults"""
+    kind = spec.get("kind", "scatter_fit")
+    return {**PLOT_KINDS[kind], "kind": kind, **spec}
+
+
+def _draw_density(ax, options):
+    counts, xedges, yedges = options["density"]
+    image = ax.imshow(
+        np.ma.masked_equal(counts.T, 0),
+        origin="lower",
+        extent=(xedges[0], xedges[-1], yedges[0], yedges[-1]),
+        aspect="auto",
+        interpolation="nearest",
+        cmap="Blues",
+        norm=LogNorm(vmin=1, vmax=max(1, counts.max())),
+    )
+    x = np.array([xedges[0], xedges[-1]])
+    return [image], x, None
+
+
+def draw(options, added):
+    """Draw onto the kind's template, appending every artist it adds to added; returns fig"""
+    fig, ax = _template(options["kind"], options["figsize"])
+    # The template is empty here, so this drops the previous render's data limits
+    ax.relim()
+    if options.get("density") is not None:
+        artists, x, y = _draw_density(ax, options)
+        added.extend(artists)
+    else:
+        x = np.asarray(options["x"], dtype=float)
+        y = np.asarray(options["y"], dtype=float)
+        # Explicit colour: the axes colour cycle would advance on every reuse
+        added.append(ax.scatter(x, y, color="C0", alpha=options["alpha"], s=options["size"]))
+    line = _fit_line(x, y, options.get("fit"))
+    if line is not None:
+        order = np.argsort(x)
+        added.extend(ax.plot(x[order], line(x[order]), options["line_style"], alpha=0.8, linewidth=2))
+    ax.set_xlabel(options["xlabel"])
+    ax.set_ylabel(options["ylabel"])
+    ax.set_title(options["title"])
+    ax.autoscale_view()
+    return fig
+
+
+@contextmanager
+def drawn(options):
+    """Draw options onto its template and clear it again afterwards, even if drawing fails"""
+    added = []
+    try:
+        yield draw(options, added)
+    finally:
+        # Put the template back the way it was for the next render
+        for artist in added:
+            artist.remove()
+
+
+def render_plot_report(spec):
+    """Render spec to a data URI within its size budget; returns (uri, encoder report)"""
+    options = plot_options(prepare_spec(spec))
+    with drawn(options) as fig:
+        return encode_figure(fig, max_chars=options["max_chars"], formats=options["formats"], dpi=options["dpi"])
+
+
+def render_plot(spec):
+    """Render spec to a base64 data URI (runs inside a worker process)"""
+    uri, report = render_plot_report(spec)
+    if not report["within_budget"]:
+        # Even the smallest encoding is over: the client would reject it anyway
+        print(f"Error: plot over its size budget at {report['uri_length']} characters, using a placeholder")
+        return FALLBACK_PLOT
+    return uri
+
+
+class RenderService:
+    """Bounded process pool that renders plot specs, with sync and async entry points"""
+
+    def __init__(self, workers=None, max_pending=None, inline=None):
+        self.pid = os.getpid()
+        self.workers = workers or int(os.environ.get("RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+        self.inline = os.environ.get("RENDER_INLINE") == "1" if inline is None else inline
+        self._slots = threading.BoundedSemaphore(max_pending or self.workers * 4)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # forkserver keeps workers clear of the server's threads and
+                    # DuckDB connections while still sharing the matplotlib import
+                    context = multiprocessing.get_context(
+                        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                    )
+                    if context.get_start_method() == "forkserver":
+                        context.set_forkserver_preload(["utils.render"])
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=context, initializer=_init_worker
+                    )
+        return self._executor
+
+    @staticmethod
+    def _inline(spec, report=False):
+        future = Future()
+        try:
+            future.set_result(render_plot_report(spec) if report else render_plot(spec))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def submit(self, spec, report=False, timeout=None):
+        """Future for the data URI of spec (with the encoder report if asked)
+
+        Blocks while the queue is full, for at most timeout seconds, then
+        raises concurrent.futures.TimeoutError.
+        """
+        if self.inline:
+            return self._inline(spec, report)
+        # Bin large scatters here so only a fixed-size grid crosses the process boundary
+        spec = prepare_spec(spec)
+        if not self._slots.acquire(timeout=timeout):
+            raise FutureTimeout(f"render queue still full after {timeout:.1f}s")
+        try:
+            future = self._pool().submit(render_plot_report if report else render_plot, spec)
+        except BrokenProcessPool as e:
+            self._slots.release()
+            print(f"Error submitting plot, rendering inline: {e}")
+            self._reset()
+            return self._inline(spec, report)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def render(self, spec, timeout=None, report=False):
+        with span("plot") as attrs:
+            started = time.monotonic()
+            try:
+                future = self.submit(spec, report, timeout)
+                result = future.result(None if timeout is None else max(0.0, timeout - (time.monotonic() - started)))
+            except BrokenProcessPool as e:
+                print(f"Error in render worker, rendering inline: {e}")
+                FALLBACKS.inc(reason="inline plot")
+                self._reset()
+                result = render_plot_report(spec) if report else render_plot(spec)
+            attrs["bytes"] = _encoded_size(result)
+            return result
+
+    async def render_async(self, spec, report=False, timeout=None):
+        """render without blocking the event loop; a full queue is waited for at most timeout seconds"""
+        with span("plot") as attrs:
+            try:
+                future = self.submit(spec, report, timeout=0)
+            except FutureTimeout:
+                # Queue full: wait for a slot off the event loop
+                future = await asyncio.get_running_loop().run_in_executor(None, self.submit, spec, report, timeout)
+            result = await asyncio.wrap_future(future)
+            attrs["bytes"] = _encoded_size(result)
+            return result
+
+    def _reset(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        self._reset()
+
+
+def _encoded_size(result):
+    """Length of the data URI in a render result"""
+    return len(result[0] if isinstance(result, tuple) else result)
+
+
+def low_resolution(spec):
+    """spec downgraded for a request that is out of time"""
+    return {**prepare_spec(spec), **LOW_RESOLUTION}
+
+
+def render_within(spec, deadline, positions=(), fraction=0.75):
+    """Render spec in the pool within its share of deadline, else a low-resolution copy inline
+
+    The default share leaves a quarter of the remaining time for the fallback.
+    """
+    if deadline is None:
+        return get_renderer().render(spec)
+    try:
+        return get_renderer().render(spec, timeout=deadline.share(fraction))
+    except FutureTimeout:
+        print("Plot over its budget, rendering at low resolution")
+        deadline.mark(positions, "low-resolution plot")
+        with span("plot_fallback") as attrs:
+            uri = render_plot(low_resolution(spec))
+            attrs["bytes"] = len(uri)
+            return uri
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_renderer():
+    """Return the process-wide render service, creating it on first use"""
+    global _service
+    # A forked worker must not reuse its parent's render processes
+    if _service is None or _service.pid != os.getpid():
+        with _service_lock:
+            if _service is None or _service.pid != os.getpid():
+                _service = RenderService()
+    return _service
@@ -0,0 +1,227 @@
+"""In-memory cache of whole responses, keyed by the normalized task.
+
+The same task files (question.txt, the movies prompt in test_api.py) are
+posted over and over; each one used to re-run the whole pipeline, and
+simultaneous copies ran it in parallel. Responses are now kept for
+``RESULT_CACHE_TTL`` seconds in an LRU bounded by ``RESULT_CACHE_MAX_MB``,
+and concurrent identical requests are coalesced onto one computation
+(single-flight): the first caller computes, the rest wait for its result.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from utils.serialize import dumps
+
+# Bump when answers change for the same task so old entries are not reused
+RESULT_CACHE_VERSION = 1
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def normalize_task(text):
+    """Task text with encoding, line-ending and whitespace differences removed"""
+    if isinstance(text, bytes):
+        text = text.decode("utf-8", errors="replace")
+    text = unicodedata.normalize("NFC", text).lstrip("\ufeff")
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def fingerprint(task, attachments=()):
+    """Cache key for a task and its attachments, given as (name, bytes, file object or path)"""
+    digest = hashlib.sha256(f"v{RESULT_CACHE_VERSION}\0".encode("utf-8"))
+    digest.update(normalize_task(task).encode("utf-8"))
+    for name, content in sorted(attachments, key=lambda item: item[0] or ""):
+        digest.update(f"\0{name}\0".encode("utf-8"))
+        if isinstance(content, (bytes, bytearray)):
+            digest.update(content)
+            continue
+        if isinstance(content, str):
+            with open(content, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            continue
+        # File objects are hashed in chunks and rewound for the handler
+        position = content.tell()
+        for chunk in iter(lambda: content.read(1 << 20), b""):
+            digest.update(chunk)
+        content.seek(position)
+    return digest.hexdigest()
+
+
+def _size(value):
+    try:
+        return len(dumps(value))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+
+def _shared_error(e):
+    """The error waiting callers see; the leader's cancellation is not theirs"""
+    if isinstance(e, Exception):
+        return e
+    return RuntimeError(f"shared computation aborted: {type(e).__name__}")
+
+
+class ResultCache:
+    """TTL + size-bounded LRU of computed responses with single-flight coalescing"""
+
+    def __init__(self, ttl=None, max_bytes=None):
+        self.ttl = _env_float("RESULT_CACHE_TTL", 600) if ttl is None else ttl
+        self.max_bytes = int(_env_float("RESULT_CACHE_MAX_MB", 64) * 1024 * 1024) if max_bytes is None else max_bytes
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "stores": 0, "evictions": 0, "expired": 0, "errors": 0}
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def _lookup(self, key):
+        """Fresh cached value or None; call with the lock held"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, size, value = entry
+        if time.monotonic() - stored_at >= self.ttl:
+            del self._entries[key]
+            self._bytes -= size
+            self._stats["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key):
+        """Cached value for key, or None"""
+        with self._lock:
+            entry = self._lookup(key)
+            return None if entry is None else entry[2]
+
+    def put(self, key, value):
+        size = _size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (time.monotonic(), size, value)
+            self._bytes += size
+            self._stats["stores"] += 1
+            while self._bytes > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self._stats["evictions"] += 1
+
+    def _claim(self, key):
+        """(cached entry, future, leader) for key; exactly one caller leads a miss"""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self._stats["hits"] += 1
+                return entry, None, False
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats["coalesced"] += 1
+                return None, future, False
+            future = self._inflight[key] = Future()
+            # A running future cannot be cancelled by a waiting caller giving up
+            future.set_running_or_notify_cancel()
+            self._stats["misses"] += 1
+            return None, future, True
+
+    def _settle(self, key, future, value=None, error=None, cacheable=None):
+        if error is None and (cacheable is None or cacheable(value)):
+            self.put(key, value)
+        with self._lock:
+            self._inflight.pop(key, None)
+            if error is not None:
+                self._stats["errors"] += 1
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+    def get_or_compute(self, key, compute, cacheable=None):
+        """Cached value for key, else compute() once however many callers ask at the same time
+
+        cacheable(value), if given, decides whether the result is stored
+        (e.g. not when it was degraded); waiting callers get it either way.
+        """
+        if not self.enabled:
+            return compute()
+        entry, future, leader = self._claim(key)
+        if entry is not None:
+            return entry[2]
+        if not leader:
+            return future.result()
+        try:
+            value = compute()
+        except BaseException as e:
+            self._settle(key, future, error=_shared_error(e))
+            raise
+        self._settle(key, future, value, cacheable=cacheable)
+        return value
+
+    async def get_or_compute_async(self, key, compute, cacheable=None):
+        """get_or_compute for a coroutine function; waiting callers do not block the loop"""
+        if not self.enabled:
+            return await compute()
+        entry, future, leader = self._claim(key)
+        if entry is not None:
+            return entry[2]
+        if not leader:
+            return await asyncio.shield(asyncio.wrap_future(future))
+        try:
+            value = await compute()
+        except BaseException as e:
+            self._settle(key, future, error=_shared_error(e))
+            raise
+        self._settle(key, future, value, cacheable=cacheable)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"] + self._stats["coalesced"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "inflight": len(self._inflight),
+                "hit_ratio": round((self._stats["hits"] + self._stats["coalesced"]) / lookups, 4) if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Return the process-wide result cache, creating it on first use"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
@@ -1,12 +1,61 @@
-import pandas as pd
-from bs4 import BeautifulSoup
-import requests
-
-def scrape_table():
-    url = "https://en.wikipedia.org/wiki/List_of_highest-grossing_films"
-    soup = BeautifulSoup(requests.get(url).text, "html.parser")
-    table = soup.find("table", {"class": "wikitable"})
-    df = pd.read_html(str(table))[0]
-    df["Worldwide gross"] = df["Worldwide gross"].replace('[\$,]', '', regex=True).astype(float)
-    df["Year"] = pd.to_numeric(df["Year"], errors='coerce')
-    return df
+import os
+
+from utils.columns import CURRENCY, ORDINAL, YEAR, parse_columns, parse_currency, parse_year
+from utils.snapshots import cached_table
+from utils.table_extract import extract_table
+from utils.tracing import record_error
+
+# Overridable so a local copy of the page can stand in for Wikipedia (e.g. under load tests)
+URL = os.environ.get("MOVIES_URL", "https://en.wikipedia.org/wiki/List_of_highest-grossing_films")
+
+
+def clean_movies_data(df):
+    """Films table with Rank, Peak, Worldwide_Gross, Year and Title parsed"""
+    try:
+        # Infer every column's kind once and parse each in a single
+        # vectorized pass ("$2.9 billion" and "$2,900,000,000" agree)
+        kinds = {col: ORDINAL for col in ('Rank', 'Peak') if col in df.columns}
+        df, kinds = parse_columns(df, kinds)
+
+        # Clean worldwide gross column
+        gross_cols = [col for col in df.columns if 'gross' in col.lower() or 'worldwide' in col.lower()]
+        if gross_cols:
+            gross_col = gross_cols[0]
+            df['Worldwide_Gross'] = df[gross_col] if kinds[gross_col] == CURRENCY else parse_currency(df[gross_col])
+
+        # Clean year column
+        year_cols = [col for col in df.columns if 'year' in col.lower() or 'released' in col.lower()]
+        if year_cols:
+            year_col = year_cols[0]
+            df['Year'] = df[year_col] if kinds[year_col] == YEAR else parse_year(df[year_col])
+
+        # Clean title column
+        title_cols = [col for col in df.columns if 'title' in col.lower() or 'film' in col.lower()]
+        if title_cols:
+            df['Title'] = df[title_cols[0]]
+
+        return df
+    except Exception as e:
+        print(f"Error cleaning data: {e}")
+        record_error("clean", e)
+        return df
+
+
+def parse_movies_page(response):
+    """Parse and clean the films table from a fetched page"""
+    try:
+        # Pick the Rank/Peak table straight out of the page text; the rest
+        # of the document is never parsed
+        df = extract_table(response.text, required_headers=('Rank', 'Peak'))
+        if df is None or df.empty:
+            return None
+        return clean_movies_data(df)
+    except Exception as e:
+        print(f"Error scraping Wikipedia: {e}")
+        record_error("parse", e)
+        return None
+
+
+def scrape_table(offline=None, url=None):
+    """Cleaned films table, reusing its snapshot unless the page content changed"""
+    return cached_table(url or URL, parse_movies_page, kind="movies", offline=offline)
@@ -0,0 +1,21 @@
+import json
+
+
+def json_default(obj):
+    """Turn NumPy scalars and arrays into JSON types at serialisation time only"""
+    # Only ever reached for non-JSON types, which here come from NumPy
+    import numpy as np
+
+    if isinstance(obj, np.ma.MaskedArray):
+        mask = np.ma.getmaskarray(obj).tolist()
+        return [None if masked else value for value, masked in zip(obj.data.tolist(), mask)]
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    """Compact JSON encoding that accepts query results straight from DuckDB"""
+    return json.dumps(obj, default=json_default, separators=(",", ":"))
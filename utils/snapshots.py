@@ -0,0 +1,148 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+import pyarrow as pa
+
+from utils.http_cache import fetch
+
+# Bump when the cleaning code changes so old snapshots are not reused
+SNAPSHOT_VERSION = 3
+
+
+class SnapshotStore:
+    """Versioned Arrow IPC snapshots of cleaned tables, keyed by URL and page hash"""
+
+    def __init__(self, root=None, keep=3):
+        self.root = root or os.environ.get(
+            "SNAPSHOT_DIR",
+            os.path.join(tempfile.gettempdir(), "data-analyst-agent", "snapshots"),
+        )
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._memo = {}
+        self._stats = {"hits": 0, "misses": 0, "builds": 0}
+
+    def _dir(self, url, kind):
+        key = hashlib.sha256(f"{kind}:{url}".encode("utf-8")).hexdigest()[:24]
+        return os.path.join(self.root, key)
+
+    def _path(self, url, kind, content_hash):
+        return os.path.join(self._dir(url, kind), f"v{SNAPSHOT_VERSION}-{content_hash}.arrow")
+
+    def load(self, url, content_hash, kind="table", columns=None):
+        """DataFrame for this exact page version (only columns, if given), or None
+
+        The Arrow file is memory-mapped, so reading it copies nothing and
+        columns that are never asked for are never paged in; converting to
+        pandas copies just the selected columns. The table stays mapped and
+        each projection's frame is memoized until the page changes.
+        """
+        memo_key = (kind, url)
+        frame_key = tuple(columns) if columns is not None else None
+        with self._lock:
+            cached = self._memo.get(memo_key)
+        if cached is None or cached[0] != content_hash:
+            path = self._path(url, kind, content_hash)
+            try:
+                with pa.memory_map(path, "r") as source:
+                    # The table's buffers keep the mapping alive once the file is closed
+                    table = pa.ipc.open_file(source).read_all()
+            except (OSError, pa.ArrowInvalid):
+                with self._lock:
+                    self._stats["misses"] += 1
+                return None
+            cached = (content_hash, table, {})
+            with self._lock:
+                self._memo[memo_key] = cached
+        _, table, frames = cached
+        with self._lock:
+            self._stats["hits"] += 1
+            df = frames.get(frame_key)
+        if df is None:
+            try:
+                df = (table if frame_key is None else table.select(list(frame_key))).to_pandas()
+            except KeyError:
+                return None
+            with self._lock:
+                frames[frame_key] = df
+        return df
+
+    def save(self, url, content_hash, df, kind="table"):
+        """Write a new snapshot and drop all but the newest few versions"""
+        directory = self._dir(url, kind)
+        os.makedirs(directory, exist_ok=True)
+        path = self._path(url, kind, content_hash)
+        # A name of its own, so concurrent writers never share a temp file
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            with pa.OSFile(tmp, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp, path)
+        except (OSError, pa.ArrowException) as e:
+            print(f"Error saving snapshot for {url}: {e}")
+            _remove(tmp)
+            return None
+        finally:
+            os.close(fd)
+        with self._lock:
+            self._memo[(kind, url)] = (content_hash, table, {None: df})
+            self._stats["builds"] += 1
+        self._prune(directory)
+        return path
+
+    def _prune(self, directory):
+        versions = sorted(
+            (os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".arrow")),
+            key=os.path.getmtime,
+            reverse=True,
+        )
+        for old in versions[self.keep:]:
+            _remove(old)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_snapshots():
+    """Return the process-wide snapshot store, creating it on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SnapshotStore()
+    return _store
+
+
+def cached_table(url, build, kind="table", offline=None, columns=None):
+    """Cleaned table for url, rebuilt by build(response) only when the page changed
+
+    columns, if given, limits the frame to those columns; a snapshot is
+    always saved whole.
+    """
+    response = fetch(url, offline=offline)
+    store = get_snapshots()
+    df = store.load(url, response.content_hash, kind, columns)
+    if df is not None:
+        return df
+    df = build(response)
+    if df is not None:
+        store.save(url, response.content_hash, df, kind)
+        if columns is not None and all(column in df.columns for column in columns):
+            return df[list(columns)]
+    return df
@@ -0,0 +1,66 @@
+"""Counts, filters, correlations and regressions evaluated inside DuckDB.
+
+Every function takes a leased connection and a relation: a table or view
+name, a parenthesised subquery (e.g. ``utils.court.court_relation``) or a
+pandas DataFrame registered with ``register_frame``. Nothing is pulled into
+Python except the scalar result.
+"""
+from utils.tracing import span
+
+
+def quote_ident(name):
+    """Quote a column name such as "Worldwide gross" for SQL"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def register_frame(conn, name, df):
+    """Expose a DataFrame to DuckDB as a view without copying it"""
+    with span("register", rows=len(df)):
+        conn.register(name, df)
+    return name
+
+
+def _where(where):
+    return f" WHERE {where}" if where else ""
+
+
+def _fetchone(conn, sql, params):
+    with span("duckdb"):
+        return conn.execute(sql, params or []).fetchone()
+
+
+def count_where(conn, relation, where=None, params=None):
+    """Number of rows matching a filter"""
+    row = _fetchone(conn, f"SELECT COUNT(*) FROM {relation}{_where(where)}", params)
+    return int(row[0])
+
+
+def first_where(conn, relation, value, order_by, where=None, params=None):
+    """Value from the row with the smallest order_by among the filtered rows"""
+    row = _fetchone(
+        conn,
+        f"SELECT arg_min({quote_ident(value)}, {quote_ident(order_by)}) FROM {relation}{_where(where)}",
+        params,
+    )
+    return row[0] if row else None
+
+
+def correlation(conn, relation, x, y, where=None, params=None):
+    """Pearson correlation of two columns, ignoring rows where either is NULL"""
+    row = _fetchone(
+        conn,
+        f"SELECT corr({quote_ident(y)}, {quote_ident(x)}) FROM {relation}{_where(where)}",
+        params,
+    )
+    return row[0] if row else None
+
+
+def regression(conn, relation, x, y, where=None, params=None):
+    """Least-squares (slope, intercept) of y on x"""
+    row = _fetchone(
+        conn,
+        f"SELECT regr_slope({quote_ident(y)}, {quote_ident(x)}), "
+        f"regr_intercept({quote_ident(y)}, {quote_ident(x)}) FROM {relation}{_where(where)}",
+        params,
+    )
+    return (row[0], row[1]) if row else (None, None)
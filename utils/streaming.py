@@ -0,0 +1,111 @@
+"""Opt-in streaming of answers as NDJSON or server-sent events.
+
+A client asks for a stream with ``?stream=ndjson`` / ``?stream=sse`` or an
+``Accept: application/x-ndjson`` / ``text/event-stream`` header. Each answer
+is then sent the moment it is ready, tagged with its list index or question
+key, and the stream ends with the assembled document the non-streaming
+endpoint would have returned. Answers that came from a deadline fallback
+carry a ``degraded`` reason, and the final event lists them all.
+"""
+from utils.serialize import dumps
+
+NDJSON = "ndjson"
+SSE = "sse"
+CONTENT_TYPES = {
+    NDJSON: "application/x-ndjson",
+    SSE: "text/event-stream",
+}
+# Keep proxies (nginx in particular) from buffering the stream
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def stream_mode(requested=None, accept=None):
+    """NDJSON, SSE or None (no streaming) from a query parameter or Accept header"""
+    if requested:
+        requested = requested.lower()
+        if requested in ("1", "true", NDJSON):
+            return NDJSON
+        if requested == SSE:
+            return SSE
+        return None
+    accept = (accept or "").lower()
+    if CONTENT_TYPES[SSE] in accept:
+        return SSE
+    if CONTENT_TYPES[NDJSON] in accept:
+        return NDJSON
+    return None
+
+
+def assemble(answers):
+    """The full response from {index or question: answer}, as the blocking endpoint returns it"""
+    if answers and all(isinstance(key, int) for key in answers):
+        return [answers[i] for i in sorted(answers)]
+    return dict(answers)
+
+
+def format_event(mode, kind, payload):
+    data = dumps(payload)
+    if mode == SSE:
+        return f"event: {kind}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+def _degraded(deadline, position):
+    """Fallback reason for the answer at position (its order in the response), if any"""
+    if deadline is None:
+        return None
+    return deadline.degraded.get(position) or deadline.degraded.get("*")
+
+
+def _answer_event(mode, key, answer, reason=None):
+    tag = {"index": key} if isinstance(key, int) else {"question": key}
+    payload = {**tag, "answer": answer}
+    if reason:
+        payload["degraded"] = reason
+    return format_event(mode, "answer", payload)
+
+
+def _result_event(mode, answers, deadline):
+    payload = {"result": assemble(answers)}
+    if deadline is not None and deadline.degraded:
+        payload["degraded"] = {str(k): v for k, v in deadline.degraded.items()}
+    return format_event(mode, "result", payload)
+
+
+def _keyed(result):
+    """{index or question: answer} for an assembled list or dict response"""
+    return dict(result) if isinstance(result, dict) else dict(enumerate(result))
+
+
+def encode_stream(pairs, mode, fallback=None, deadline=None):
+    """Text chunks for each (key, answer) from a generator, then the assembled result
+
+    fallback, if given, is called for the default answers when the generator
+    fails before producing any.
+    """
+    answers = {}
+    try:
+        for key, answer in pairs:
+            yield _answer_event(mode, key, answer, _degraded(deadline, len(answers)))
+            answers[key] = answer
+    except Exception as e:
+        print(f"Error streaming answers: {e}")
+        yield format_event(mode, "error", {"error": str(e)})
+        if not answers and fallback is not None:
+            answers = _keyed(fallback())
+    yield _result_event(mode, answers, deadline)
+
+
+async def encode_stream_async(pairs, mode, fallback=None, deadline=None):
+    """encode_stream for an async generator of (key, answer)"""
+    answers = {}
+    try:
+        async for key, answer in pairs:
+            yield _answer_event(mode, key, answer, _degraded(deadline, len(answers)))
+            answers[key] = answer
+    except Exception as e:
+        print(f"Error streaming answers: {e}")
+        yield format_event(mode, "error", {"error": str(e)})
+        if not answers and fallback is not None:
+            answers = _keyed(fallback())
+    yield _result_event(mode, answers, deadline)
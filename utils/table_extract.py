@@ -0,0 +1,239 @@
+"""Targeted HTML table extraction.
+
+Locates candidate ``<table>`` elements with a plain string scan, so the rest
+of the page is never parsed, then tokenizes only the chosen table with a
+single regular expression. rowspan/colspan are expanded the way
+``pandas.read_html`` does (spanned values are repeated) and values are
+appended straight into per-column lists.
+"""
+import re
+from html import unescape
+
+import pandas as pd
+
+from utils.tracing import span
+
+_TABLE_TAG = re.compile(r"<(/?)table\b[^>]*>", re.IGNORECASE)
+_CLASS_ATTR = re.compile(r"""\bclass\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.IGNORECASE)
+_FIRST_ROW = re.compile(r"<tr\b.*?</tr\s*>", re.IGNORECASE | re.DOTALL)
+_TAG = re.compile(r"<[^>]+>")
+_TOKEN = re.compile(
+    r"""<!--.*?-->|<(/?)([a-zA-Z][\w:-]*)((?:[^>"']|"[^"]*"|'[^']*')*)>|([^<]+)""",
+    re.DOTALL,
+)
+_ATTR = re.compile(r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+_VOID_TAGS = {"br", "img", "hr", "wbr", "meta", "link", "input", "col"}
+
+
+def _attrs(raw):
+    if not raw or "=" not in raw:
+        return {}
+    return {
+        m.group(1).lower(): next(g for g in m.groups()[1:] if g is not None)
+        for m in _ATTR.finditer(raw)
+    }
+
+
+def find_tables(html, class_name="wikitable"):
+    """(start, end) offsets of each top-level table carrying class_name"""
+    spans = []
+    depth = 0
+    start = None
+    for match in _TABLE_TAG.finditer(html):
+        if match.group(1):
+            if depth:
+                depth -= 1
+                if depth == 0 and start is not None:
+                    spans.append((start, match.end()))
+                    start = None
+            continue
+        if depth == 0:
+            classes = _CLASS_ATTR.search(match.group(0))
+            value = next((g for g in classes.groups() if g is not None), "") if classes else ""
+            if class_name is None or class_name in value.split():
+                start = match.start()
+        depth += 1
+    return spans
+
+
+def _first_row_text(fragment):
+    row = _FIRST_ROW.search(fragment)
+    if not row:
+        return []
+    cells = re.split(r"<t[hd]\b[^>]*>", row.group(0), flags=re.IGNORECASE)[1:]
+    return [" ".join(_TAG.sub(" ", cell).split()) for cell in cells]
+
+
+class _TableParser:
+    """Stream one table's tokens into header names and column lists"""
+
+    def __init__(self, skip_footnotes=True):
+        self.skip_footnotes = skip_footnotes
+        self.header_rows = []
+        self.columns = []
+        self.n_rows = 0
+        self._depth = 0
+        self._row = None
+        self._cell = None
+        self._skip = 0
+        self._spans = {}
+
+    def feed(self, fragment):
+        for match in _TOKEN.finditer(fragment):
+            closing, tag, raw, text = match.groups()
+            if text is not None:
+                if self._cell is not None and not self._skip:
+                    self._cell["text"].append(unescape(text) if "&" in text else text)
+            elif tag is None:
+                continue
+            else:
+                tag = tag.lower()
+                if closing:
+                    self.handle_endtag(tag)
+                else:
+                    self.handle_starttag(tag, raw)
+                    if raw.endswith("/") and tag not in _VOID_TAGS:
+                        self.handle_endtag(tag)
+
+    def handle_starttag(self, tag, raw):
+        if tag == "table":
+            self._depth += 1
+            return
+        if self._depth != 1:
+            # Nested tables contribute their text to the enclosing cell only
+            return
+        if self._skip:
+            if tag not in _VOID_TAGS:
+                self._skip += 1
+            return
+        if tag == "tr":
+            self._row = []
+        elif tag in ("td", "th") and self._row is not None:
+            if self._cell is not None:
+                # Unclosed cell, as HTML allows
+                self._row.append(self._cell)
+            attrs = _attrs(raw)
+            self._cell = {
+                "header": tag == "th" and attrs.get("scope") != "row",
+                "text": [],
+                "rowspan": _span(attrs.get("rowspan")),
+                "colspan": _span(attrs.get("colspan")),
+            }
+        elif self._cell is not None and tag in ("sup", "span", "div", "style") and self._hidden(tag, _attrs(raw)):
+            self._skip = 1
+        elif tag == "br" and self._cell is not None:
+            self._cell["text"].append(" ")
+
+    def _hidden(self, tag, attrs):
+        if "display:none" in (attrs.get("style") or "").replace(" ", ""):
+            return True
+        return self.skip_footnotes and tag == "sup" and "reference" in (attrs.get("class") or "").split()
+
+    def handle_endtag(self, tag):
+        if tag == "table":
+            self._depth -= 1
+            return
+        if self._depth != 1:
+            return
+        if self._skip:
+            self._skip -= 1
+            return
+        if tag in ("td", "th") and self._cell is not None:
+            self._row.append(self._cell)
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            if self._cell is not None:
+                self._row.append(self._cell)
+                self._cell = None
+            self._finish_row(self._row)
+            self._row = None
+
+    def _finish_row(self, cells):
+        values = []
+        is_header = bool(cells) and self.n_rows == 0 and all(c["header"] for c in cells)
+        col = 0
+        queue = list(cells)
+        while queue or col in self._spans:
+            if col in self._spans:
+                remaining, text = self._spans[col]
+                values.append(text)
+                if remaining <= 1:
+                    del self._spans[col]
+                else:
+                    self._spans[col] = (remaining - 1, text)
+                col += 1
+                continue
+            cell = queue.pop(0)
+            text = " ".join("".join(cell["text"]).split())
+            for _ in range(cell["colspan"]):
+                if cell["rowspan"] > 1:
+                    self._spans[col] = (cell["rowspan"] - 1, text)
+                values.append(text)
+                col += 1
+        if not values:
+            return
+        if is_header:
+            self.header_rows.append(values)
+            return
+        while len(self.columns) < len(values):
+            self.columns.append([None] * self.n_rows)
+        for j, column in enumerate(self.columns):
+            column.append(values[j] if j < len(values) else None)
+        self.n_rows += 1
+
+
+def _span(value):
+    if value is None:
+        return 1
+    try:
+        return max(1, int(str(value).strip().rstrip(";")))
+    except (TypeError, ValueError):
+        return 1
+
+
+def _header_names(header_rows, width):
+    names = []
+    for j in range(width):
+        parts = []
+        for row in header_rows:
+            part = row[j] if j < len(row) else ""
+            if part and (not parts or parts[-1] != part):
+                parts.append(part)
+        names.append(" ".join(parts) or str(j))
+    seen = {}
+    unique = []
+    for name in names:
+        if name in seen:
+            seen[name] += 1
+            unique.append(f"{name}.{seen[name]}")
+        else:
+            seen[name] = 0
+            unique.append(name)
+    return unique
+
+
+def parse_table(fragment, skip_footnotes=True):
+    """DataFrame from the HTML of a single table"""
+    parser = _TableParser(skip_footnotes=skip_footnotes)
+    parser.feed(fragment)
+    width = max([len(parser.columns)] + [len(row) for row in parser.header_rows])
+    names = _header_names(parser.header_rows, width)
+    data = {}
+    for j, name in enumerate(names):
+        data[name] = parser.columns[j] if j < len(parser.columns) else [None] * parser.n_rows
+    return pd.DataFrame(data)
+
+
+def extract_table(html, required_headers=(), class_name="wikitable", skip_footnotes=True):
+    """First table whose header row contains required_headers, or None"""
+    with span("parse", bytes=len(html)) as attrs:
+        for start, end in find_tables(html, class_name):
+            fragment = html[start:end]
+            if required_headers:
+                header = _first_row_text(fragment)
+                if not all(name in header for name in required_headers):
+                    continue
+            df = parse_table(fragment, skip_footnotes=skip_footnotes)
+            attrs["rows"] = len(df)
+            return df
+        return None
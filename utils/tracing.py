@@ -0,0 +1,489 @@
+"""Stage timings for each request: spans, Server-Timing, Prometheus metrics.
+
+Stages run inside ``span("fetch")``-style blocks that record how long they
+took, whether they raised, and the bytes and rows they handled. A request's
+spans are gathered on its ``Trace`` (carried in a context variable, so
+stages on executor and deadline threads land on the right request) and
+sent back in a ``Server-Timing`` header, one entry per stage name. Every
+span and request also feeds the process-wide metrics served as Prometheus
+text on ``/metrics``: latency histograms per stage and per request kind,
+error, byte, row and fallback counters, and the caches' own counters.
+In a preforked server each worker reports its own metrics.
+
+With ``PROFILE_SLOW_MS`` set, a sampling profiler records the stacks of
+every thread while requests run, and writes a folded-stack file (the input
+of flamegraph.pl or speedscope) for each request that took longer.
+"""
+import contextvars
+import functools
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Seconds; from a fast cache hit to a request that uses its whole deadline
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 180)
+
+_trace = contextvars.ContextVar("trace", default=None)
+_TOKEN = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _labels(names, values):
+    return tuple(str(values.get(name, "")) for name in names)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, key, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, key)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+
+class CounterMetric(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _labels(self.labels, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def lines(self):
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in sorted(self._values.items())]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = _labels(self.labels, labels)
+        with self._lock:
+            # Cumulative bucket counts, then the sum and count of observations
+            state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def lines(self):
+        lines = []
+        with self._lock:
+            values = sorted((key, list(state)) for key, state in self._values.items())
+        for key, state in values:
+            count = state[-1]
+            for bound, n in zip(self.buckets + ("+Inf",), state[:-2] + [count]):
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [le])} {n}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {state[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    """Metrics of this process plus collectors that read other modules' stats at scrape time"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help_text, labels=()):
+        metric = CounterMetric(name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labels=(), buckets=BUCKETS):
+        metric = Histogram(name, help_text, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """Register fn() -> [(name, kind, help, {labels}, value)]; it runs on every scrape"""
+        self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        """Prometheus text exposition of every metric"""
+        out = []
+        for metric in self.metrics:
+            out.append(f"# HELP {metric.name} {metric.help}")
+            out.append(f"# TYPE {metric.name} {metric.kind}")
+            out.extend(metric.lines())
+        # A family's samples must be contiguous, whichever order the collectors return them in
+        families = {}
+        for collect in self.collectors:
+            try:
+                samples = collect()
+            except Exception as e:
+                print(f"Error collecting metrics from {getattr(collect, '__name__', collect)}: {e}")
+                continue
+            for name, kind, help_text, labels, value in samples:
+                if value is None:
+                    continue
+                family = families.setdefault(name, [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"])
+                names = tuple(labels)
+                family.append(f"{name}{_format_labels(names, tuple(str(labels[n]) for n in names))} {float(value)}")
+        for family in families.values():
+            out.extend(family)
+        return "\n".join(out) + "\n"
+
+
+def stats_samples(prefix, stats, label=None):
+    """Gauges for the numbers in a stats() dict; nested dicts become one series per key, labelled label"""
+    samples = []
+    for key, value in stats.items():
+        if isinstance(value, dict) and label:
+            for name, number in value.items():
+                if isinstance(number, (int, float)) and not isinstance(number, bool):
+                    samples.append((f"{prefix}_{name}", "gauge", f"{prefix} {name}", {label: key}, number))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            samples.append((f"{prefix}_{key}", "gauge", f"{prefix} {key}", {}, value))
+    return samples
+
+
+# (metric prefix, module, getter, label for per-key stats); read only once the module is in use,
+# so a scrape never imports the analysis stack
+STATS_SOURCES = (
+    ("agent_result_cache", "utils.result_cache", "get_result_cache", None),
+    ("agent_plan_cache", "utils.planner", "get_plan_cache", None),
+    ("agent_http_cache", "utils.http_cache", "get_http_cache", None),
+    ("agent_snapshots", "utils.snapshots", "get_snapshots", None),
+    ("agent_db_pool", "utils.db_pool", "get_pool", None),
+    ("agent_admission", "utils.admission", "get_admission", "kind"),
+    ("agent_deadline_stages", "utils.deadline", "get_stage_runner", None),
+)
+
+
+def _module_stats():
+    samples = []
+    for prefix, module_name, getter, label in STATS_SOURCES:
+        module = sys.modules.get(module_name)
+        if module is None:
+            continue
+        samples.extend(stats_samples(prefix, getattr(module, getter)().stats(), label))
+    return samples
+
+
+REGISTRY = Registry()
+REGISTRY.collector(_module_stats)
+REQUESTS = REGISTRY.counter("agent_requests_total", "Requests answered", ("server", "kind", "status"))
+REQUEST_SECONDS = REGISTRY.histogram("agent_request_duration_seconds", "Request latency", ("server", "kind"))
+STAGE_SECONDS = REGISTRY.histogram("agent_stage_duration_seconds", "Latency of each pipeline stage", ("stage",))
+STAGE_ERRORS = REGISTRY.counter("agent_stage_errors_total", "Stages that raised or swallowed an error", ("stage",))
+STAGE_BYTES = REGISTRY.counter("agent_stage_bytes_total", "Bytes handled by each stage", ("stage",))
+STAGE_ROWS = REGISTRY.counter("agent_stage_rows_total", "Rows handled by each stage", ("stage",))
+FALLBACKS = REGISTRY.counter("agent_fallbacks_total", "Answers replaced by a deadline fallback", ("reason",))
+
+
+def render_metrics():
+    return REGISTRY.render()
+
+
+class Trace:
+    """The spans of one request"""
+
+    def __init__(self, server, labels=None):
+        self.server = server
+        self.labels = {"kind": "unknown", **(labels or {})}
+        self.spans = []
+        self.started = time.perf_counter()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, attrs=None, error=None):
+        with self._lock:
+            self.spans.append((name, seconds, dict(attrs or {}), error))
+
+    def stages(self):
+        """{stage: (total seconds, count, bytes, rows, errors)} in first-seen order"""
+        totals = {}
+        with self._lock:
+            spans = list(self.spans)
+        for name, seconds, attrs, error in spans:
+            total, count, nbytes, rows, errors = totals.get(name, (0.0, 0, 0, 0, 0))
+            totals[name] = (total + seconds, count + 1, nbytes + attrs.get("bytes", 0),
+                            rows + attrs.get("rows", 0), errors + (error is not None))
+        return totals
+
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def server_timing(self):
+        """Server-Timing header value: one entry per stage, then the total so far"""
+        entries = []
+        for name, (seconds, count, nbytes, rows, errors) in self.stages().items():
+            desc = [f"x{count}"] if count > 1 else []
+            if nbytes:
+                desc.append(f"{nbytes}B")
+            if rows:
+                desc.append(f"{rows} rows")
+            if errors:
+                desc.append(f"{errors} errors")
+            entry = f"{_TOKEN.sub('_', name)};dur={seconds * 1000:.1f}"
+            entries.append(entry + (f';desc="{" ".join(desc)}"' if desc else ""))
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def finish(self, status):
+        if self.finished is not None:
+            return
+        self.finished = time.perf_counter()
+        kind = self.labels.get("kind", "unknown")
+        REQUESTS.inc(server=self.server, kind=kind, status=status)
+        REQUEST_SECONDS.observe(self.elapsed(), server=self.server, kind=kind)
+
+
+def current_trace():
+    return _trace.get()
+
+
+def annotate(**labels):
+    """Label the current request (e.g. kind=court) for its metrics"""
+    trace = _trace.get()
+    if trace is not None:
+        trace.labels.update(labels)
+
+
+def record_error(stage, error=None):
+    """Count an error a stage handled itself (and so never raised through its span)"""
+    STAGE_ERRORS.inc(stage=stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(f"{stage}_error", 0.0, error=repr(error))
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a stage; update the yielded dict with bytes/rows it handled"""
+    started = time.perf_counter()
+    error = None
+    try:
+        yield attrs
+    except BaseException as e:
+        error = repr(e)
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_SECONDS.observe(seconds, stage=name)
+        if error is not None:
+            STAGE_ERRORS.inc(stage=name)
+        if attrs.get("bytes"):
+            STAGE_BYTES.inc(attrs["bytes"], stage=name)
+        if attrs.get("rows"):
+            STAGE_ROWS.inc(attrs["rows"], stage=name)
+        trace = _trace.get()
+        if trace is not None:
+            trace.add(name, seconds, attrs, error)
+
+
+def traced(name):
+    """Decorator form of span for a whole function"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def trace_request(server, **labels):
+    """Trace for one request, current for everything it runs; profiled when slow if enabled"""
+    trace = Trace(server, labels)
+    token = _trace.set(trace)
+    profile = get_profiler().begin()
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+        get_profiler().end(profile, trace)
+
+
+class TracingMiddleware:
+    """ASGI middleware: a trace per request, Server-Timing on the response, metrics at the end"""
+
+    def __init__(self, app, server="fastapi", paths=("/api/",)):
+        self.app = app
+        self.server = server
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+        status = 500
+        with trace_request(self.server) as trace:
+
+            async def timed_send(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    # A streamed response's header only covers the stages before its first byte
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, timed_send)
+            finally:
+                trace.finish(status)
+
+
+class WSGITracingMiddleware:
+    """WSGI counterpart of TracingMiddleware"""
+
+    def __init__(self, app, server="flask", paths=("/api/",)):
+        self.app = app
+        self.server = server
+        self.paths = paths
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO") not in self.paths:
+            return self.app(environ, start_response)
+        return self._traced(environ, start_response)
+
+    def _traced(self, environ, start_response):
+        status = [500]
+        with trace_request(self.server) as trace:
+
+            def timed_start_response(status_line, headers, exc_info=None):
+                status[0] = int(status_line.split()[0])
+                headers = list(headers) + [("Server-Timing", trace.server_timing())]
+                return start_response(status_line, headers, exc_info)
+
+            body = None
+            try:
+                body = self.app(environ, timed_start_response)
+                # Iterated inside the trace, so a streamed body's stages are counted too
+                for chunk in body:
+                    yield chunk
+            finally:
+                if hasattr(body, "close"):
+                    body.close()
+                trace.finish(status[0])
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class SamplingProfiler:
+    """Samples every thread's stack while any request is in flight; keeps the slow requests' samples"""
+
+    def __init__(self, threshold_ms=None, interval_ms=None, directory=None):
+        self.threshold = (_env_float("PROFILE_SLOW_MS", 0) if threshold_ms is None else threshold_ms) / 1000
+        self.interval = (_env_float("PROFILE_INTERVAL_MS", 5) if interval_ms is None else interval_ms) / 1000
+        self.directory = directory or os.environ.get(
+            "PROFILE_DIR", os.path.join(tempfile.gettempdir(), "data-analyst-agent", "profiles"))
+        # Folded stack -> count, one Counter per request in flight, keyed by id
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.written = 0
+
+    @property
+    def enabled(self):
+        return self.threshold > 0
+
+    def begin(self):
+        """Samples for a request starting now, or None when profiling is off"""
+        if not self.enabled:
+            return None
+        samples = Counter()
+        with self._lock:
+            self._active[id(samples)] = samples
+            # The sampler thread runs only while a request is in flight
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        return samples
+
+    def end(self, samples, trace):
+        if samples is None:
+            return
+        with self._lock:
+            self._active.pop(id(samples), None)
+        seconds = trace.elapsed()
+        if seconds >= self.threshold and samples:
+            self._write(samples, trace, seconds)
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                targets = list(self._active.values())
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                folded = ";".join(reversed(stack))
+                for samples in targets:
+                    samples[folded] += 1
+            time.sleep(self.interval)
+
+    def _write(self, samples, trace, seconds):
+        os.makedirs(self.directory, exist_ok=True)
+        kind = _TOKEN.sub("_", str(trace.labels.get("kind", "unknown")))
+        path = os.path.join(self.directory, f"{int(time.time() * 1000)}-{trace.server}-{kind}-{seconds * 1000:.0f}ms.folded")
+        try:
+            with open(path, "w") as f:
+                for stack, count in samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            self.written += 1
+            print(f"Slow request ({seconds:.1f}s), profile written to {path}")
+        except OSError as e:
+            print(f"Error writing profile: {e}")
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    """Return the process-wide sampling profiler, creating it on first use"""
+    global _profiler
+    if _profiler is None:
+        with _profiler_lock:
+            if _profiler is None:
+                _profiler = SamplingProfiler()
+    return _profiler
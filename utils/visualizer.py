@@ -1,20 +1,21 @@
-import matplotlib.pyplot as plt
-import base64
-from io import BytesIO
-import numpy as np
+from utils.render import get_renderer
 
-def make_plot(df):
-    fig, ax = plt.subplots()
-    ax.scatter(df["Rank"], df["Worldwide gross"])
-    z = np.polyfit(df["Rank"], df["Worldwide gross"], 1)
-    p = np.poly1d(z)
-    ax.plot(df["Rank"], p(df["Rank"]), "r--")
-    ax.set_xlabel("Rank")
-    ax.set_ylabel("Worldwide Gross")
-    ax.set_title("Rank vs Gross")
 
-    buf = BytesIO()
-    plt.savefig(buf, format='png', dpi=150)
-    buf.seek(0)
-    encoded = base64.b64encode(buf.read()).decode('utf-8')
-    return f"data:image/png;base64,{encoded}"
+def plot_spec(df):
+    """Render spec for the Rank vs Worldwide gross scatterplot"""
+    valid = df[["Rank", "Worldwide gross"]].dropna()
+    return {
+        "kind": "scatter_fit",
+        "x": valid["Rank"].to_numpy(dtype=float),
+        "y": valid["Worldwide gross"].to_numpy(dtype=float),
+        "ylabel": "Worldwide Gross",
+        "title": "Rank vs Gross",
+        "figsize": (6.4, 4.8),
+        "dpi": 150,
+        "formats": ("png",),
+    }
+
+
+def make_plot(df):
+    """Rank vs Worldwide gross scatterplot as a data URI, drawn in the render pool"""
+    return get_renderer().render(plot_spec(df))
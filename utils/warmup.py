@@ -0,0 +1,181 @@
+"""Background warm-up of what the first request would otherwise pay for.
+
+The server imports only what it needs to accept requests; the analysis
+stack (pandas, matplotlib, DuckDB, pyarrow) is imported by the first
+handler that needs it. On a host that spins the service down when idle,
+that first request would also build the matplotlib font cache, start the
+render workers, install DuckDB extensions and read the cached datasets.
+With ``WARMUP=1`` (the default) a background thread does all of that as
+soon as the server starts, while ``/health`` already answers and reports
+how far it has got.
+
+Steps that leave no threads, processes or connections behind are marked
+fork-safe: a preforking master (``utils.prefork``) runs those itself so its
+workers inherit the result, and each worker runs only the rest.
+"""
+import os
+import threading
+import time
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def _imports():
+    # pandas, numpy, matplotlib, duckdb and pyarrow, through the pipeline
+    import utils.agent  # noqa: F401
+    import utils.ingest  # noqa: F401
+
+
+def _fonts():
+    from matplotlib import font_manager
+
+    # Builds (or loads) the font cache and resolves the font every plot uses
+    font_manager.findfont(font_manager.FontProperties())
+
+
+def _figures():
+    """Draw one plot in this process: glyph caches, the Agg canvas and the encoder"""
+    import numpy as np
+
+    from utils.render import render_plot
+
+    render_plot({"kind": "scatter_fit", "x": np.arange(1, 4), "y": np.arange(1, 4)})
+
+
+def _plots():
+    """Start every render worker, each building its figure templates, and draw once"""
+    import numpy as np
+
+    from utils.render import get_renderer
+
+    renderer = get_renderer()
+    spec = {"kind": "scatter_fit", "x": np.arange(1, 4), "y": np.arange(1, 4)}
+    for future in [renderer.submit(spec) for _ in range(renderer.workers)]:
+        future.result()
+
+
+def _duckdb():
+    from utils.db_pool import get_pool
+
+    # Opens the pooled connections, installing and loading their extensions
+    get_pool().warm()
+
+
+def _movies():
+    from utils.scraper import scrape_table
+
+    # The cached page and its cleaned snapshot, without going to the network
+    scrape_table(offline=True)
+
+
+def _court_store():
+    from utils.court_store import get_store
+
+    # The stored partition rows, held in memory as Arrow
+    store = get_store()
+    if store is not None:
+        store.rows()
+
+
+def _court():
+    from utils.court_store import load_court_summary
+    from utils.db_pool import get_pool
+
+    with get_pool().lease() as conn:
+        load_court_summary(conn, refresh=False)
+
+
+# (name, step, fork-safe)
+STEPS = (
+    ("imports", _imports, True),
+    ("fonts", _fonts, True),
+    ("figures", _figures, True),
+    ("movies", _movies, True),
+    ("court_store", _court_store, True),
+    ("plots", _plots, False),
+    ("duckdb", _duckdb, False),
+    ("court", _court, False),
+)
+
+
+def enabled():
+    return os.environ.get("WARMUP", "1") != "0"
+
+
+class Warmup:
+    """Runs the warm-up steps once, in order, on a daemon thread"""
+
+    def __init__(self, steps=STEPS):
+        self.steps = steps
+        self.status = {name: {"state": PENDING} for name, _, _ in steps}
+        self.started = None
+        self._thread = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self.started = time.monotonic()
+                self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+                self._thread.start()
+        return self
+
+    def run(self, fork_safe_only=False):
+        for name, step, fork_safe in self.steps:
+            if self.status[name]["state"] != PENDING or (fork_safe_only and not fork_safe):
+                continue
+            self.status[name] = {"state": RUNNING}
+            started = time.perf_counter()
+            try:
+                step()
+                state = DONE
+            except Exception as e:
+                # A step that cannot run here (no snapshot yet, no store) is left to the request
+                print(f"Error warming up {name}: {e}")
+                state = FAILED
+            self.status[name] = {"state": state, "seconds": round(time.perf_counter() - started, 3)}
+        if not fork_safe_only:
+            self._done.set()
+
+    def wait(self, timeout=None):
+        """True once every step has run"""
+        return self._done.wait(timeout)
+
+    def stats(self):
+        return {
+            "enabled": enabled(),
+            "started": self.started is not None,
+            "done": self._done.is_set(),
+            "steps": {name: dict(status) for name, status in self.status.items()},
+        }
+
+
+_warmup = None
+_warmup_lock = threading.Lock()
+
+
+def get_warmup():
+    """Return the process-wide warm-up, creating it on first use"""
+    global _warmup
+    if _warmup is None:
+        with _warmup_lock:
+            if _warmup is None:
+                _warmup = Warmup()
+    return _warmup
+
+
+def preload():
+    """Run the fork-safe steps here and now, before forking workers"""
+    get_warmup().run(fork_safe_only=True)
+    return get_warmup()
+
+
+def start_warmup():
+    """Start the background warm-up unless WARMUP=0"""
+    if enabled():
+        get_warmup().start()
+    return get_warmup()